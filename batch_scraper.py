@@ -0,0 +1,182 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from checkpoints import LISTING_PAGE_SIZE, stop_at_known_content
+from listings import checkpoint_patience, listing_key, open_listing
+from pipeline import add_sentiment, batched, build_records, skip_known_posts
+from writers import open_writer
+
+# The default amount of subreddits that are scraped at the same time
+DEFAULT_MAX_WORKERS = 4
+
+# The seconds a job waits for room in the results queue before it checks whether the scrape was stopped
+PUT_TIMEOUT_SECONDS = 0.5
+
+
+def _put_result(results, item, stop):
+    """
+    Hands an item to the writer, unless the scrape was stopped while the job waited for room in the queue.
+
+    Returns:
+        bool: Whether the item was queued.
+    """
+    while not stop.is_set():
+        try:
+            results.put(item, timeout=PUT_TIMEOUT_SECONDS)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _until_stopped(items, stop):
+    # Ends a listing early, so a stopped job doesn't keep requesting pages nobody writes
+    for item in items:
+        if stop.is_set():
+            return
+        yield item
+
+
+def _scrape_job(make_client, scheduler, subreddit, search_limit, sentiment_engine, post_id_index, checkpoint, batch_size, results, listing_options, stop, metrics=None):
+    """
+    Scrapes a single subreddit on a worker thread and hands the batches to the writer through the results queue.
+
+    Every job gets its own PRAW client, because a client isn't safe to share between threads. The clients
+    all use the same scheduler, so together they stay inside the one rate limit budget. Once the stop event
+    is set, because the writer failed or the scrape was interrupted, the job gives up instead of waiting for
+    room in the queue forever.
+    """
+    from scheduler import SchedulingRequestor
+
+    try:
+        reddit = make_client(requestor_class=SchedulingRequestor, requestor_kwargs={"scheduler": scheduler, "job_id": subreddit, "metrics": metrics})
+
+        listing_params = {}
+        if checkpoint is not None and checkpoint["run_cursor"]:
+            # Continue the interrupted run after the last post it wrote
+            listing_params["after"] = checkpoint["run_cursor"]
+            search_limit = max(search_limit - checkpoint["run_count"], 0)
+
+        submissions = _until_stopped(open_listing(reddit.subreddit(subreddit), limit=search_limit, params=listing_params, **listing_options), stop)
+        if metrics is not None:
+            submissions = metrics.timed_iter(submissions, 'listing')
+        listing = listing_options.get('listing', 'hot')
+        submissions = stop_at_known_content(submissions, checkpoint, listing=listing, patience=checkpoint_patience(listing, LISTING_PAGE_SIZE), post_id_index=post_id_index)
+        if post_id_index is not None:
+            submissions = skip_known_posts(submissions, post_id_index)
+
+        records = build_records(submissions, metrics=metrics)
+        if sentiment_engine is not None:
+            records = add_sentiment(records, sentiment_engine, batch_size, metrics=metrics)
+
+        for batch in batched(records, batch_size):
+            if not _put_result(results, ("batch", subreddit, batch), stop):
+                return
+
+        _put_result(results, ("done", subreddit, None), stop)
+    except Exception as e:
+        _put_result(results, ("failed", subreddit, e), stop)
+    finally:
+        scheduler.forget_job(subreddit)
+
+
+def _write_results(results, writer, summary, unfinished_jobs, post_id_index, checkpoint_store, checkpoint_name, on_batch_written, metrics):
+    """
+    Writes the batches of the jobs as they arrive, until every job is done or failed.
+
+    The written row counts and the exceptions of failed jobs are stored in summary.
+    """
+    while unfinished_jobs > 0:
+        kind, subreddit, payload = results.get()
+
+        if kind == "batch":
+            start = time.perf_counter()
+            written = writer.write_batch(payload)
+            summary[subreddit] += written
+            if metrics is not None:
+                metrics.add_time('write', time.perf_counter() - start)
+                metrics.count('posts', written)
+
+            if post_id_index is not None:
+                post_id_index.record_written([record.post_id for record in payload])
+            if checkpoint_store is not None:
+                checkpoint_store.advance(subreddit, checkpoint_name, payload)
+            if on_batch_written is not None:
+                on_batch_written(subreddit, payload)
+        elif kind == "done":
+            unfinished_jobs -= 1
+            if checkpoint_store is not None:
+                # Only a job that got to the end moves the checkpoint forward
+                checkpoint_store.finish_run(subreddit, checkpoint_name)
+        else:
+            unfinished_jobs -= 1
+            summary[subreddit] = payload
+
+
+def scrape_subreddits_concurrently(make_client, subreddits, search_limit, output_filename, sentiment_engine, post_id_index=None, checkpoint_store=None,
+                                   max_workers=DEFAULT_MAX_WORKERS, batch_size=None, scheduler=None, on_batch_written=None, listing_options=None,
+                                   metrics=None, indexes=False):
+    """
+    Scrapes a listing of several subreddits at the same time and writes every post to one output.
+
+    The subreddits are scraped on a thread pool, while the calling thread is the only one that writes. It
+    writes each batch and then updates the post ID index and the checkpoints. The results queue is bounded,
+    so fast jobs wait for the writer instead of piling up rows in memory. When writing fails or the scrape is
+    interrupted, the jobs are stopped and the queued jobs cancelled before the error is raised.
+
+    Args:
+        make_client (callable): Creates a new praw.Reddit instance, keyword arguments are passed on to praw.Reddit.
+        subreddits (list): The names of the subreddits to scrape.
+        search_limit (int): The maximum number of posts to scrape per subreddit.
+        output_filename (str): The CSV file or SQLite database the rows are written to.
+        sentiment_engine (SentimentEngine): The engine that scores the posts, None leaves the sentiment empty.
+        post_id_index (PostIdIndex, optional): The index of the posts already in the output, these get skipped. Defaults to None.
+        checkpoint_store (CheckpointStore, optional): The checkpoints of the output. Defaults to None.
+        max_workers (int, optional): The amount of subreddits scraped at the same time. Defaults to DEFAULT_MAX_WORKERS.
+        batch_size (int, optional): The amount of rows written at once. Defaults to the writer's preferred batch size.
+        scheduler (RateLimitScheduler, optional): The scheduler that shares the rate limit. Defaults to a new scheduler.
+        on_batch_written (callable, optional): Gets called with the subreddit and every batch after it was flushed. Defaults to None.
+        listing_options (dict, optional): The listing, time_filter, query and backfill_range passed to open_listing(). Defaults to the hot listing.
+        metrics (RunMetrics, optional): Collects the stage timings and request counters of every job. Defaults to None.
+        indexes (bool, optional): Whether the rollups and search index of the output are kept up to date, see open_writer(). Defaults to False.
+
+    Returns:
+        dict: A dictionary where each key is a subreddit and the value is the amount of written rows, or the exception that stopped the job.
+    """
+    # Imported here, so prawcore is only loaded once there is something to scrape
+    from scheduler import RateLimitScheduler
+
+    if scheduler is None:
+        scheduler = RateLimitScheduler(metrics=metrics)
+
+    listing_options = listing_options or {'listing': 'hot'}
+    # A backfill walks a fixed time range, so it relies on the post ID index instead of the checkpoints
+    if listing_options.get('listing') == 'backfill':
+        checkpoint_store = None
+    checkpoint_name = listing_key(listing_options.get('listing', 'hot'), listing_options.get('time_filter', 'all'), listing_options.get('query'))
+
+    results = queue.Queue(maxsize=max_workers * 2)
+    stop = threading.Event()
+    summary = {subreddit: 0 for subreddit in subreddits}
+    unfinished_jobs = len(subreddits)
+
+    with open_writer(output_filename, indexes=indexes) as writer:
+        if batch_size is None:
+            batch_size = writer.preferred_batch_size
+
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            for subreddit in subreddits:
+                checkpoint = checkpoint_store.get(subreddit, checkpoint_name) if checkpoint_store is not None else None
+                executor.submit(_scrape_job, make_client, scheduler, subreddit, search_limit, sentiment_engine, post_id_index, checkpoint, batch_size, results,
+                                listing_options, stop, metrics)
+
+            _write_results(results, writer, summary, unfinished_jobs, post_id_index, checkpoint_store, checkpoint_name, on_batch_written, metrics)
+        finally:
+            # Without a writer the running jobs would block on the full queue, so they're told to give up first
+            stop.set()
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    return summary
@@ -0,0 +1,171 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from dedup_index import PostIdIndex
+from fake_reddit import FakeReddit, FakeRedditServer, load_recorded_posts
+from metrics import RunMetrics
+
+# The amounts of posts every benchmark run scrapes
+DEFAULT_SIZES = [100, 1000, 100000]
+
+# The stages whose latency per call is reported
+REPORTED_STAGES = ['listing', 'records', 'sentiment', 'write']
+
+
+def run_benchmark(size, output_format='csv', latency=0.0, sentiment=True, sentiment_processes=0, workers=1, recorded_posts=None, trace_memory=True):
+    """
+    Scrapes a fake subreddit of the given size into a temporary output and measures the run.
+
+    The posts come from a FakeRedditServer, so the numbers only depend on the scraper (and the configured
+    latency), not on Reddit. The posts are spread over the amount of workers, one fake subreddit each.
+
+    Args:
+        size (int): The total amount of posts to scrape.
+        output_format (str, optional): The output type, 'csv', 'sqlite' or 'parquet'. Defaults to 'csv'.
+        latency (float, optional): The seconds every fake response is delayed. Defaults to 0.
+        sentiment (bool, optional): Whether the posts are scored. Defaults to True.
+        sentiment_processes (int, optional): The amount of processes scoring the sentiment. Defaults to 0.
+        workers (int, optional): The amount of subreddits scraped at the same time. Defaults to 1.
+        recorded_posts (list, optional): Recorded post data the fake posts are copied from. Defaults to None.
+        trace_memory (bool, optional): Whether the peak memory is traced, which slows the run down. Defaults to True.
+
+    Returns:
+        dict: The posts/sec, requests per post, peak memory, first-batch latency and stage timings of the run.
+    """
+    import praw
+
+    from batch_scraper import scrape_subreddits_concurrently
+
+    subreddits = ['bench' + str(number) for number in range(workers)]
+    posts_per_subreddit = -(-size // workers)
+    output_directory = tempfile.mkdtemp(prefix='redditscraper-benchmark-')
+    output_filename = os.path.join(output_directory, 'output.' + output_format)
+    sentiment_engine = None
+
+    try:
+        with FakeRedditServer(FakeReddit(posts_per_subreddit, recorded_posts=recorded_posts), latency=latency) as server:
+            def make_client(**kwargs):
+                return praw.Reddit(**server.client_settings(), **kwargs)
+
+            if sentiment:
+                from sentiment_analysis import SentimentEngine
+                sentiment_engine = SentimentEngine(processes=sentiment_processes)
+
+            metrics = RunMetrics()
+            first_batch = []
+
+            def on_batch_written(subreddit, batch):
+                if not first_batch:
+                    first_batch.append(time.perf_counter() - metrics.started)
+
+            if trace_memory:
+                tracemalloc.start()
+
+            with PostIdIndex(output_filename) as post_id_index:
+                summary = scrape_subreddits_concurrently(make_client, subreddits, posts_per_subreddit, output_filename, sentiment_engine,
+                                                         post_id_index=post_id_index, max_workers=workers, on_batch_written=on_batch_written,
+                                                         listing_options={'listing': 'new'}, metrics=metrics)
+            metrics.finish()
+
+            peak_memory = None
+            if trace_memory:
+                peak_memory = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+
+            served_requests = server.requests_served
+    finally:
+        if sentiment_engine is not None:
+            sentiment_engine.close()
+        shutil.rmtree(output_directory, ignore_errors=True)
+
+    failures = {name: str(outcome) for name, outcome in summary.items() if isinstance(outcome, Exception)}
+    report = metrics.report()
+
+    return {
+        'size': size,
+        'output_format': output_format,
+        'latency': latency,
+        'sentiment': sentiment,
+        'workers': workers,
+        'posts': report['posts'],
+        'duration_seconds': report['duration_seconds'],
+        'posts_per_second': report['posts_per_second'],
+        'requests_per_post': served_requests / report['posts'] if report['posts'] else None,
+        'peak_memory_bytes': peak_memory,
+        'first_batch_seconds': first_batch[0] if first_batch else None,
+        'stage_seconds_per_call': {
+            stage: report['stages'][stage]['seconds'] / report['stages'][stage]['calls']
+            for stage in REPORTED_STAGES if report['stages'].get(stage, {}).get('calls')
+        },
+        'stages': report['stages'],
+        'counters': report['counters'],
+        'failures': failures,
+    }
+
+
+def format_result(result):
+    """
+    Formats a benchmark result as one line for the terminal.
+
+    Args:
+        result (dict): The result of run_benchmark().
+
+    Returns:
+        str: The summary line.
+    """
+    line = (str(result['size']).rjust(7) + ' posts  ' + ('%.1f' % result['posts_per_second']).rjust(9) + ' posts/s  '
+            + ('%.3f' % (result['requests_per_post'] or 0)) + ' req/post  ')
+    if result['peak_memory_bytes'] is not None:
+        line += ('%.1f' % (result['peak_memory_bytes'] / 1048576)).rjust(7) + ' MiB peak  '
+    line += 'first batch after ' + ('%.3f' % (result['first_batch_seconds'] or 0)) + 's'
+    if result['failures']:
+        line += '  FAILED: ' + json.dumps(result['failures'])
+    return line
+
+
+def build_parser():
+    """
+    Builds the parser of the benchmark command line.
+
+    Args:
+        None
+
+    Returns:
+        argparse.ArgumentParser: The parser.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the scrape pipeline against a local fake Reddit API.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='The amounts of posts to scrape (default 100 1000 100000).')
+    parser.add_argument('--format', dest='output_format', choices=['csv', 'sqlite', 'parquet'], default='csv', help='The output type (default csv).')
+    parser.add_argument('--latency', type=float, default=0.0, help='The seconds every fake response is delayed (default 0).')
+    parser.add_argument('--workers', type=int, default=1, help='The amount of fake subreddits scraped at the same time (default 1).')
+    parser.add_argument('--no-sentiment', dest='sentiment', action='store_false', help='Skip the sentiment scoring.')
+    parser.add_argument('--sentiment-processes', dest='sentiment_processes', type=int, default=0, help='The amount of processes scoring the sentiment.')
+    parser.add_argument('--recordings', help='A directory of recorded listing JSON files used as post templates.')
+    parser.add_argument('--no-memory', dest='trace_memory', action='store_false', help='Don\'t trace the peak memory, which is faster.')
+    parser.add_argument('--output', help='Write the results as JSON to this file, to compare them between versions.')
+    return parser
+
+
+if __name__ == '__main__':
+    # python benchmark.py --sizes 100 1000 --format sqlite --latency 0.05 --output results.json
+    args = build_parser().parse_args()
+    recorded = load_recorded_posts(args.recordings) if args.recordings else None
+
+    results = []
+    for benchmark_size in args.sizes:
+        results.append(run_benchmark(benchmark_size, output_format=args.output_format, latency=args.latency, sentiment=args.sentiment,
+                                     sentiment_processes=args.sentiment_processes, workers=args.workers, recorded_posts=recorded,
+                                     trace_memory=args.trace_memory))
+        print(format_result(results[-1]), flush=True)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=4)
+
+    sys.exit(1 if any(result['failures'] for result in results) else 0)
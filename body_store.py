@@ -0,0 +1,189 @@
+import sqlite3
+import threading
+import zlib
+
+from pipeline import CSV_COLUMN_ORDER
+from records import PostRecord
+from sentiment_analysis import text_hash
+
+# The CSV column holding the hash of a post's body when the bodies are kept in a body store
+BODY_HASH_COLUMN = 'post_body_hash'
+
+# The columns of a new CSV file whose bodies are kept in a body store
+HASHED_CSV_COLUMN_ORDER = [BODY_HASH_COLUMN if column == 'post_body' else column for column in CSV_COLUMN_ORDER]
+
+# The zlib level the bodies are compressed with
+COMPRESSION_LEVEL = 6
+
+# The slot of PostRecord that StoredBodyRecord keeps a loaded body in, behind its own post_body property
+_POST_BODY_SLOT = PostRecord.post_body
+
+
+def body_store_path_for(output_filename):
+    """
+    Returns the location of the body store that belongs to an output file.
+
+    Args:
+        output_filename (str): The path to the output file.
+
+    Returns:
+        str: The path to the body database next to the output file.
+    """
+    return output_filename + '.bodies.sqlite'
+
+
+class BodyStore:
+    """
+    The BodyStore class keeps the post bodies of an output compressed and addressed by the hash of their text.
+
+    A body is stored once however many posts (crossposts, reposts) carry it, and the output only holds its
+    hash. The hash is the same SHA-256 the sentiment cache uses, so a body's score can be looked up without
+    loading the body at all (see SentimentEngine.score_hashed()).
+
+    Example Usage:
+    ```python
+    with BodyStore("output.csv") as body_store:
+        hashes = body_store.put_many(["First body", "Second body"])
+        body_store.get(hashes[0])
+    ```
+    """
+
+    def __init__(self, output_filename):
+        """
+        Opens (or creates) the body store of an output file.
+
+        Args:
+            output_filename (str): The path to the output file.
+
+        Returns:
+            None
+        """
+        # Records loaded from the store can be read from other threads, e.g. the labeling prefetcher
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(body_store_path_for(output_filename), check_same_thread=False)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS bodies (hash TEXT PRIMARY KEY, body BLOB NOT NULL) WITHOUT ROWID')
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def put_many(self, texts):
+        """
+        Stores texts that aren't stored yet.
+
+        Args:
+            texts (list): The bodies, None for posts without one.
+
+        Returns:
+            list: The hash of every text, None for None.
+        """
+        hashes = [text_hash(text) if text is not None else None for text in texts]
+        new_bodies = {hashed_text: text for hashed_text, text in zip(hashes, texts) if hashed_text is not None}
+
+        with self.lock, self.connection:
+            self.connection.executemany(
+                'INSERT OR IGNORE INTO bodies (hash, body) VALUES (?, ?)',
+                ((hashed_text, zlib.compress(text.encode('utf-8'), COMPRESSION_LEVEL)) for hashed_text, text in new_bodies.items())
+            )
+
+        return hashes
+
+    def get_many(self, hashes):
+        """
+        Loads the texts of several hashes at once.
+
+        Args:
+            hashes (iterable): The hashes.
+
+        Returns:
+            dict: The text of every hash that is stored.
+        """
+        hashes = list(dict.fromkeys(hashed_text for hashed_text in hashes if hashed_text))
+        texts = {}
+
+        with self.lock:
+            # SQLite limits the amount of parameters per query
+            for start in range(0, len(hashes), 500):
+                chunk = hashes[start:start + 500]
+                for hashed_text, body in self.connection.execute('SELECT hash, body FROM bodies WHERE hash IN (' + ','.join('?' * len(chunk)) + ')', chunk):
+                    texts[hashed_text] = zlib.decompress(body).decode('utf-8')
+
+        return texts
+
+    def get(self, hashed_text):
+        """
+        Loads the text of a hash.
+
+        Args:
+            hashed_text (str): The hash.
+
+        Returns:
+            str: The text, or None if it isn't stored.
+        """
+        return self.get_many([hashed_text]).get(hashed_text)
+
+    def close(self):
+        """
+        Closes the body database.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        self.connection.close()
+
+
+class StoredBodyRecord(PostRecord):
+    """
+    The StoredBodyRecord class is a PostRecord read from an output whose bodies are in a body store.
+
+    The body is only loaded (and decompressed) when post_body is read for the first time, so reading the
+    other fields of a large output never touches the bodies.
+    """
+
+    __slots__ = ('stored_body_hash', 'body_store')
+
+    @property
+    def post_body(self):
+        try:
+            return _POST_BODY_SLOT.__get__(self, PostRecord)
+        except AttributeError:
+            body = self.body_store.get(self.stored_body_hash) if self.stored_body_hash else None
+            _POST_BODY_SLOT.__set__(self, body)
+            return body
+
+    @post_body.setter
+    def post_body(self, value):
+        _POST_BODY_SLOT.__set__(self, value)
+
+    @property
+    def post_body_hash(self):
+        try:
+            _POST_BODY_SLOT.__get__(self, PostRecord)
+        except AttributeError:
+            # Not loaded yet, so the body can't have been changed
+            return self.stored_body_hash
+        return PostRecord.post_body_hash.fget(self)
+
+    @classmethod
+    def from_stored_row(cls, row, body_store):
+        """
+        Builds a record from a row of an output that holds body hashes.
+
+        Args:
+            row (dict): The values keyed by field name, with the hash in BODY_HASH_COLUMN.
+            body_store (BodyStore): The store the body is loaded from.
+
+        Returns:
+            StoredBodyRecord: The record, with the body not loaded yet.
+        """
+        record = cls.from_row(row)
+        record.stored_body_hash = row.get(BODY_HASH_COLUMN) or None
+        record.body_store = body_store
+        _POST_BODY_SLOT.__delete__(record)
+        return record
@@ -0,0 +1,240 @@
+import sqlite3
+import time
+
+from listings import DATE_ORDERED_LISTINGS
+
+# The amount of posts Reddit returns per listing page
+LISTING_PAGE_SIZE = 100
+
+
+def checkpoint_path_for(csv_filename):
+    """
+    Returns the location of the checkpoint store that belongs to an output file.
+
+    Args:
+        csv_filename (str): The path to the output file.
+
+    Returns:
+        str: The path to the checkpoint database next to the output file.
+    """
+    return csv_filename + '.checkpoints.sqlite'
+
+
+class CheckpointStore:
+    """
+    The CheckpointStore class remembers how far every subreddit listing has been scraped into an output file.
+
+    For every subreddit and listing type it keeps the newest post that is stored (its fullname and timestamp),
+    so a repeat run can stop paging once it reaches content it already has. While a run is in progress it also
+    keeps the fullname of the last written post as a page cursor, so an interrupted run can continue where it
+    stopped instead of starting at the top of the listing. The newest post of a run is only promoted once the
+    run has finished, otherwise an interrupted run would hide the posts it never got to.
+
+    Example Usage:
+    ```python
+    with CheckpointStore("output.csv") as checkpoints:
+        checkpoint = checkpoints.get("python", "hot")
+        ...
+        checkpoints.advance("python", "hot", batch)
+        checkpoints.finish_run("python", "hot")
+    ```
+    """
+
+    def __init__(self, csv_filename):
+        """
+        Opens (or creates) the checkpoint store of an output file.
+
+        Args:
+            csv_filename (str): The path to the output file.
+
+        Returns:
+            None
+        """
+        self.connection = sqlite3.connect(checkpoint_path_for(csv_filename))
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS checkpoints ('
+            'subreddit TEXT NOT NULL, '
+            'listing TEXT NOT NULL, '
+            'newest_fullname TEXT, '
+            'newest_created_utc REAL, '
+            'run_cursor TEXT, '
+            'run_count INTEGER NOT NULL DEFAULT 0, '
+            'run_newest_fullname TEXT, '
+            'run_newest_created_utc REAL, '
+            'updated_at REAL, '
+            'PRIMARY KEY (subreddit, listing))'
+        )
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get(self, subreddit, listing):
+        """
+        Returns the checkpoint of a subreddit listing.
+
+        Args:
+            subreddit (str): The name of the subreddit.
+            listing (str): The listing type (e.g. 'hot').
+
+        Returns:
+            dict: The checkpoint, or None if the listing was never scraped into this output.
+        """
+        row = self.connection.execute(
+            'SELECT newest_fullname, newest_created_utc, run_cursor, run_count, run_newest_fullname, run_newest_created_utc '
+            'FROM checkpoints WHERE subreddit = ? AND listing = ?',
+            (subreddit.lower(), listing)
+        ).fetchone()
+
+        if row is None:
+            return None
+
+        return {
+            "newest_fullname": row[0],
+            "newest_created_utc": row[1],
+            "run_cursor": row[2],
+            "run_count": row[3],
+            "run_newest_fullname": row[4],
+            "run_newest_created_utc": row[5],
+        }
+
+    def advance(self, subreddit, listing, batch):
+        """
+        Moves the cursor of the running scrape past a batch of records that was just written.
+
+        Args:
+            subreddit (str): The name of the subreddit.
+            listing (str): The listing type (e.g. 'hot').
+            batch (list): The written records, in listing order.
+
+        Returns:
+            None
+        """
+        if not batch:
+            return
+
+        newest_record = max(batch, key=lambda record: record.created_utc)
+
+        self.connection.execute(
+            'INSERT INTO checkpoints (subreddit, listing, run_count) VALUES (?, ?, 0) '
+            'ON CONFLICT (subreddit, listing) DO NOTHING',
+            (subreddit.lower(), listing)
+        )
+        self.connection.execute(
+            'UPDATE checkpoints SET run_cursor = ?, run_count = run_count + ?, updated_at = ?, '
+            'run_newest_fullname = CASE WHEN run_newest_created_utc IS NULL OR run_newest_created_utc < ? THEN ? ELSE run_newest_fullname END, '
+            'run_newest_created_utc = CASE WHEN run_newest_created_utc IS NULL OR run_newest_created_utc < ? THEN ? ELSE run_newest_created_utc END '
+            'WHERE subreddit = ? AND listing = ?',
+            (
+                't3_' + batch[-1].post_id, len(batch), time.time(),
+                newest_record.created_utc, 't3_' + newest_record.post_id,
+                newest_record.created_utc, newest_record.created_utc,
+                subreddit.lower(), listing
+            )
+        )
+        self.connection.commit()
+
+    def finish_run(self, subreddit, listing):
+        """
+        Marks the running scrape as complete, promoting its newest post and dropping the cursor.
+
+        Args:
+            subreddit (str): The name of the subreddit.
+            listing (str): The listing type (e.g. 'hot').
+
+        Returns:
+            None
+        """
+        self.connection.execute(
+            'UPDATE checkpoints SET '
+            'newest_fullname = CASE WHEN newest_created_utc IS NULL OR newest_created_utc < run_newest_created_utc THEN run_newest_fullname ELSE newest_fullname END, '
+            'newest_created_utc = CASE WHEN newest_created_utc IS NULL OR newest_created_utc < run_newest_created_utc THEN run_newest_created_utc ELSE newest_created_utc END, '
+            'run_cursor = NULL, run_count = 0, run_newest_fullname = NULL, run_newest_created_utc = NULL, updated_at = ? '
+            'WHERE subreddit = ? AND listing = ?',
+            (time.time(), subreddit.lower(), listing)
+        )
+        self.connection.commit()
+
+    def advance_newest(self, subreddit, listing, batch):
+        """
+        Moves the newest stored post forward right away, for streams that never finish a run.
+
+        Args:
+            subreddit (str): The name of the subreddit.
+            listing (str): The listing type (e.g. 'new').
+            batch (list): The written records of the subreddit.
+
+        Returns:
+            None
+        """
+        if not batch:
+            return
+
+        newest_record = max(batch, key=lambda record: record.created_utc)
+
+        self.connection.execute(
+            'INSERT INTO checkpoints (subreddit, listing, newest_fullname, newest_created_utc, run_count, updated_at) VALUES (?, ?, ?, ?, 0, ?) '
+            'ON CONFLICT (subreddit, listing) DO UPDATE SET '
+            'newest_fullname = CASE WHEN newest_created_utc IS NULL OR newest_created_utc < excluded.newest_created_utc THEN excluded.newest_fullname ELSE newest_fullname END, '
+            'newest_created_utc = CASE WHEN newest_created_utc IS NULL OR newest_created_utc < excluded.newest_created_utc THEN excluded.newest_created_utc ELSE newest_created_utc END, '
+            'updated_at = excluded.updated_at',
+            (subreddit.lower(), listing, 't3_' + newest_record.post_id, newest_record.created_utc, time.time())
+        )
+        self.connection.commit()
+
+    def close(self):
+        """
+        Closes the checkpoint database.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        self.connection.close()
+
+
+def stop_at_known_content(submissions, checkpoint, listing='hot', patience=1, post_id_index=None):
+    """
+    Stops a listing once it reaches content that is already stored.
+
+    In listings sorted by date (DATE_ORDERED_LISTINGS) every post that is at least as old as the newest stored
+    post is known, so they stop at the first one. Listings that aren't sorted by date (like 'hot') mix old and
+    new posts, so there a post only counts as known when it is the newest stored post or in the post ID index.
+    Unknown posts are passed on however old they are, and the listing only stops after a number of known
+    posts in a row.
+
+    Args:
+        submissions (iterable): The PRAW submissions of a listing.
+        checkpoint (dict): The checkpoint of the listing, as returned by CheckpointStore.get().
+        listing (str, optional): The listing type. Defaults to 'hot'.
+        patience (int, optional): The amount of known posts in a row after which the listing stops. Defaults to 1.
+        post_id_index (PostIdIndex, optional): The index of the posts already in the output. Defaults to None.
+
+    Yields:
+        Submission: Every submission until the listing reaches known content.
+    """
+    if checkpoint is None or checkpoint["newest_created_utc"] is None:
+        yield from submissions
+        return
+
+    date_ordered = listing in DATE_ORDERED_LISTINGS
+    known_in_a_row = 0
+
+    for submission in submissions:
+        if date_ordered:
+            known = submission.fullname == checkpoint["newest_fullname"] or submission.created_utc <= checkpoint["newest_created_utc"]
+        else:
+            known = submission.fullname == checkpoint["newest_fullname"] or (post_id_index is not None and submission.id in post_id_index)
+
+        if known:
+            known_in_a_row += 1
+            if known_in_a_row >= patience:
+                return
+        else:
+            known_in_a_row = 0
+            yield submission
@@ -0,0 +1,804 @@
+import argparse
+import json
+import os
+import sys
+
+from batch_scraper import DEFAULT_MAX_WORKERS, scrape_subreddits_concurrently
+from checkpoints import CheckpointStore
+from comment_scraper import DEFAULT_MAX_COMMENTS_PER_POST, DEFAULT_MORE_BUDGET, BackgroundCommentScraper
+from compaction import DEFAULT_COMPACT_CHUNK_ROWS, compact_csv
+from credentials import load_profiles, restore_cached_token, validate_credentials
+from dedup_index import PostIdIndex
+from engagement_refresh import EngagementStore, engagement_path_for, refresh_engagement
+from job_queue import DEFAULT_LEASE_SECONDS, DEFAULT_WORKERS, JobQueue, job_queue_path_for, run_job_workers, work_jobs
+from label_rules import LabelClassifier, LabelSuggestionStore, label_suggestions_path_for, load_rules, suggest_labels_for_output
+from listings import LISTING_CAP, LISTING_TYPES, TIME_FILTERS, date_to_timestamp
+from metrics import RunMetrics, report_path_for
+from pipeline import DEFAULT_BATCH_SIZE
+from rollups import ROLLUP_DIMENSIONS, ROLLUP_GROUP_COLUMNS, RollupStore
+from search_index import DEFAULT_SEARCH_LIMIT, SearchIndex
+from stream_scraper import DEFAULT_FLUSH_SECONDS, stream_subreddits
+from writers import comments_output_for, open_writer
+
+# The settings a config file can hold, with the value used when neither the file nor the arguments set them
+SCRAPE_DEFAULTS = {
+    "subreddits": [],
+    "limit": 100,
+    "output": None,
+    "profile": None,
+    "client_id": None,
+    "client_secret": None,
+    "user_agent": None,
+    "listing": "hot",
+    "time_filter": "all",
+    "query": None,
+    "start_date": None,
+    "end_date": None,
+    "workers": DEFAULT_MAX_WORKERS,
+    "sentiment": True,
+    "sentiment_processes": 0,
+    "comments": False,
+    "comment_budget": DEFAULT_MORE_BUDGET,
+    "max_comments": DEFAULT_MAX_COMMENTS_PER_POST,
+    "body_store": False,
+    "indexes": False,
+    "report": None,
+    "prometheus": None,
+}
+
+# The settings of a stream, like SCRAPE_DEFAULTS
+STREAM_DEFAULTS = {
+    "subreddits": [],
+    "output": None,
+    "profile": None,
+    "client_id": None,
+    "client_secret": None,
+    "user_agent": None,
+    "batch_size": DEFAULT_BATCH_SIZE,
+    "flush_seconds": DEFAULT_FLUSH_SECONDS,
+    "sentiment": True,
+    "sentiment_processes": 0,
+    "body_store": False,
+    "indexes": False,
+    "report": None,
+    "prometheus": None,
+}
+
+# The settings of an engagement refresh, like SCRAPE_DEFAULTS
+REFRESH_DEFAULTS = {
+    "output": None,
+    "profile": None,
+    "client_id": None,
+    "client_secret": None,
+    "user_agent": None,
+    "report": None,
+    "prometheus": None,
+}
+
+# The settings of jobs added to the job queue, like SCRAPE_DEFAULTS
+ENQUEUE_DEFAULTS = {
+    "subreddits": [],
+    "limit": 100,
+    "output": None,
+    "profile": None,
+    "listing": "hot",
+    "time_filter": "all",
+    "query": None,
+    "start_date": None,
+    "end_date": None,
+}
+
+# The settings of a pool of workers running the job queue, like SCRAPE_DEFAULTS
+WORK_DEFAULTS = {
+    "output": None,
+    "profile": None,
+    "client_id": None,
+    "client_secret": None,
+    "user_agent": None,
+    "workers": DEFAULT_WORKERS,
+    "lease_seconds": DEFAULT_LEASE_SECONDS,
+    "retry_failed": False,
+    "sentiment": True,
+    "indexes": False,
+    "report": None,
+    "prometheus": None,
+}
+
+
+def build_parser():
+    """
+    Builds the parser of the headless command line.
+
+    Args:
+        None
+
+    Returns:
+        argparse.ArgumentParser: The parser.
+    """
+    parser = argparse.ArgumentParser(prog='redditscraper', description='Scrape Subreddits without the interactive menus.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    scrape = commands.add_parser('scrape', help='Scrape one or more Subreddits into an output file.')
+    scrape.add_argument('--config', help='A JSON file with any of the settings below, the arguments override it.')
+    scrape.add_argument('--subreddits', nargs='+', help='The Subreddits to scrape.')
+    scrape.add_argument('--limit', type=int, help='The maximum number of posts per Subreddit (default 100).')
+    scrape.add_argument('--output', help='The output: a .csv file, a .sqlite database or a .parquet dataset directory.')
+    add_login_arguments(scrape)
+    scrape.add_argument('--listing', choices=LISTING_TYPES, help='The listing to scrape (default hot).')
+    scrape.add_argument('--time-filter', dest='time_filter', choices=TIME_FILTERS, help='The time filter for top, controversial and search.')
+    scrape.add_argument('--query', help='The search query for search and backfill.')
+    scrape.add_argument('--start-date', dest='start_date', help='The first day of a backfill (YYYY-MM-DD).')
+    scrape.add_argument('--end-date', dest='end_date', help='The day a backfill stops at (YYYY-MM-DD).')
+    scrape.add_argument('--workers', type=int, help='The amount of Subreddits scraped at the same time.')
+    scrape.add_argument('--no-sentiment', dest='sentiment', action='store_const', const=False, help='Skip the sentiment scoring.')
+    scrape.add_argument('--sentiment-processes', dest='sentiment_processes', type=int, help='The amount of processes scoring the sentiment (default 0, in this process).')
+    scrape.add_argument('--comments', action='store_const', const=True, help='Also scrape the comments of the new posts into their own output.')
+    scrape.add_argument('--comment-budget', dest='comment_budget', type=int, help='The amount of "load more comments" expanded per post (default ' + str(DEFAULT_MORE_BUDGET) + ').')
+    scrape.add_argument('--max-comments', dest='max_comments', type=int, help='The most comments taken from one post (default ' + str(DEFAULT_MAX_COMMENTS_PER_POST) + ').')
+    scrape.add_argument('--body-store', dest='body_store', action='store_const', const=True, help='Keep the bodies of a new CSV output compressed in <output>.bodies.sqlite.')
+    scrape.add_argument('--indexes', action='store_const', const=True, help='Keep the rollups and the search index of the output up to date while writing (otherwise they are rebuilt when used).')
+    scrape.add_argument('--report', help='Where the JSON run report is written (default next to the output).')
+    scrape.add_argument('--prometheus', help='Also write the run metrics in the Prometheus text format to this file.')
+
+    stream = commands.add_parser('stream', help='Follow the new posts of one or more Subreddits until stopped with Ctrl+C.')
+    stream.add_argument('--config', help='A JSON file with any of the settings below, the arguments override it.')
+    stream.add_argument('--subreddits', nargs='+', help='The Subreddits to follow.')
+    stream.add_argument('--output', help='The output: a .csv file, a .sqlite database or a .parquet dataset directory.')
+    add_login_arguments(stream)
+    stream.add_argument('--batch-size', dest='batch_size', type=int, help='The amount of new posts that are written at once (default ' + str(DEFAULT_BATCH_SIZE) + ').')
+    stream.add_argument('--flush-seconds', dest='flush_seconds', type=float, help='The longest a new post waits before it is written (default ' + str(DEFAULT_FLUSH_SECONDS) + ').')
+    stream.add_argument('--no-sentiment', dest='sentiment', action='store_const', const=False, help='Skip the sentiment scoring.')
+    stream.add_argument('--sentiment-processes', dest='sentiment_processes', type=int, help='The amount of processes scoring the sentiment (default 0, in this process).')
+    stream.add_argument('--body-store', dest='body_store', action='store_const', const=True, help='Keep the bodies of a new CSV output compressed in <output>.bodies.sqlite.')
+    stream.add_argument('--indexes', action='store_const', const=True, help='Keep the rollups and the search index of the output up to date while writing (otherwise they are rebuilt when used).')
+    stream.add_argument('--report', help='Where the JSON run report is written when the stream stops (default next to the output).')
+    stream.add_argument('--prometheus', help='Also write the run metrics in the Prometheus text format to this file.')
+
+    refresh = commands.add_parser('refresh', help='Look up the current upvotes, comment counts and status of every post in an output.')
+    refresh.add_argument('--config', help='A JSON file with any of the settings below, the arguments override it.')
+    refresh.add_argument('--output', help='The output whose posts are refreshed, the numbers go to <output>.engagement.sqlite.')
+    add_login_arguments(refresh)
+    refresh.add_argument('--report', help='Where the JSON run report is written (default next to the output).')
+    refresh.add_argument('--prometheus', help='Also write the run metrics in the Prometheus text format to this file.')
+
+    enqueue = commands.add_parser('enqueue', help='Add a scrape job per Subreddit to the job queue of an output, see the work command.')
+    enqueue.add_argument('--config', help='A JSON file with any of the settings below, the arguments override it.')
+    enqueue.add_argument('--subreddits', nargs='+', help='The Subreddits to scrape.')
+    enqueue.add_argument('--limit', type=int, help='The maximum number of posts per Subreddit (default 100).')
+    enqueue.add_argument('--output', help='The output the jobs are scraped into, the queue is <output>.jobs.sqlite.')
+    enqueue.add_argument('--profile', help='The saved login profile the jobs are scraped with (default the credentials of the workers).')
+    enqueue.add_argument('--listing', choices=LISTING_TYPES, help='The listing to scrape (default hot).')
+    enqueue.add_argument('--time-filter', dest='time_filter', choices=TIME_FILTERS, help='The time filter for top, controversial and search.')
+    enqueue.add_argument('--query', help='The search query for search and backfill.')
+    enqueue.add_argument('--start-date', dest='start_date', help='The first day of a backfill (YYYY-MM-DD).')
+    enqueue.add_argument('--end-date', dest='end_date', help='The day a backfill stops at (YYYY-MM-DD).')
+
+    work = commands.add_parser('work', help='Run the job queue of an output with a pool of worker processes until every job is done or failed.')
+    work.add_argument('--config', help='A JSON file with any of the settings below, the arguments override it.')
+    work.add_argument('--output', help='The output whose job queue is run.')
+    add_login_arguments(work)
+    work.add_argument('--workers', type=int, help='The amount of worker processes (default ' + str(DEFAULT_WORKERS) + ').')
+    work.add_argument('--lease-seconds', dest='lease_seconds', type=float,
+                      help='How long a job stays with a worker that stopped sending heartbeats (default ' + str(DEFAULT_LEASE_SECONDS) + ').')
+    work.add_argument('--retry-failed', dest='retry_failed', action='store_const', const=True, help='Put the failed jobs back into the queue first.')
+    work.add_argument('--no-sentiment', dest='sentiment', action='store_const', const=False, help='Skip the sentiment scoring.')
+    work.add_argument('--indexes', action='store_const', const=True, help='Keep the rollups and the search index of the output up to date while writing (otherwise they are rebuilt when used).')
+    work.add_argument('--report', help='Where the JSON run report is written (default next to the output).')
+    work.add_argument('--prometheus', help='Also write the run metrics in the Prometheus text format to this file.')
+
+    jobs = commands.add_parser('jobs', help='Print the jobs of an output\'s job queue with their status as JSON.')
+    jobs.add_argument('--output', required=True, help='The output whose job queue is printed.')
+
+    search = commands.add_parser('search', help='Search the titles and bodies of the posts in an output and print the best matches as JSON.')
+    search.add_argument('query', nargs='+', help='The words a post has to contain.')
+    search.add_argument('--output', required=True, help='The output to search.')
+    search.add_argument('--subreddits', nargs='+', help='Only these Subreddits.')
+    search.add_argument('--since', help='The first day included (YYYY-MM-DD).')
+    search.add_argument('--until', help='The last day included (YYYY-MM-DD).')
+    search.add_argument('--min-sentiment', dest='min_sentiment', type=float, help='The lowest compound sentiment included (-1 to 1).')
+    search.add_argument('--max-sentiment', dest='max_sentiment', type=float, help='The highest compound sentiment included (-1 to 1).')
+    search.add_argument('--limit', type=int, default=DEFAULT_SEARCH_LIMIT, help='The most results (default ' + str(DEFAULT_SEARCH_LIMIT) + ').')
+    search.add_argument('--raw', action='store_true', help='Pass the query on as FTS5 syntax, e.g. \'burnout OR "mental health"\'.')
+
+    label = commands.add_parser('label', help='Suggest the subject and problem labels of every post in an output from keyword rules.')
+    label.add_argument('--output', required=True, help='The output to label, the suggestions go to <output>.labels.sqlite.')
+    label.add_argument('--rules', help='A JSON file with extra rules per label (default label_rules.json in the config directory).')
+
+    rollups = commands.add_parser('rollups', help='Print the sentiment and upvote rollups of an output as JSON.')
+    rollups.add_argument('--output', required=True, help='The output whose rollups are read.')
+    rollups.add_argument('--by', dest='dimension', choices=ROLLUP_DIMENSIONS, default='all', help='Aggregate all posts, or per subject or problem label (default all).')
+    rollups.add_argument('--subreddits', nargs='+', help='Only these Subreddits.')
+    rollups.add_argument('--since', help='The first day included (YYYY-MM-DD).')
+    rollups.add_argument('--until', help='The last day included (YYYY-MM-DD).')
+    rollups.add_argument('--labels', nargs='+', help='Only these subject or problem labels.')
+    rollups.add_argument('--group-by', dest='group_by', nargs='*', choices=ROLLUP_GROUP_COLUMNS, default=['subreddit', 'date'],
+                         help='The columns the rollups are grouped by, none for one total (default subreddit date).')
+
+    compact = commands.add_parser('compact', help='Rewrite a CSV output with every post once (its latest scrape) in the current column order.')
+    compact.add_argument('--output', required=True, help='The CSV output to compact.')
+    compact.add_argument('--chunk-rows', dest='chunk_rows', type=int, default=DEFAULT_COMPACT_CHUNK_ROWS,
+                         help='The amount of rows handled at once (default ' + str(DEFAULT_COMPACT_CHUNK_ROWS) + ').')
+
+    return parser
+
+
+def add_login_arguments(parser):
+    """
+    Adds the arguments that choose the credentials to a subcommand.
+
+    Args:
+        parser (argparse.ArgumentParser): The parser of the subcommand.
+
+    Returns:
+        None
+    """
+    parser.add_argument('--profile', help='A saved login profile.')
+    parser.add_argument('--client-id', dest='client_id', help='The Reddit API client ID (or REDDIT_CLIENT_ID).')
+    parser.add_argument('--client-secret', dest='client_secret', help='The Reddit API client secret (or REDDIT_CLIENT_SECRET).')
+    parser.add_argument('--user-agent', dest='user_agent', help='The user agent (or REDDIT_USER_AGENT).')
+
+
+def load_scrape_settings(args, defaults=SCRAPE_DEFAULTS):
+    """
+    Combines the defaults, the config file and the arguments into the settings of a scrape.
+
+    Args:
+        args (argparse.Namespace): The parsed arguments.
+        defaults (dict, optional): The settings of the subcommand with their defaults. Defaults to SCRAPE_DEFAULTS.
+
+    Returns:
+        dict: The settings.
+    """
+    settings = dict(defaults)
+
+    if args.config:
+        with open(args.config, 'r') as file:
+            settings.update(json.load(file))
+
+    for key in defaults:
+        value = getattr(args, key, None)
+        if value is not None:
+            settings[key] = value
+
+    return settings
+
+
+def load_saved_profile(profile_name):
+    """
+    Reads a login profile that was saved through the interactive login.
+
+    Args:
+        profile_name (str): The name of the profile.
+
+    Returns:
+        dict: The client_id and client_secret of the profile, or None if it doesn't exist.
+    """
+    return load_profiles().get(profile_name)
+
+
+def resolve_credentials(settings):
+    """
+    Finds the credentials of a scrape in the arguments, a saved profile or the environment.
+
+    Args:
+        settings (dict): The settings of the scrape.
+
+    Returns:
+        dict: The client_id, client_secret and user_agent.
+    """
+    credentials = {
+        'client_id': settings['client_id'] or os.getenv('REDDIT_CLIENT_ID'),
+        'client_secret': settings['client_secret'] or os.getenv('REDDIT_CLIENT_SECRET'),
+        'user_agent': settings['user_agent'] or os.getenv('REDDIT_USER_AGENT'),
+    }
+
+    if settings['profile']:
+        profile = load_saved_profile(settings['profile'])
+        if profile is None:
+            raise ValueError('The login profile "' + settings['profile'] + '" does not exist')
+        credentials['client_id'] = profile['client_id']
+        credentials['client_secret'] = profile['client_secret']
+
+    missing = [key for key, value in credentials.items() if not value]
+    if missing:
+        raise ValueError('Missing credentials: ' + ', '.join(missing))
+
+    return credentials
+
+
+def listing_options_from(settings):
+    """
+    Turns the listing settings into the options open_listing() takes.
+
+    Args:
+        settings (dict): The settings of the scrape.
+
+    Returns:
+        dict: The listing, time_filter, query and backfill_range.
+    """
+    listing_options = {
+        'listing': settings['listing'],
+        'time_filter': settings['time_filter'],
+        'query': settings['query'],
+        'backfill_range': None,
+    }
+
+    if settings['listing'] == 'search' and not settings['query']:
+        raise ValueError('The search listing needs a --query')
+
+    if settings['listing'] == 'backfill':
+        start_timestamp = date_to_timestamp(settings['start_date'] or '')
+        end_timestamp = date_to_timestamp(settings['end_date'] or '')
+        if start_timestamp is None or end_timestamp is None or start_timestamp >= end_timestamp:
+            raise ValueError('A backfill needs a --start-date before its --end-date (YYYY-MM-DD)')
+        listing_options['backfill_range'] = (start_timestamp, end_timestamp)
+    elif settings['limit'] > LISTING_CAP:
+        raise ValueError('Only a backfill can collect more than ' + str(LISTING_CAP) + ' posts per Subreddit')
+
+    return listing_options
+
+
+def client_factory(settings):
+    """
+    Checks the credentials of the settings once and returns a function that creates clients with them.
+
+    Args:
+        settings (dict): The settings of the scrape or stream.
+
+    Returns:
+        callable: Creates a new praw.Reddit instance, keyword arguments are passed on to praw.Reddit.
+    """
+    credentials = resolve_credentials(settings)
+
+    def make_client(**kwargs):
+        import praw
+
+        reddit = praw.Reddit(**credentials, **kwargs)
+        # Every worker thread makes its own client, they all share the token of an earlier run
+        restore_cached_token(reddit, credentials['client_id'], credentials['client_secret'])
+        return reddit
+
+    # One token is requested (or taken from the cache) up front, instead of one per worker
+    if not validate_credentials(make_client(), credentials['client_id'], credentials['client_secret']):
+        raise ValueError('The client ID or secret was rejected by Reddit')
+
+    return make_client
+
+
+def write_reports(run_metrics, settings):
+    """
+    Writes the run report (and the Prometheus metrics if asked for) and prints a summary of it.
+
+    Args:
+        run_metrics (RunMetrics): The metrics of the run.
+        settings (dict): The settings of the scrape or stream.
+
+    Returns:
+        None
+    """
+    run_metrics.finish()
+    report = run_metrics.write_json(settings['report'] or report_path_for(settings['output']))
+    if settings['prometheus']:
+        run_metrics.write_prometheus(settings['prometheus'])
+    print(str(report['posts']) + ' posts in ' + str(round(report['duration_seconds'], 1)) + 's, '
+          + str(round(report['posts_per_second'], 1)) + ' posts/s, ' + str(report['counters'].get('api_requests', 0)) + ' API requests')
+
+
+def create_output(settings):
+    """
+    Creates the output of the settings when it doesn't exist yet and its bodies go to a body store.
+
+    The scrapers keep writing in the layout of the header an output already has, so writing the header of
+    HASHED_CSV_COLUMN_ORDER first is all a new output needs.
+
+    Args:
+        settings (dict): The settings of the scrape or stream.
+
+    Returns:
+        None
+    """
+    if settings['body_store'] and not os.path.exists(settings['output']):
+        open_writer(settings['output'], body_store=True).close()
+
+
+def run_scrape(settings):
+    """
+    Runs a headless scrape of every Subreddit in the settings.
+
+    Args:
+        settings (dict): The settings of the scrape.
+
+    Returns:
+        int: The exit code, 0 when every Subreddit was scraped.
+    """
+    if not settings['subreddits']:
+        raise ValueError('No --subreddits to scrape')
+    if not settings['output']:
+        raise ValueError('No --output to write to')
+    create_output(settings)
+
+    make_client = client_factory(settings)
+    listing_options = listing_options_from(settings)
+    comment_scraper = None
+
+    def on_batch_written(subreddit, batch):
+        print(subreddit + ': ' + str(len(batch)) + ' new entries written', flush=True)
+        if comment_scraper is not None:
+            comment_scraper.add(record.post_id for record in batch)
+
+    sentiment_engine = None
+    if settings['sentiment']:
+        from sentiment_analysis import SentimentEngine, sentiment_cache_path_for
+        sentiment_engine = SentimentEngine(processes=settings['sentiment_processes'], cache_path=sentiment_cache_path_for(settings['output']))
+
+    run_metrics = RunMetrics()
+    scheduler = None
+
+    try:
+        if settings['comments']:
+            # Imported here, so prawcore is only loaded once there is something to scrape
+            from scheduler import RateLimitScheduler
+
+            # The comments are scraped while the posts are, within the same rate limit
+            scheduler = RateLimitScheduler(metrics=run_metrics)
+            comment_scraper = BackgroundCommentScraper(make_client, settings['output'], sentiment_engine, more_budget=settings['comment_budget'],
+                                                       max_comments_per_post=settings['max_comments'], scheduler=scheduler, metrics=run_metrics)
+
+        with PostIdIndex(settings['output']) as post_id_index, CheckpointStore(settings['output']) as checkpoint_store:
+            summary = scrape_subreddits_concurrently(
+                make_client, settings['subreddits'], settings['limit'], settings['output'], sentiment_engine,
+                post_id_index=post_id_index, checkpoint_store=checkpoint_store, max_workers=settings['workers'],
+                scheduler=scheduler, on_batch_written=on_batch_written, listing_options=listing_options, metrics=run_metrics,
+                indexes=settings['indexes'])
+
+        if comment_scraper is not None:
+            print('Waiting for the comments of ' + str(comment_scraper.pending()) + ' posts to be written to ' + comments_output_for(settings['output']), flush=True)
+            comment_scraper.finish()
+    except BaseException:
+        if comment_scraper is not None:
+            # The posts whose comments weren't written yet stay queued for the next run
+            comment_scraper.stop()
+        raise
+    finally:
+        if sentiment_engine is not None:
+            sentiment_engine.close()
+
+    write_reports(run_metrics, settings)
+
+    exit_code = 0
+    for subreddit, outcome in summary.items():
+        if isinstance(outcome, Exception):
+            print(subreddit + ': failed (' + str(outcome) + ')', file=sys.stderr)
+            exit_code = 1
+        else:
+            print(subreddit + ': ' + str(outcome) + ' new entries in total')
+
+    return exit_code
+
+
+def run_stream(settings):
+    """
+    Follows the new posts of every Subreddit in the settings until the stream is interrupted.
+
+    Args:
+        settings (dict): The settings of the stream.
+
+    Returns:
+        int: The exit code, 0 when the stream was stopped with Ctrl+C.
+    """
+    if not settings['subreddits']:
+        raise ValueError('No --subreddits to follow')
+    if not settings['output']:
+        raise ValueError('No --output to write to')
+    create_output(settings)
+
+    make_client = client_factory(settings)
+
+    def on_batch_written(subreddit, batch):
+        print(subreddit + ': ' + str(len(batch)) + ' new entries written', flush=True)
+
+    sentiment_engine = None
+    if settings['sentiment']:
+        from sentiment_analysis import SentimentEngine, sentiment_cache_path_for
+        sentiment_engine = SentimentEngine(processes=settings['sentiment_processes'], cache_path=sentiment_cache_path_for(settings['output']))
+
+    run_metrics = RunMetrics()
+
+    try:
+        with PostIdIndex(settings['output']) as post_id_index, CheckpointStore(settings['output']) as checkpoint_store:
+            print('Following ' + ', '.join(settings['subreddits']) + ' (Ctrl+C to stop)', flush=True)
+            stream_subreddits(make_client, settings['subreddits'], settings['output'], sentiment_engine, post_id_index, checkpoint_store,
+                              batch_size=settings['batch_size'], flush_seconds=settings['flush_seconds'], on_batch_written=on_batch_written,
+                              metrics=run_metrics, indexes=settings['indexes'])
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if sentiment_engine is not None:
+            sentiment_engine.close()
+
+    write_reports(run_metrics, settings)
+    return 0
+
+
+def run_refresh(settings):
+    """
+    Refreshes the engagement numbers of every post in the output of the settings.
+
+    Args:
+        settings (dict): The settings of the refresh.
+
+    Returns:
+        int: The exit code.
+    """
+    if not settings['output']:
+        raise ValueError('No --output to refresh')
+    if not os.path.exists(settings['output']):
+        raise ValueError('The output ' + settings['output'] + ' does not exist')
+
+    make_client = client_factory(settings)
+    run_metrics = RunMetrics()
+
+    with PostIdIndex(settings['output']) as post_id_index, EngagementStore(settings['output']) as engagement_store:
+        print('Refreshing ' + str(len(post_id_index)) + ' posts into ' + engagement_path_for(settings['output']), flush=True)
+        statuses = refresh_engagement(make_client, post_id_index, engagement_store, metrics=run_metrics)
+
+    write_reports(run_metrics, settings)
+    for status, count in sorted(statuses.items()):
+        print(status + ': ' + str(count))
+    return 0
+
+
+def run_enqueue(settings):
+    """
+    Adds a job per Subreddit in the settings to the job queue of the output.
+
+    Args:
+        settings (dict): The settings of the jobs.
+
+    Returns:
+        int: The exit code.
+    """
+    if not settings['subreddits']:
+        raise ValueError('No --subreddits to scrape')
+    if not settings['output']:
+        raise ValueError('No --output to write to')
+    if settings['profile'] and load_saved_profile(settings['profile']) is None:
+        raise ValueError('The login profile "' + settings['profile'] + '" does not exist')
+
+    listing_options = listing_options_from(settings)
+    with JobQueue(settings['output']) as job_queue:
+        for subreddit in settings['subreddits']:
+            job_queue.add(subreddit, settings['limit'], listing_options, profile=settings['profile'])
+
+    print(str(len(settings['subreddits'])) + ' jobs added to ' + job_queue_path_for(settings['output']))
+    return 0
+
+
+def profile_client_factory(settings):
+    """
+    Returns a function that gives the client factory of a login profile, checking the credentials of every profile once.
+
+    Args:
+        settings (dict): The settings of the workers, their credentials are used for jobs without a profile.
+
+    Returns:
+        callable: Gets a profile name (or None) and returns a function that creates praw.Reddit instances, see client_factory().
+    """
+    factories = {}
+
+    def make_client_for(profile):
+        if profile not in factories:
+            factories[profile] = client_factory(dict(settings, profile=profile or settings['profile']))
+        return factories[profile]
+
+    return make_client_for
+
+
+def work_in_process(settings, worker):
+    """
+    Runs the jobs of the output in a worker process of run_work().
+
+    Args:
+        settings (dict): The settings of the workers.
+        worker (str): The name of the worker.
+
+    Returns:
+        None
+    """
+    sentiment_engine = None
+    if settings['sentiment']:
+        from sentiment_analysis import SentimentEngine, sentiment_cache_path_for
+        sentiment_engine = SentimentEngine(cache_path=sentiment_cache_path_for(settings['output']))
+
+    try:
+        work_jobs(settings['output'], profile_client_factory(settings), worker, sentiment_engine, lease_seconds=settings['lease_seconds'])
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if sentiment_engine is not None:
+            sentiment_engine.close()
+
+
+def run_work(settings):
+    """
+    Runs the job queue of the output with a pool of worker processes, see run_job_workers().
+
+    Args:
+        settings (dict): The settings of the workers.
+
+    Returns:
+        int: The exit code, 0 when no job failed.
+    """
+    if not settings['output']:
+        raise ValueError('No --output to write to')
+
+    if settings['retry_failed']:
+        with JobQueue(settings['output']) as job_queue:
+            print(str(job_queue.retry_failed()) + ' failed jobs put back into the queue', flush=True)
+
+    def on_batch_written(subreddit, batch):
+        print(subreddit + ': ' + str(len(batch)) + ' new entries written', flush=True)
+
+    run_metrics = RunMetrics()
+    try:
+        jobs = run_job_workers(settings['output'], work_in_process, (settings,), workers=settings['workers'],
+                               on_batch_written=on_batch_written, metrics=run_metrics, indexes=settings['indexes'])
+    except KeyboardInterrupt:
+        # The jobs of the stopped workers are put back into the queue, the next run continues with them
+        with JobQueue(settings['output']) as job_queue:
+            jobs = job_queue.jobs()
+
+    write_reports(run_metrics, settings)
+
+    exit_code = 0
+    for job in jobs:
+        if job['status'] == 'failed':
+            print(job['subreddit'] + ': failed after ' + str(job['attempts']) + ' attempts (' + str(job['error']) + ')', file=sys.stderr)
+            exit_code = 1
+    statuses = {}
+    for job in jobs:
+        statuses[job['status']] = statuses.get(job['status'], 0) + 1
+    print(', '.join(str(count) + ' ' + status for status, count in sorted(statuses.items())))
+
+    return exit_code
+
+
+def run_jobs(args):
+    """
+    Prints the jobs of an output's job queue, see JobQueue.jobs().
+
+    Args:
+        args (argparse.Namespace): The parsed arguments of the jobs command.
+
+    Returns:
+        int: The exit code.
+    """
+    if not os.path.exists(job_queue_path_for(args.output)):
+        raise ValueError('The output ' + args.output + ' has no job queue')
+
+    with JobQueue(args.output) as job_queue:
+        print(json.dumps(job_queue.jobs(), indent=4))
+    return 0
+
+
+def run_search(args):
+    """
+    Prints the posts of an output that match a search, see SearchIndex.search().
+
+    Args:
+        args (argparse.Namespace): The parsed arguments of the search command.
+
+    Returns:
+        int: The exit code.
+    """
+    if not os.path.exists(args.output):
+        raise ValueError('The output ' + args.output + ' does not exist')
+
+    with SearchIndex(args.output) as search_index:
+        results = search_index.search(' '.join(args.query), subreddits=args.subreddits, since=args.since, until=args.until,
+                                      min_sentiment=args.min_sentiment, max_sentiment=args.max_sentiment, limit=args.limit, raw=args.raw)
+
+    print(json.dumps(results, indent=4))
+    return 0
+
+
+def run_label(args):
+    """
+    Suggests the labels of every post in an output and stores them with their confidence.
+
+    Args:
+        args (argparse.Namespace): The parsed arguments of the label command.
+
+    Returns:
+        int: The exit code.
+    """
+    if not os.path.exists(args.output):
+        raise ValueError('The output ' + args.output + ' does not exist')
+
+    classifier = LabelClassifier(load_rules(args.rules))
+    with LabelSuggestionStore(args.output) as suggestion_store:
+        totals = suggest_labels_for_output(args.output, classifier, suggestion_store)
+
+    print(str(totals['posts']) + ' posts, ' + str(totals['suggested']) + ' with suggested labels, ' + str(totals['confident'])
+          + ' confident enough to skip manual labeling (' + label_suggestions_path_for(args.output) + ')')
+    return 0
+
+
+def run_rollups(args):
+    """
+    Prints the rollups of an output, see RollupStore.query().
+
+    Args:
+        args (argparse.Namespace): The parsed arguments of the rollups command.
+
+    Returns:
+        int: The exit code.
+    """
+    if not os.path.exists(args.output):
+        raise ValueError('The output ' + args.output + ' does not exist')
+
+    with RollupStore(args.output) as rollup_store:
+        results = rollup_store.query(dimension=args.dimension, subreddits=args.subreddits, since=args.since, until=args.until,
+                                     labels=args.labels, group_by=tuple(args.group_by))
+
+    print(json.dumps(results, indent=4))
+    return 0
+
+
+def run_compact(args):
+    """
+    Compacts a CSV output, see compact_csv().
+
+    Args:
+        args (argparse.Namespace): The parsed arguments of the compact command.
+
+    Returns:
+        int: The exit code.
+    """
+    totals = compact_csv(args.output, chunk_rows=args.chunk_rows)
+    print(str(totals['rows']) + ' rows read, ' + str(totals['kept']) + ' kept, ' + str(totals['duplicates']) + ' duplicates removed')
+    return 0
+
+
+def run(argv):
+    """
+    Runs the headless command line.
+
+    Args:
+        argv (list): The arguments, without the program name.
+
+    Returns:
+        int: The exit code.
+    """
+    args = build_parser().parse_args(argv)
+
+    try:
+        if args.command == 'scrape':
+            return run_scrape(load_scrape_settings(args))
+        if args.command == 'stream':
+            return run_stream(load_scrape_settings(args, STREAM_DEFAULTS))
+        if args.command == 'refresh':
+            return run_refresh(load_scrape_settings(args, REFRESH_DEFAULTS))
+        if args.command == 'enqueue':
+            return run_enqueue(load_scrape_settings(args, ENQUEUE_DEFAULTS))
+        if args.command == 'work':
+            return run_work(load_scrape_settings(args, WORK_DEFAULTS))
+        if args.command == 'jobs':
+            return run_jobs(args)
+        if args.command == 'search':
+            return run_search(args)
+        if args.command == 'label':
+            return run_label(args)
+        if args.command == 'rollups':
+            return run_rollups(args)
+        if args.command == 'compact':
+            return run_compact(args)
+    except ValueError as e:
+        print('Error: ' + str(e), file=sys.stderr)
+        return 2
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(run(sys.argv[1:]))
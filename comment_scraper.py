@@ -0,0 +1,403 @@
+import sqlite3
+import threading
+import time
+from collections import deque
+
+from pipeline import DEFAULT_BATCH_SIZE, add_sentiment, batched
+from records import CommentRecord
+from writers import open_comment_writer
+
+# The amount of "load more comments" stubs expanded per post, every expansion is one request for up to 100 comments
+DEFAULT_MORE_BUDGET = 32
+
+# The most comments taken from a single post, which keeps megathreads from dominating a scrape
+DEFAULT_MAX_COMMENTS_PER_POST = 5000
+
+# The amount of queued posts whose comments are scraped and written before they are dropped from the queue
+COMMENT_QUEUE_CHUNK = 25
+
+# How long the background comment scrape waits for new posts before it looks at the queue again
+COMMENT_POLL_SECONDS = 1.0
+
+
+def _walk_comments(submission, budget, metrics=None):
+    # Yields every comment with its depth, breadth first, expanding stubs while budget['more'] lasts
+    # and counting the stubs it had to leave in budget['skipped']
+    from praw.models import MoreComments
+
+    start = time.perf_counter()
+    # The first access loads the comment page of the submission
+    queue = deque((comment, 0) for comment in submission.comments)
+    if metrics is not None:
+        metrics.add_time('comments', time.perf_counter() - start)
+
+    while queue:
+        comment, depth = queue.popleft()
+
+        if isinstance(comment, MoreComments):
+            if budget['more'] <= 0:
+                budget['skipped'] += 1
+                continue
+            budget['more'] -= 1
+
+            start = time.perf_counter()
+            # The loaded comments come as a flat list, where replies follow the comment they reply to
+            loaded_depths = {}
+            for child in comment.comments():
+                child_depth = loaded_depths[child.parent_id] + 1 if child.parent_id in loaded_depths else depth
+                if not isinstance(child, MoreComments):
+                    loaded_depths[child.fullname] = child_depth
+                queue.append((child, child_depth))
+            if metrics is not None:
+                metrics.add_time('comments', time.perf_counter() - start)
+            continue
+
+        yield comment, depth
+        queue.extend((reply, depth + 1) for reply in comment.replies)
+
+
+def iter_comments(submission, more_budget=DEFAULT_MORE_BUDGET, max_comments=DEFAULT_MAX_COMMENTS_PER_POST, metrics=None):
+    """
+    Walks the comment forest of a submission breadth first and yields every comment as a record.
+
+    Unlike replace_more(), the expanded "load more comments" stubs aren't inserted back into the forest: their
+    comments are queued, yielded and then dropped. Only the queue of comments that haven't been yielded yet is
+    kept in memory, so even megathreads with tens of thousands of comments stay within a bounded amount of
+    memory. Every stub costs one request that loads a batch of up to 100 comments, and at most more_budget
+    of them are expanded per post.
+
+    Args:
+        submission (Submission): The submission whose comments are walked.
+        more_budget (int, optional): The amount of stubs that may be expanded. Defaults to DEFAULT_MORE_BUDGET.
+        max_comments (int, optional): The most comments yielded, None for no limit. Defaults to DEFAULT_MAX_COMMENTS_PER_POST.
+        metrics (RunMetrics, optional): Gets the time spent loading comments as the 'comments' stage. Defaults to None.
+
+    Yields:
+        CommentRecord: The record of a comment, without the sentiment filled in.
+    """
+    yielded = 0
+
+    for comment, depth in _walk_comments(submission, {"more": more_budget, "skipped": 0}, metrics=metrics):
+        yield CommentRecord.from_comment(comment, depth=depth)
+        yielded += 1
+        if max_comments is not None and yielded >= max_comments:
+            return
+
+
+def count_comments(submission, more_budget=DEFAULT_MORE_BUDGET, metrics=None):
+    """
+    Counts the comments of a submission by walking its comment forest, see iter_comments().
+
+    Args:
+        submission (Submission): The submission whose comments are counted.
+        more_budget (int, optional): The amount of "load more comments" stubs that may be expanded. Defaults to DEFAULT_MORE_BUDGET.
+        metrics (RunMetrics, optional): Gets the time spent loading comments as the 'comments' stage. Defaults to None.
+
+    Returns:
+        tuple: The amount of comments and whether that is all of them, False when the budget ran out before every stub was expanded.
+    """
+    budget = {"more": more_budget, "skipped": 0}
+    count = sum(1 for _ in _walk_comments(submission, budget, metrics=metrics))
+    return count, budget['skipped'] == 0
+
+
+def scrape_comments(make_client, post_ids, output_filename, sentiment_engine=None, more_budget=DEFAULT_MORE_BUDGET,
+                    max_comments_per_post=DEFAULT_MAX_COMMENTS_PER_POST, batch_size=DEFAULT_BATCH_SIZE, on_batch_written=None, scheduler=None, metrics=None):
+    """
+    Scrapes the comments of posts into the comment output that belongs to an output (see comments_output_for()).
+
+    The comments go through the sentiment engine and are written in batches while they are walked, so a
+    batch is the most that is held in memory besides the walk of the current post.
+
+    Args:
+        make_client (callable): Creates a new praw.Reddit instance, keyword arguments are passed on to praw.Reddit.
+        post_ids (iterable): The IDs of the posts whose comments are scraped.
+        output_filename (str): The output of the posts.
+        sentiment_engine (SentimentEngine, optional): The engine that scores the comments, None leaves the sentiment empty. Defaults to None.
+        more_budget (int, optional): The amount of "load more comments" stubs expanded per post. Defaults to DEFAULT_MORE_BUDGET.
+        max_comments_per_post (int, optional): The most comments taken from a post. Defaults to DEFAULT_MAX_COMMENTS_PER_POST.
+        batch_size (int, optional): The amount of comments written at once. Defaults to DEFAULT_BATCH_SIZE.
+        on_batch_written (callable, optional): Gets called with every batch after it was written. Defaults to None.
+        scheduler (RateLimitScheduler, optional): The scheduler that shares the rate limit with a scrape running at the same time. Defaults to None.
+        metrics (RunMetrics, optional): Collects the stage timings and request counters. Defaults to None.
+
+    Returns:
+        int: The amount of comments that were written.
+    """
+    # Imported here, so prawcore is only loaded once there is something to scrape
+    from scheduler import SchedulingRequestor
+
+    reddit = make_client(requestor_class=SchedulingRequestor, requestor_kwargs={"scheduler": scheduler, "job_id": "comments", "metrics": metrics})
+
+    def all_comments():
+        for post_id in post_ids:
+            yield from iter_comments(reddit.submission(id=post_id), more_budget=more_budget, max_comments=max_comments_per_post, metrics=metrics)
+
+    records = all_comments()
+    if sentiment_engine is not None:
+        records = add_sentiment(records, sentiment_engine, batch_size, metrics=metrics, text_field='body')
+
+    total_written = 0
+
+    with open_comment_writer(output_filename) as writer:
+        for batch in batched(records, batch_size):
+            start = time.perf_counter()
+            written = writer.write_batch(batch)
+            total_written += written
+            if metrics is not None:
+                metrics.add_time('write', time.perf_counter() - start)
+                metrics.count('comments', written)
+            if on_batch_written is not None:
+                on_batch_written(batch)
+
+    return total_written
+
+
+def comment_queue_path_for(output_filename):
+    """
+    Returns the location of the queue of posts whose comments still have to be scraped.
+
+    Args:
+        output_filename (str): The path to the output of the posts.
+
+    Returns:
+        str: The path to the queue database next to the output.
+    """
+    return output_filename + '.comment_queue.sqlite'
+
+
+class CommentQueue:
+    """
+    The CommentQueue class keeps the IDs of the written posts whose comments haven't been scraped yet.
+
+    The IDs are kept in SQLite instead of memory, so a long scrape doesn't collect every post ID it wrote,
+    and the posts of a run that was stopped before their comments were scraped are still queued next time.
+
+    Example Usage:
+    ```python
+    with CommentQueue("output.csv") as comment_queue:
+        comment_queue.add(["abc123"])
+        post_ids = comment_queue.oldest(25)
+        ...
+        comment_queue.remove(post_ids)
+    ```
+    """
+
+    def __init__(self, output_filename):
+        """
+        Opens (or creates) the comment queue of an output.
+
+        Args:
+            output_filename (str): The path to the output of the posts.
+
+        Returns:
+            None
+        """
+        # The scrape adds posts while the background comment scrape takes them, so access is serialized with a lock
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(comment_queue_path_for(output_filename), check_same_thread=False)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS comment_queue (id INTEGER PRIMARY KEY, post_id TEXT NOT NULL UNIQUE)')
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM comment_queue').fetchone()[0]
+
+    def add(self, post_ids):
+        """
+        Queues posts, a post that is already queued keeps its place.
+
+        Args:
+            post_ids (iterable): The IDs of the posts.
+
+        Returns:
+            None
+        """
+        with self.lock, self.connection:
+            self.connection.executemany('INSERT OR IGNORE INTO comment_queue (post_id) VALUES (?)', ((str(post_id),) for post_id in post_ids))
+
+    def oldest(self, limit):
+        """
+        Returns the posts that were queued first.
+
+        Args:
+            limit (int): The most post IDs returned.
+
+        Returns:
+            list: The post IDs.
+        """
+        with self.lock:
+            return [row[0] for row in self.connection.execute('SELECT post_id FROM comment_queue ORDER BY id LIMIT ?', (limit,))]
+
+    def remove(self, post_ids):
+        """
+        Drops posts whose comments are written.
+
+        Args:
+            post_ids (iterable): The IDs of the posts.
+
+        Returns:
+            None
+        """
+        with self.lock, self.connection:
+            self.connection.executemany('DELETE FROM comment_queue WHERE post_id = ?', ((str(post_id),) for post_id in post_ids))
+
+    def close(self):
+        """
+        Closes the queue database.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        self.connection.close()
+
+
+class BackgroundCommentScraper:
+    """
+    The BackgroundCommentScraper class scrapes the comments of written posts on its own thread while the scrape of the posts goes on.
+
+    Posts are queued in the output's CommentQueue and their comments are scraped COMMENT_QUEUE_CHUNK posts at
+    a time, so writing the posts never waits for their comments. A post is only dropped from the queue once
+    its comments are written. Leaving the with block normally waits until the queue is empty, leaving it with
+    an error (or Ctrl+C) stops after the current chunk and keeps the rest queued for the next run, which also
+    picks up anything an earlier run left behind.
+
+    Example Usage:
+    ```python
+    with BackgroundCommentScraper(make_client, "output.csv", sentiment_engine) as comment_scraper:
+        for batch in batches:
+            writer.write_batch(batch)
+            comment_scraper.add([record.post_id for record in batch])
+    print(comment_scraper.written)
+    ```
+    """
+
+    def __init__(self, make_client, output_filename, sentiment_engine=None, more_budget=DEFAULT_MORE_BUDGET, max_comments_per_post=DEFAULT_MAX_COMMENTS_PER_POST,
+                 scheduler=None, metrics=None):
+        """
+        Opens the comment queue of the output and starts the thread that works on it.
+
+        Args:
+            make_client (callable): Creates a new praw.Reddit instance, keyword arguments are passed on to praw.Reddit.
+            output_filename (str): The output of the posts.
+            sentiment_engine (SentimentEngine, optional): The engine that scores the comments, None leaves the sentiment empty. Defaults to None.
+            more_budget (int, optional): The amount of "load more comments" stubs expanded per post. Defaults to DEFAULT_MORE_BUDGET.
+            max_comments_per_post (int, optional): The most comments taken from a post. Defaults to DEFAULT_MAX_COMMENTS_PER_POST.
+            scheduler (RateLimitScheduler, optional): The scheduler the scrape of the posts uses, so both share one rate limit. Defaults to None.
+            metrics (RunMetrics, optional): Collects the stage timings and request counters. Defaults to None.
+
+        Returns:
+            None
+        """
+        self.make_client = make_client
+        self.output_filename = output_filename
+        self.sentiment_engine = sentiment_engine
+        self.more_budget = more_budget
+        self.max_comments_per_post = max_comments_per_post
+        self.scheduler = scheduler
+        self.metrics = metrics
+        self.comment_queue = CommentQueue(output_filename)
+        self.written = 0
+        self.error = None
+        self.finishing = threading.Event()
+        self.stopping = threading.Event()
+        self.wake_up = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.finish()
+        else:
+            self.stop()
+
+    def add(self, post_ids):
+        """
+        Queues the posts whose comments should be scraped.
+
+        Args:
+            post_ids (iterable): The IDs of the written posts.
+
+        Returns:
+            None
+        """
+        self.comment_queue.add(post_ids)
+        self.wake_up.set()
+
+    def _run(self):
+        try:
+            while not self.stopping.is_set():
+                post_ids = self.comment_queue.oldest(COMMENT_QUEUE_CHUNK)
+                if not post_ids:
+                    if self.finishing.is_set():
+                        return
+                    self.wake_up.wait(COMMENT_POLL_SECONDS)
+                    self.wake_up.clear()
+                    continue
+
+                self.written += scrape_comments(self.make_client, post_ids, self.output_filename, self.sentiment_engine, more_budget=self.more_budget,
+                                                max_comments_per_post=self.max_comments_per_post, scheduler=self.scheduler, metrics=self.metrics)
+                self.comment_queue.remove(post_ids)
+        except Exception as e:
+            # The posts stay queued, finish() raises the error on the thread that waits for the comments
+            self.error = e
+        finally:
+            if self.scheduler is not None:
+                self.scheduler.forget_job("comments")
+
+    def pending(self):
+        """
+        Counts the posts whose comments haven't been written yet.
+
+        Args:
+            None
+
+        Returns:
+            int: The amount of queued posts.
+        """
+        return len(self.comment_queue)
+
+    def finish(self):
+        """
+        Waits until the comments of every queued post are written.
+
+        Args:
+            None
+
+        Returns:
+            int: The amount of comments that were written.
+        """
+        self.finishing.set()
+        self.wake_up.set()
+        self.thread.join()
+        self.comment_queue.close()
+        if self.error is not None:
+            raise self.error
+        return self.written
+
+    def stop(self):
+        """
+        Stops once the current chunk of posts is written, the remaining posts stay queued for the next run.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        self.stopping.set()
+        self.wake_up.set()
+        self.thread.join()
+        self.comment_queue.close()
@@ -0,0 +1,130 @@
+import csv
+import os
+import sqlite3
+
+from body_store import BODY_HASH_COLUMN, HASHED_CSV_COLUMN_ORDER
+from pipeline import CSV_COLUMN_ORDER, batched
+from writers import is_parquet_output, is_sqlite_output, read_csv_column_order
+
+# The amount of rows read, looked up and written at once
+DEFAULT_COMPACT_CHUNK_ROWS = 10000
+
+
+def compaction_index_path_for(csv_filename):
+    """
+    Returns the location of the temporary index a compaction keeps while it runs.
+
+    Args:
+        csv_filename (str): The path to the CSV file.
+
+    Returns:
+        str: The path to the index database next to the CSV file.
+    """
+    return csv_filename + '.compact.sqlite'
+
+
+def _iter_csv_rows(csv_filename):
+    # The rows as the file has them, so no value is lost by turning it into a record and back
+    with open(csv_filename, 'r', encoding='utf-8', newline='') as csvfile:
+        reader = csv.reader(csvfile)
+        next(reader, None)
+        yield from reader
+
+
+def compact_csv(csv_filename, chunk_rows=DEFAULT_COMPACT_CHUNK_ROWS):
+    """
+    Rewrites a CSV file with every post only once and in the current column order.
+
+    The file is read twice, chunk_rows rows at a time, so files larger than the memory can be compacted. The
+    first pass remembers the row of the latest scrape of every post ID in a SQLite index on disk, the second
+    pass writes only those rows (and rows without a post ID) to a temporary file. Labels of an older scrape
+    are kept when the latest one has none, like the SQLite output does. The temporary file replaces the CSV
+    once it is complete, so an interrupted compaction leaves the original untouched. Nothing may write to the
+    file while it is compacted.
+
+    Files in the old column order or with the old 'platform' header are rewritten in CSV_COLUMN_ORDER, files
+    whose bodies are in a body store keep it and are rewritten in HASHED_CSV_COLUMN_ORDER. Columns that aren't
+    part of that order are kept after it, and every value is copied exactly as the file has it.
+
+    Args:
+        csv_filename (str): The CSV file to compact.
+        chunk_rows (int, optional): The amount of rows handled at once. Defaults to DEFAULT_COMPACT_CHUNK_ROWS.
+
+    Returns:
+        dict: The amount of rows read, the rows kept and the duplicate rows that were dropped.
+    """
+    if is_sqlite_output(csv_filename) or is_parquet_output(csv_filename):
+        raise ValueError('Only CSV outputs can be compacted, ' + csv_filename + ' already holds every post once')
+    column_order = read_csv_column_order(csv_filename)
+    if column_order is None:
+        raise ValueError('The output ' + csv_filename + ' does not exist or is empty')
+
+    canonical_column_order = HASHED_CSV_COLUMN_ORDER if BODY_HASH_COLUMN in column_order else CSV_COLUMN_ORDER
+    output_column_order = canonical_column_order + [column for column in column_order if column not in canonical_column_order]
+    index_path = compaction_index_path_for(csv_filename)
+    temporary_path = csv_filename + '.compact.tmp'
+    if os.path.exists(index_path):
+        # Left behind by an interrupted compaction
+        os.remove(index_path)
+
+    connection = sqlite3.connect(index_path)
+    try:
+        connection.execute('CREATE TABLE latest (post_id TEXT PRIMARY KEY, row INTEGER NOT NULL, subject TEXT, problem TEXT)')
+        connection.execute('CREATE INDEX latest_row ON latest (row)')
+
+        # First pass: the row of the latest scrape of every post, and the latest labels it had
+        read_rows = 0
+        for chunk in batched(_iter_csv_rows(csv_filename), chunk_rows):
+            values = [dict(zip(column_order, row)) for row in chunk]
+            connection.executemany(
+                'INSERT INTO latest (post_id, row, subject, problem) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (post_id) DO UPDATE SET row = excluded.row, '
+                'subject = COALESCE(excluded.subject, subject), problem = COALESCE(excluded.problem, problem)',
+                [(row['post_id'], read_rows + offset, row.get('subject') or None, row.get('problem') or None)
+                 for offset, row in enumerate(values) if row.get('post_id')]
+            )
+            read_rows += len(chunk)
+        connection.commit()
+
+        # Second pass: only the rows the index points at are written
+        kept_rows = 0
+        first_row = 0
+        with open(temporary_path, 'w', encoding='utf-8', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(output_column_order)
+
+            for chunk in batched(_iter_csv_rows(csv_filename), chunk_rows):
+                latest = {
+                    row: (subject, problem) for row, subject, problem in connection.execute(
+                        'SELECT row, subject, problem FROM latest WHERE row BETWEEN ? AND ?', (first_row, first_row + len(chunk) - 1))
+                }
+
+                kept = []
+                for offset, row in enumerate(chunk):
+                    values = dict(zip(column_order, row))
+                    if values.get('post_id'):
+                        labels = latest.get(first_row + offset)
+                        if labels is None:
+                            continue
+                        if not values.get('subject') and labels[0]:
+                            values['subject'] = labels[0]
+                        if not values.get('problem') and labels[1]:
+                            values['problem'] = labels[1]
+                    kept.append([values.get(column, '') for column in output_column_order])
+
+                writer.writerows(kept)
+                kept_rows += len(kept)
+                first_row += len(chunk)
+
+            file.flush()
+            os.fsync(file.fileno())
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+    finally:
+        connection.close()
+        os.remove(index_path)
+
+    os.replace(temporary_path, csv_filename)
+    return {"rows": read_rows, "kept": kept_rows, "duplicates": read_rows - kept_rows}
@@ -0,0 +1,346 @@
+import hashlib
+import json
+import os
+import time
+
+# How long a subreddit lookup is trusted before it is checked again
+SUBREDDIT_CACHE_TTL_SECONDS = 24 * 60 * 60
+
+# Subreddits that didn't exist are checked again sooner, they might have been created since
+MISSING_SUBREDDIT_CACHE_TTL_SECONDS = 60 * 60
+
+# A cached token is only reused when it stays valid for at least this long
+TOKEN_EXPIRY_MARGIN_SECONDS = 60
+
+
+def config_dir():
+    """
+    Returns the directory the scraper keeps its profiles and caches in, creating it if needed.
+
+    On Windows this is %APPDATA%\\redditscraper (where the profiles have always been saved), elsewhere it
+    is $XDG_CONFIG_HOME/redditscraper or ~/.config/redditscraper.
+
+    Args:
+        None
+
+    Returns:
+        str: The path to the directory.
+    """
+    if os.getenv('APPDATA'):
+        base_dir = os.getenv('APPDATA')
+    else:
+        base_dir = os.getenv('XDG_CONFIG_HOME') or os.path.join(os.path.expanduser('~'), '.config')
+
+    directory = os.path.join(base_dir, 'redditscraper')
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def _read_json(file_name):
+    path = os.path.join(config_dir(), file_name)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r') as file:
+            return json.load(file)
+    except ValueError:
+        # A broken cache is the same as an empty one
+        return {}
+
+
+def _write_json(file_name, data):
+    path = os.path.join(config_dir(), file_name)
+    temporary_path = path + '.tmp'
+    # The files hold secrets, so only the current user may read them
+    with open(os.open(temporary_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as file:
+        json.dump(data, file, indent=4)
+    os.replace(temporary_path, path)
+
+
+def load_profiles():
+    """
+    Reads every saved login profile.
+
+    Args:
+        None
+
+    Returns:
+        dict: A dictionary where each key is a profile name and the value holds its client_id and client_secret.
+    """
+    return _read_json('login_details.json')
+
+
+def save_profile(profile_name, client_id, client_secret):
+    """
+    Saves (or replaces) a login profile.
+
+    Args:
+        profile_name (str): The name of the profile.
+        client_id (str): The Reddit API client ID.
+        client_secret (str): The Reddit API client secret.
+
+    Returns:
+        None
+    """
+    profiles = load_profiles()
+    profiles[profile_name] = {
+        'client_id': client_id,
+        'client_secret': client_secret
+    }
+    _write_json('login_details.json', profiles)
+
+
+def load_last_login():
+    """
+    Reads which profile and user agent were used for the last successful login.
+
+    Args:
+        None
+
+    Returns:
+        dict: The 'profile' and 'user_agent', empty if nobody logged in with a profile yet.
+    """
+    return _read_json('last_login.json')
+
+
+def remember_last_login(profile_name, user_agent):
+    """
+    Remembers the profile and user agent of a successful login, so the next login can preselect them.
+
+    Args:
+        profile_name (str): The name of the profile.
+        user_agent (str): The user agent that was entered.
+
+    Returns:
+        None
+    """
+    _write_json('last_login.json', {
+        'profile': profile_name,
+        'user_agent': user_agent
+    })
+
+
+def _authorizer(reddit):
+    # Only read-only (client credentials) logins are used, their token lives in the read-only core
+    core = getattr(reddit, '_read_only_core', None)
+    return getattr(core, '_authorizer', None)
+
+
+def _token_expires_at(authorizer):
+    # prawcore has kept the expiry as a wall clock timestamp and, in newer versions, as monotonic nanoseconds
+    if getattr(authorizer, '_expiration_timestamp_ns', None) is not None:
+        return time.time() + (authorizer._expiration_timestamp_ns - time.monotonic_ns()) / 1e9
+    if getattr(authorizer, '_expiration_timestamp', None) is not None:
+        return authorizer._expiration_timestamp
+    return None
+
+
+def _uses_monotonic_expiry(authorizer):
+    # prawcore 3 and newer keep the expiry in monotonic nanoseconds. A fresh authorizer only declares that
+    # attribute without setting it, so the installed version and the class annotations are checked instead.
+    try:
+        import prawcore
+        if int(prawcore.__version__.split('.')[0]) >= 3:
+            return True
+    except (ImportError, AttributeError, ValueError):
+        pass
+    return any('_expiration_timestamp_ns' in getattr(cls, '__annotations__', {}) for cls in type(authorizer).__mro__)
+
+
+def _set_token(authorizer, access_token, expires_at):
+    authorizer.access_token = access_token
+    if _uses_monotonic_expiry(authorizer):
+        authorizer._expiration_timestamp_ns = time.monotonic_ns() + int((expires_at - time.time()) * 1e9)
+    else:
+        authorizer._expiration_timestamp = expires_at
+
+
+def _token_cache_key(client_id, client_secret):
+    # A token is only handed out for the secret it was requested with, so a wrong secret isn't taken for a valid login
+    return hashlib.sha256((str(client_id) + '\0' + str(client_secret or '')).encode('utf-8')).hexdigest()
+
+
+def restore_cached_token(reddit, client_id, client_secret):
+    """
+    Hands a cached OAuth token of the client ID and secret to a new Reddit client, so it doesn't have to request one.
+
+    Args:
+        reddit (praw.Reddit): The new client.
+        client_id (str): The client ID the token belongs to.
+        client_secret (str): The client secret the token was requested with.
+
+    Returns:
+        bool: True if a token that is still valid was restored.
+    """
+    cached_token = _read_json('token_cache.json').get(_token_cache_key(client_id, client_secret))
+    authorizer = _authorizer(reddit)
+
+    if authorizer is None or cached_token is None:
+        return False
+    if cached_token['expires_at'] - TOKEN_EXPIRY_MARGIN_SECONDS <= time.time():
+        return False
+
+    _set_token(authorizer, cached_token['access_token'], cached_token['expires_at'])
+    return True
+
+
+def cache_token(reddit, client_id, client_secret):
+    """
+    Saves the OAuth token of a Reddit client until it expires.
+
+    Args:
+        reddit (praw.Reddit): The client that holds a token.
+        client_id (str): The client ID the token belongs to.
+        client_secret (str): The client secret the token was requested with.
+
+    Returns:
+        None
+    """
+    authorizer = _authorizer(reddit)
+    if authorizer is None or not getattr(authorizer, 'access_token', None):
+        return
+
+    expires_at = _token_expires_at(authorizer)
+    if expires_at is None:
+        return
+
+    token_cache = _read_json('token_cache.json')
+    # Expired tokens of other profiles are dropped while the file is rewritten anyway
+    token_cache = {key: value for key, value in token_cache.items() if value.get('expires_at', 0) > time.time()}
+    token_cache[_token_cache_key(client_id, client_secret)] = {
+        'access_token': authorizer.access_token,
+        'expires_at': expires_at
+    }
+    _write_json('token_cache.json', token_cache)
+
+
+def validate_credentials(reddit, client_id, client_secret):
+    """
+    Makes sure a Reddit client can log in, with at most one cheap request.
+
+    A cached token of the same client ID and secret that is still valid is used without any request.
+    Otherwise a new token is requested, which is the cheapest call that proves the client ID and secret
+    are correct, and it is cached.
+
+    Args:
+        reddit (praw.Reddit): The client to validate.
+        client_id (str): The client ID of the client.
+        client_secret (str): The client secret of the client.
+
+    Returns:
+        bool: True if the credentials work.
+    """
+    if restore_cached_token(reddit, client_id, client_secret):
+        return True
+
+    authorizer = _authorizer(reddit)
+
+    try:
+        if authorizer is not None:
+            authorizer.refresh()
+        else:
+            # Not a read-only client, fall back to a real request
+            next(iter(reddit.subreddit('python').hot(limit=1)))
+    except Exception:
+        return False
+
+    cache_token(reddit, client_id, client_secret)
+    return True
+
+
+class SubredditCache:
+    """
+    The SubredditCache class remembers which subreddits exist, and their metadata, for a while.
+
+    Repeated runs over the same subreddits look them up here instead of asking Reddit every time. Lookups
+    of subreddits that exist are trusted for SUBREDDIT_CACHE_TTL_SECONDS, missing ones for
+    MISSING_SUBREDDIT_CACHE_TTL_SECONDS.
+
+    Example Usage:
+    ```python
+    cache = SubredditCache()
+    entry = cache.get("python")
+    if entry is None:
+        cache.put("python", True, {"subscribers": 1000})
+    ```
+    """
+
+    def __init__(self):
+        self.entries = _read_json('subreddit_cache.json')
+
+    def get(self, subreddit_name):
+        """
+        Returns the cached lookup of a subreddit.
+
+        Args:
+            subreddit_name (str): The name of the subreddit.
+
+        Returns:
+            dict: The entry with 'exists', 'checked_at' and 'metadata', or None if there is no fresh entry.
+        """
+        entry = self.entries.get(subreddit_name.lower())
+        if entry is None:
+            return None
+
+        ttl = SUBREDDIT_CACHE_TTL_SECONDS if entry['exists'] else MISSING_SUBREDDIT_CACHE_TTL_SECONDS
+        if entry['checked_at'] + ttl < time.time():
+            return None
+
+        return entry
+
+    def put(self, subreddit_name, exists, metadata=None):
+        """
+        Stores the lookup of a subreddit.
+
+        Args:
+            subreddit_name (str): The name of the subreddit.
+            exists (bool): Whether the subreddit exists.
+            metadata (dict, optional): Extra information about the subreddit. Defaults to None.
+
+        Returns:
+            None
+        """
+        self.entries[subreddit_name.lower()] = {
+            'exists': exists,
+            'checked_at': time.time(),
+            'metadata': metadata or {}
+        }
+        _write_json('subreddit_cache.json', self.entries)
+
+
+def lookup_subreddit(reddit, subreddit_name, cache=None):
+    """
+    Checks whether a subreddit exists, using the cache when it has a fresh answer.
+
+    A miss costs a single request for the subreddit's about page, which also gives its metadata.
+
+    Args:
+        reddit (praw.Reddit): The client used on a cache miss.
+        subreddit_name (str): The name of the subreddit.
+        cache (SubredditCache, optional): The cache to use. Defaults to a newly loaded cache.
+
+    Returns:
+        dict: The entry with 'exists', 'checked_at' and 'metadata'.
+    """
+    import prawcore
+
+    if cache is None:
+        cache = SubredditCache()
+
+    entry = cache.get(subreddit_name)
+    if entry is not None:
+        return entry
+
+    subreddit = reddit.subreddit(subreddit_name)
+    try:
+        # Reading an attribute loads the about page
+        metadata = {
+            'display_name': subreddit.display_name,
+            'subscribers': subreddit.subscribers,
+            'over18': subreddit.over18
+        }
+        cache.put(subreddit_name, True, metadata)
+    except (prawcore.exceptions.NotFound, prawcore.exceptions.Redirect, prawcore.exceptions.Forbidden):
+        cache.put(subreddit_name, False)
+
+    return cache.get(subreddit_name)
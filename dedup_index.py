@@ -0,0 +1,222 @@
+import csv
+import io
+import os
+import sqlite3
+import threading
+
+from writers import is_parquet_output, is_sqlite_output, read_posts_version
+
+
+def index_path_for(csv_filename):
+    """
+    Returns the location of the post ID index that belongs to an output file.
+
+    Args:
+        csv_filename (str): The path to the output file.
+
+    Returns:
+        str: The path to the index database next to the output file.
+    """
+    return csv_filename + '.ids.sqlite'
+
+
+def output_version(output_filename):
+    """
+    Returns a number that changes whenever the posts of an output change, which tells the indexes whether they are stale.
+
+    CSV files are only ever appended to, so their size is used, which is also where reading new rows continues.
+    SQLite outputs count every change to their posts table (see SqliteRecordWriter), so in place updates are
+    noticed and writes to other tables, like the comments, are not. Parquet datasets count their writes the same
+    way (see ParquetRecordWriter), so finding out whether one changed doesn't list all of its files.
+
+    Args:
+        output_filename (str): The path to the output file or dataset directory.
+
+    Returns:
+        int: The version of the output.
+    """
+    if is_sqlite_output(output_filename):
+        return read_posts_version(output_filename)
+    if is_parquet_output(output_filename):
+        # Imported here, so only Parquet outputs load the Parquet module
+        from parquet_export import read_dataset_version
+        return read_dataset_version(output_filename)
+    return os.path.getsize(output_filename)
+
+
+class PostIdIndex:
+    """
+    The PostIdIndex class keeps a persistent set of every post ID that is already stored in an output file.
+
+    The IDs live in a SQLite table with the post ID as primary key, so a lookup is a single index search
+    and nothing has to be loaded into memory. The version of the output (see output_version()) is remembered
+    after every write; when a CSV file has grown behind the index's back only the new rows are read, and when
+    it shrank or was replaced the index is rebuilt from scratch.
+
+    Example Usage:
+    ```python
+    with PostIdIndex("output.csv") as index:
+        if "abc123" not in index:
+            ...
+        index.record_written(["abc123"])
+    ```
+    """
+
+    def __init__(self, csv_filename, column_name='post_id', read_only=False):
+        """
+        Opens (or creates) the index of an output file and brings it up to date with the file.
+
+        Args:
+            csv_filename (str): The path to the output file.
+            column_name (str, optional): The name of the column holding the post IDs. Defaults to 'post_id'.
+            read_only (bool, optional): Whether the index is only looked up, for processes that don't write the output. It is
+                then neither created nor synced, the process writing the output keeps it up to date. Defaults to False.
+
+        Returns:
+            None
+        """
+        self.csv_filename = csv_filename
+        self.column_name = column_name
+        # Concurrent scrape jobs look up IDs from their own threads, so access is serialized with a lock
+        self.lock = threading.Lock()
+
+        if read_only:
+            if os.path.exists(index_path_for(csv_filename)):
+                self.connection = sqlite3.connect('file:' + index_path_for(csv_filename) + '?mode=ro', uri=True, check_same_thread=False)
+            else:
+                # Nothing was written yet, so no post is known
+                self.connection = sqlite3.connect(':memory:', check_same_thread=False)
+                self.connection.execute('CREATE TABLE post_ids (post_id TEXT PRIMARY KEY) WITHOUT ROWID')
+            return
+
+        self.connection = sqlite3.connect(index_path_for(csv_filename), check_same_thread=False)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS post_ids (post_id TEXT PRIMARY KEY) WITHOUT ROWID')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)')
+        self.connection.commit()
+        self.sync()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __contains__(self, post_id):
+        with self.lock:
+            row = self.connection.execute('SELECT 1 FROM post_ids WHERE post_id = ?', (str(post_id),)).fetchone()
+        return row is not None
+
+    def __iter__(self):
+        with self.lock:
+            post_ids = [row[0] for row in self.connection.execute('SELECT post_id FROM post_ids')]
+        return iter(post_ids)
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM post_ids').fetchone()[0]
+
+    def _synced_version(self):
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'synced_version'").fetchone()
+        return row[0] if row else None
+
+    def _set_synced_version(self, version):
+        self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('synced_version', ?)", (version,))
+
+    def sync(self):
+        """
+        Reads the rows of the output file that the index doesn't know about yet.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        if not os.path.exists(self.csv_filename):
+            return
+
+        # For a CSV file the version is its size, so it is also the offset the new rows start at
+        current_size = output_version(self.csv_filename)
+        synced_size = self._synced_version()
+
+        if synced_size == current_size:
+            return
+
+        if synced_size is None or synced_size > current_size:
+            # The file is new to the index or was rewritten, so start over
+            self.connection.execute('DELETE FROM post_ids')
+            synced_size = 0
+
+        if is_sqlite_output(self.csv_filename):
+            self._sync_from_database(current_size)
+            return
+
+        if is_parquet_output(self.csv_filename):
+            # Parquet files can't be appended to, so the whole dataset is read again (only its post_id column)
+            from parquet_export import iter_dataset_post_ids
+            self.connection.execute('DELETE FROM post_ids')
+            self.connection.executemany('INSERT OR IGNORE INTO post_ids (post_id) VALUES (?)', ((post_id,) for post_id in iter_dataset_post_ids(self.csv_filename)))
+            self._set_synced_version(current_size)
+            self.connection.commit()
+            return
+
+        with open(self.csv_filename, 'r', encoding='utf-8', newline='') as csvfile:
+            header = next(csv.reader(csvfile), None)
+
+        if header is not None and self.column_name in header:
+            column_position = header.index(self.column_name)
+
+            with open(self.csv_filename, 'rb') as binary_file:
+                # Every size the index remembers ends on a row boundary, so reading can continue from there
+                binary_file.seek(synced_size)
+                reader = csv.reader(io.TextIOWrapper(binary_file, encoding='utf-8', newline=''))
+                if synced_size == 0:
+                    next(reader, None)
+
+                self.connection.executemany(
+                    'INSERT OR IGNORE INTO post_ids (post_id) VALUES (?)',
+                    ((row[column_position],) for row in reader if len(row) > column_position and row[column_position])
+                )
+
+        self._set_synced_version(current_size)
+        self.connection.commit()
+
+    def _sync_from_database(self, current_size):
+        # SQLite outputs are copied over inside SQLite, so the IDs never pass through Python
+        self.connection.execute('ATTACH DATABASE ? AS output', (self.csv_filename,))
+        try:
+            has_posts = self.connection.execute("SELECT 1 FROM output.sqlite_master WHERE type = 'table' AND name = 'posts'").fetchone()
+            if has_posts:
+                self.connection.execute('INSERT OR IGNORE INTO post_ids (post_id) SELECT post_id FROM output.posts')
+            self._set_synced_version(current_size)
+            self.connection.commit()
+        finally:
+            self.connection.execute('DETACH DATABASE output')
+
+    def record_written(self, post_ids):
+        """
+        Adds the IDs of posts that were just written to the output file.
+
+        Args:
+            post_ids (iterable): The IDs of the written posts.
+
+        Returns:
+            None
+        """
+        with self.lock:
+            self.connection.executemany('INSERT OR IGNORE INTO post_ids (post_id) VALUES (?)', ((str(post_id),) for post_id in post_ids))
+            if os.path.exists(self.csv_filename):
+                self._set_synced_version(output_version(self.csv_filename))
+            self.connection.commit()
+
+    def close(self):
+        """
+        Closes the index database.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        self.connection.close()
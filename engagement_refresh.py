@@ -0,0 +1,206 @@
+import sqlite3
+import time
+
+from pipeline import batched
+
+# The most fullnames Reddit's info endpoint answers in one request
+INFO_BATCH_SIZE = 100
+
+
+def engagement_path_for(output_filename):
+    """
+    Returns the location of the engagement history that belongs to an output file.
+
+    Args:
+        output_filename (str): The path to the output file.
+
+    Returns:
+        str: The path to the engagement database next to the output file.
+    """
+    return output_filename + '.engagement.sqlite'
+
+
+def post_status(submission):
+    """
+    Tells whether a post is still up, or was removed or deleted since it was scraped.
+
+    Only the data that came with the info response is read, reading a missing attribute of a PRAW object
+    would fetch the post again.
+
+    Args:
+        submission (Submission): The submission from the info endpoint.
+
+    Returns:
+        str: 'live', 'removed' or 'deleted'.
+    """
+    data = vars(submission)
+    removed_by_category = data.get('removed_by_category')
+    selftext = data.get('selftext')
+
+    if removed_by_category == 'deleted' or (data.get('author') is None and selftext == '[deleted]'):
+        return 'deleted'
+    if removed_by_category or selftext == '[removed]':
+        return 'removed'
+    return 'live'
+
+
+class EngagementStore:
+    """
+    The EngagementStore class keeps the history of the engagement numbers of the posts in an output.
+
+    Every refresh adds one row per post with the time of the refresh, its upvotes, comment count and status,
+    so the decay of a post can be followed over time. The output itself is left as it was scraped, the
+    latest_engagement view holds the newest numbers of every post.
+
+    Example Usage:
+    ```python
+    with EngagementStore("output.csv") as engagement:
+        engagement.record([("abc123", 42, 7, "live")])
+        engagement.latest("abc123")
+    ```
+    """
+
+    def __init__(self, output_filename):
+        """
+        Opens (or creates) the engagement history of an output file.
+
+        Args:
+            output_filename (str): The path to the output file.
+
+        Returns:
+            None
+        """
+        self.connection = sqlite3.connect(engagement_path_for(output_filename))
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS engagement ('
+            'post_id TEXT NOT NULL, '
+            'refreshed_at REAL NOT NULL, '
+            'upvotes INTEGER, '
+            'comment_count INTEGER, '
+            'status TEXT NOT NULL, '
+            'PRIMARY KEY (post_id, refreshed_at)) WITHOUT ROWID'
+        )
+        self.connection.execute(
+            'CREATE VIEW IF NOT EXISTS latest_engagement AS '
+            'SELECT post_id, MAX(refreshed_at) AS refreshed_at, upvotes, comment_count, status FROM engagement GROUP BY post_id'
+        )
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def record(self, rows, refreshed_at=None):
+        """
+        Adds the numbers of a refresh to the history.
+
+        Args:
+            rows (list): (post_id, upvotes, comment_count, status) tuples.
+            refreshed_at (float, optional): The UNIX time of the refresh. Defaults to now.
+
+        Returns:
+            None
+        """
+        if refreshed_at is None:
+            refreshed_at = time.time()
+
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO engagement (post_id, refreshed_at, upvotes, comment_count, status) VALUES (?, ?, ?, ?, ?)',
+                [(post_id, refreshed_at, upvotes, comment_count, status) for post_id, upvotes, comment_count, status in rows]
+            )
+
+    def latest(self, post_id):
+        """
+        Returns the newest numbers of a post.
+
+        Args:
+            post_id (str): The ID of the post.
+
+        Returns:
+            dict: The refreshed_at, upvotes, comment_count and status, or None if the post was never refreshed.
+        """
+        row = self.connection.execute(
+            'SELECT refreshed_at, upvotes, comment_count, status FROM latest_engagement WHERE post_id = ?', (post_id,)
+        ).fetchone()
+
+        if row is None:
+            return None
+
+        return {"refreshed_at": row[0], "upvotes": row[1], "comment_count": row[2], "status": row[3]}
+
+    def history(self, post_id):
+        """
+        Returns every refresh of a post, oldest first.
+
+        Args:
+            post_id (str): The ID of the post.
+
+        Returns:
+            list: A dict per refresh, like latest() returns.
+        """
+        rows = self.connection.execute(
+            'SELECT refreshed_at, upvotes, comment_count, status FROM engagement WHERE post_id = ? ORDER BY refreshed_at', (post_id,)
+        ).fetchall()
+        return [{"refreshed_at": row[0], "upvotes": row[1], "comment_count": row[2], "status": row[3]} for row in rows]
+
+    def close(self):
+        """
+        Closes the engagement database.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        self.connection.close()
+
+
+def refresh_engagement(make_client, post_ids, engagement_store, on_batch_refreshed=None, metrics=None):
+    """
+    Looks up the current upvotes, comment counts and status of stored posts, 100 posts per request.
+
+    The posts are asked for by their fullname through the info endpoint, which answers up to 100 of them at
+    once, so refreshing 100,000 posts takes about 1,000 requests instead of one per post or a listing that
+    no longer contains them. A post the endpoint doesn't return anymore is recorded as 'missing'.
+
+    Args:
+        make_client (callable): Creates a new praw.Reddit instance, keyword arguments are passed on to praw.Reddit.
+        post_ids (iterable): The IDs of the posts to refresh, e.g. a PostIdIndex.
+        engagement_store (EngagementStore): The history the numbers are added to.
+        on_batch_refreshed (callable, optional): Gets called with the rows of every refreshed batch. Defaults to None.
+        metrics (RunMetrics, optional): Collects the request counters and the 'refresh' stage timing. Defaults to None.
+
+    Returns:
+        dict: The amount of refreshed posts per status.
+    """
+    # Imported here, so prawcore is only loaded once there is something to refresh
+    from scheduler import SchedulingRequestor
+
+    reddit = make_client(requestor_class=SchedulingRequestor, requestor_kwargs={"metrics": metrics})
+    statuses = {}
+
+    for batch in batched(post_ids, INFO_BATCH_SIZE):
+        start = time.perf_counter()
+        found = {}
+        for submission in reddit.info(fullnames=['t3_' + post_id for post_id in batch]):
+            found[submission.id] = (submission.id, submission.score, submission.num_comments, post_status(submission))
+        rows = [found.get(post_id, (post_id, None, None, 'missing')) for post_id in batch]
+        if metrics is not None:
+            metrics.add_time('refresh', time.perf_counter() - start)
+
+        start = time.perf_counter()
+        engagement_store.record(rows)
+        if metrics is not None:
+            metrics.add_time('write', time.perf_counter() - start)
+            metrics.count('posts', len(rows))
+
+        for row in rows:
+            statuses[row[3]] = statuses.get(row[3], 0) + 1
+        if on_batch_refreshed is not None:
+            on_batch_refreshed(rows)
+
+    return statuses
@@ -0,0 +1,407 @@
+import argparse
+import copy
+import glob
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Reddit never returns more than this many posts in one listing page
+PAGE_SIZE = 100
+
+# Words the generated titles and bodies are made of, a mix so the sentiment scores aren't all the same
+WORD_POOL = ['great', 'terrible', 'exam', 'teacher', 'workload', 'love', 'hate', 'stress', 'college', 'math',
+             'physics', 'essay', 'deadline', 'happy', 'sad', 'confusing', 'helpful', 'awful', 'guide', 'the',
+             'a', 'is', 'and', 'my', 'so', 'really', 'not', 'very', 'today', 'again']
+
+# The listings the server answers, they all return the same posts newest first
+LISTING_PATH = re.compile(r'^/r/([^/]+)/(hot|new|top|rising|controversial|search)(?:\.json)?/?$')
+ABOUT_PATH = re.compile(r'^/r/([^/]+)/about(?:\.json)?/?$')
+COMMENTS_PATH = re.compile(r'^/comments/([0-9a-z]+)(?:/[^/]*)*/?$')
+
+
+def load_recorded_posts(recordings_dir):
+    """
+    Reads the posts of every recorded listing in a directory.
+
+    A recording is a listing response saved as JSON, e.g. the output of
+    https://www.reddit.com/r/python/new.json?limit=100. Its posts are used as templates for the generated ones.
+
+    Args:
+        recordings_dir (str): The directory with the .json files.
+
+    Returns:
+        list: The data dictionaries of the recorded posts.
+    """
+    posts = []
+
+    for path in sorted(glob.glob(os.path.join(recordings_dir, '*.json'))):
+        with open(path, 'r', encoding='utf-8') as file:
+            listing = json.load(file)
+        # The comment page of a post is a list of two listings, the first one holds the post
+        if isinstance(listing, list):
+            listing = listing[0]
+        for child in listing.get('data', {}).get('children', []):
+            if child.get('kind') == 't3':
+                posts.append(child['data'])
+
+    return posts
+
+
+class FakeReddit:
+    """
+    The FakeReddit class is the content the FakeRedditServer serves: a fixed amount of posts per subreddit.
+
+    The posts are made up on demand from their position in the listing, so even 100k posts per subreddit take
+    no memory up front. Post number i has the ID 'f' + i in base 36 and is i minutes older than the newest one.
+    When recorded posts are given they are used as templates, otherwise the text is generated from WORD_POOL.
+    """
+
+    def __init__(self, posts_per_subreddit=1000, comments_per_post=5, recorded_posts=None, seed=0):
+        """
+        Initializes the content.
+
+        Args:
+            posts_per_subreddit (int, optional): The amount of posts every subreddit has. Defaults to 1000.
+            comments_per_post (int, optional): The amount of comments every post has. Defaults to 5.
+            recorded_posts (list, optional): The post data the posts are copied from. Defaults to None.
+            seed (int, optional): The seed of the generated text, the same seed gives the same posts. Defaults to 0.
+
+        Returns:
+            None
+        """
+        self.posts_per_subreddit = posts_per_subreddit
+        self.comments_per_post = comments_per_post
+        self.recorded_posts = recorded_posts or []
+        self.seed = seed
+        self.newest_created_utc = float(int(time.time()))
+
+    def _text(self, index, words):
+        generator = random.Random(self.seed * 1000003 + index)
+        return ' '.join(generator.choice(WORD_POOL) for _ in range(words))
+
+    def post_id(self, index):
+        """
+        Returns the ID of the post at a position of the listing.
+
+        Args:
+            index (int): The position, 0 is the newest post.
+
+        Returns:
+            str: The post ID.
+        """
+        digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+        encoded = ''
+        while True:
+            index, remainder = divmod(index, 36)
+            encoded = digits[remainder] + encoded
+            if index == 0:
+                return 'f' + encoded
+
+    def post_index(self, post_id):
+        """
+        Returns the position of a post in the listing, the reverse of post_id().
+
+        Args:
+            post_id (str): The post ID, with or without the 't3_' prefix.
+
+        Returns:
+            int: The position, or None if the ID isn't one of the server's posts.
+        """
+        if post_id.startswith('t3_'):
+            post_id = post_id[3:]
+        try:
+            return int(post_id[1:], 36)
+        except ValueError:
+            return None
+
+    def post(self, subreddit, index):
+        """
+        Returns the data of a post as Reddit's API would.
+
+        Args:
+            subreddit (str): The subreddit of the post.
+            index (int): The position of the post, 0 is the newest.
+
+        Returns:
+            dict: The post data.
+        """
+        if self.recorded_posts:
+            data = copy.deepcopy(self.recorded_posts[index % len(self.recorded_posts)])
+        else:
+            data = {
+                'title': self._text(index, 8),
+                'selftext': self._text(-index - 1, 60),
+                'author': 'user' + str(index % 997),
+                'score': index % 500,
+                'upvote_ratio': 0.9,
+                'is_self': True,
+                'over_18': False,
+            }
+
+        post_id = self.post_id(index)
+        data.update({
+            'id': post_id,
+            'name': 't3_' + post_id,
+            'subreddit': subreddit,
+            'subreddit_name_prefixed': 'r/' + subreddit,
+            'created_utc': self.newest_created_utc - index * 60,
+            'num_comments': self.comments_per_post,
+            'permalink': '/r/' + subreddit + '/comments/' + post_id + '/',
+            'url': 'https://www.reddit.com/r/' + subreddit + '/comments/' + post_id + '/',
+        })
+        return data
+
+    def listing_page(self, subreddit, after=None, limit=PAGE_SIZE):
+        """
+        Returns one page of the subreddit's listing.
+
+        Args:
+            subreddit (str): The subreddit.
+            after (str, optional): The fullname of the last post of the previous page. Defaults to None.
+            limit (int, optional): The amount of posts asked for, at most PAGE_SIZE. Defaults to PAGE_SIZE.
+
+        Returns:
+            dict: The listing response.
+        """
+        start = 0
+        if after:
+            start = (self.post_index(after) or 0) + 1
+
+        end = min(start + min(limit, PAGE_SIZE), self.posts_per_subreddit)
+        children = [{'kind': 't3', 'data': self.post(subreddit, index)} for index in range(start, end)]
+
+        return listing(children, after=children[-1]['data']['name'] if children and end < self.posts_per_subreddit else None)
+
+    def comments(self, subreddit, post_id):
+        """
+        Returns the comment page of a post: the post itself and a flat list of comments.
+
+        Args:
+            subreddit (str): The subreddit of the post.
+            post_id (str): The post ID.
+
+        Returns:
+            list: The two listings of the comment page.
+        """
+        index = self.post_index(post_id) or 0
+        comments = []
+
+        for number in range(self.comments_per_post):
+            comment_id = post_id + 'c' + str(number)
+            comments.append({'kind': 't1', 'data': {
+                'id': comment_id,
+                'name': 't1_' + comment_id,
+                'parent_id': 't3_' + post_id,
+                'link_id': 't3_' + post_id,
+                'body': self._text(index * 100 + number, 20),
+                'author': 'user' + str((index + number) % 997),
+                'score': number,
+                'created_utc': self.newest_created_utc - index * 60 + number,
+                'subreddit': subreddit,
+                'replies': '',
+            }})
+
+        return [listing([{'kind': 't3', 'data': self.post(subreddit, index)}]), listing(comments)]
+
+
+def listing(children, after=None):
+    """
+    Wraps things in a listing response.
+
+    Args:
+        children (list): The things of the listing.
+        after (str, optional): The fullname the next page starts after. Defaults to None.
+
+    Returns:
+        dict: The listing.
+    """
+    return {'kind': 'Listing', 'data': {'after': after, 'before': None, 'dist': len(children), 'children': children}}
+
+
+class _FakeRedditHandler(BaseHTTPRequestHandler):
+    # The server attribute is the FakeRedditServer's ThreadingHTTPServer, which carries the settings
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        # A budget that never runs out, so the benchmarks measure the scraper and not the rate limit
+        self.send_header('x-ratelimit-remaining', '100000')
+        self.send_header('x-ratelimit-used', '0')
+        self.send_header('x-ratelimit-reset', '600')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _serve(self):
+        owner = self.server.owner
+        owner.count_request()
+        if owner.latency:
+            time.sleep(owner.latency)
+
+        url = urlparse(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        content = owner.content
+
+        if url.path.rstrip('/') == '/api/v1/access_token':
+            # Drain the form body, the credentials aren't checked
+            self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            return self._send_json({'access_token': 'fake-token', 'token_type': 'bearer', 'expires_in': 86400, 'scope': '*'})
+
+        match = LISTING_PATH.match(url.path)
+        if match:
+            return self._send_json(content.listing_page(match.group(1), after=query.get('after'), limit=int(query.get('limit') or PAGE_SIZE)))
+
+        match = ABOUT_PATH.match(url.path)
+        if match:
+            return self._send_json({'kind': 't5', 'data': {'display_name': match.group(1), 'subscribers': 100000, 'over18': False,
+                                                            'name': 't5_' + match.group(1).lower(), 'id': match.group(1).lower()}})
+
+        match = COMMENTS_PATH.match(url.path)
+        if match:
+            return self._send_json(content.comments('fake', match.group(1)))
+
+        if url.path.rstrip('/') == '/api/info':
+            children = []
+            for fullname in (query.get('id') or '').split(','):
+                index = content.post_index(fullname) if fullname.startswith('t3_') else None
+                if index is not None and index < content.posts_per_subreddit:
+                    children.append({'kind': 't3', 'data': content.post('fake', index)})
+            return self._send_json(listing(children))
+
+        return self._send_json({'message': 'Not Found', 'error': 404}, status=404)
+
+    def do_GET(self):
+        self._serve()
+
+    def do_POST(self):
+        self._serve()
+
+
+class FakeRedditServer:
+    """
+    The FakeRedditServer class runs a local stand-in for the Reddit API, so scrapes can run offline.
+
+    It answers the token, listing, about, comment and info endpoints the scraper uses, every response after
+    the configured latency. A PRAW client is pointed at it with oauth_url and reddit_url, see client_settings().
+
+    Example Usage:
+    ```python
+    with FakeRedditServer(FakeReddit(posts_per_subreddit=1000), latency=0.05) as server:
+        reddit = praw.Reddit(**server.client_settings())
+        for submission in reddit.subreddit("python").new(limit=1000):
+            ...
+    ```
+    """
+
+    def __init__(self, content=None, latency=0.0, host='127.0.0.1', port=0):
+        """
+        Binds the server, it only starts answering once start() is called.
+
+        Args:
+            content (FakeReddit, optional): The posts to serve. Defaults to a FakeReddit with 1000 posts per subreddit.
+            latency (float, optional): The seconds every response is delayed. Defaults to 0.
+            host (str, optional): The address to listen on. Defaults to '127.0.0.1'.
+            port (int, optional): The port to listen on, 0 picks a free one. Defaults to 0.
+
+        Returns:
+            None
+        """
+        self.content = content or FakeReddit()
+        self.latency = latency
+        self.requests_served = 0
+        self.lock = threading.Lock()
+        self.http_server = ThreadingHTTPServer((host, port), _FakeRedditHandler)
+        self.http_server.daemon_threads = True
+        self.http_server.owner = self
+        self.thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    @property
+    def url(self):
+        host, port = self.http_server.server_address[:2]
+        return 'http://' + host + ':' + str(port)
+
+    def count_request(self):
+        with self.lock:
+            self.requests_served += 1
+
+    def client_settings(self):
+        """
+        Returns the praw.Reddit settings that point a client at this server.
+
+        Args:
+            None
+
+        Returns:
+            dict: The settings, with made up credentials.
+        """
+        return {
+            'client_id': 'fake-client',
+            'client_secret': 'fake-secret',
+            'user_agent': 'redditscraper offline benchmark',
+            'oauth_url': self.url,
+            'reddit_url': self.url,
+        }
+
+    def start(self):
+        """
+        Starts answering requests on a background thread.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        self.thread = threading.Thread(target=self.http_server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stops the server and frees the port.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        self.http_server.shutdown()
+        self.http_server.server_close()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+
+if __name__ == '__main__':
+    # Serving the fake API on its own: python fake_reddit.py --port 8080 --posts 1000 --latency 0.05
+    parser = argparse.ArgumentParser(description='Serve a local stand-in for the Reddit API.')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--posts', type=int, default=1000, help='The amount of posts every subreddit has.')
+    parser.add_argument('--comments', type=int, default=5, help='The amount of comments every post has.')
+    parser.add_argument('--latency', type=float, default=0.0, help='The seconds every response is delayed.')
+    parser.add_argument('--recordings', help='A directory of recorded listing JSON files used as post templates.')
+    args = parser.parse_args()
+
+    recorded = load_recorded_posts(args.recordings) if args.recordings else None
+    server = FakeRedditServer(FakeReddit(args.posts, args.comments, recorded), latency=args.latency, port=args.port)
+    print('Serving the fake Reddit API on ' + server.url + ' (Ctrl+C to stop)')
+    try:
+        server.http_server.serve_forever()
+    except KeyboardInterrupt:
+        server.http_server.server_close()
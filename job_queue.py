@@ -0,0 +1,624 @@
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from dedup_index import PostIdIndex
+from listings import open_listing
+from metrics import RunMetrics
+from pipeline import DEFAULT_BATCH_SIZE, add_sentiment, batched, build_records, skip_known_posts
+from records import POST_FIELDS, PostRecord
+from writers import open_writer
+
+# The default amount of worker processes
+DEFAULT_WORKERS = 4
+
+# How long a leased job belongs to its worker without a heartbeat, after that another worker takes it over
+DEFAULT_LEASE_SECONDS = 120
+
+# How often a worker renews the lease of the job it is running
+DEFAULT_HEARTBEAT_SECONDS = 30
+
+# How often a job is tried before it is marked as failed
+DEFAULT_MAX_ATTEMPTS = 3
+
+# The wait before the first retry of a failed job, every further retry waits twice as long
+RETRY_DELAY_SECONDS = 30
+
+# How long idle workers and the writer wait before they look at the queue again
+POLL_SECONDS = 1.0
+
+# The amount of staged batches the writer loads from the queue at once
+STAGED_BATCHES_PER_READ = 16
+
+
+def job_queue_path_for(output_filename):
+    """
+    Returns the location of the job queue that belongs to an output file.
+
+    Args:
+        output_filename (str): The path to the output file.
+
+    Returns:
+        str: The path to the queue database next to the output file.
+    """
+    return output_filename + '.jobs.sqlite'
+
+
+def worker_name(number):
+    """
+    Returns a name for a worker that is unique across processes and machines.
+
+    Args:
+        number (int): The number of the worker within its pool.
+
+    Returns:
+        str: The host name, process ID and number of the worker.
+    """
+    return socket.gethostname() + ':' + str(os.getpid()) + ':' + str(number)
+
+
+def _dump_records(records):
+    return json.dumps([{field: getattr(record, field) for field in POST_FIELDS} for record in records])
+
+
+def _load_records(data):
+    return [PostRecord(**fields) for fields in json.loads(data)]
+
+
+class JobQueue:
+    """
+    The JobQueue class keeps the scrape jobs of an output in a SQLite database that every worker process shares.
+
+    A job is one subreddit with its listing, limit and (optionally) the login profile it is scraped with. A
+    worker leases a job, renews the lease with heartbeats while it runs and stages the scraped batches in the
+    queue; only the writer (see run_job_workers()) writes them to the output. A job whose worker crashed is
+    taken over by another worker once its lease expired, and a job that failed is retried with a growing
+    delay until it used up its attempts. Staging checks the lease in the same transaction, so a worker that
+    lost its job can't add anything any more.
+
+    Example Usage:
+    ```python
+    with JobQueue("output.csv") as job_queue:
+        job_queue.add("python", 100, {"listing": "new"})
+        job = job_queue.lease("worker-1")
+        job_queue.stage(job["id"], "worker-1", batch)
+        job_queue.complete(job["id"], "worker-1")
+    ```
+    """
+
+    def __init__(self, output_filename, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """
+        Opens (or creates) the job queue of an output file.
+
+        Args:
+            output_filename (str): The path to the output file.
+            max_attempts (int, optional): How often a job is tried before it is marked as failed. Defaults to DEFAULT_MAX_ATTEMPTS.
+
+        Returns:
+            None
+        """
+        self.max_attempts = max_attempts
+        # The heartbeat thread renews the lease while the worker thread stages batches
+        self.lock = threading.Lock()
+        # Other processes keep the database busy for short moments, so they are waited for
+        self.connection = sqlite3.connect(job_queue_path_for(output_filename), timeout=30, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            'id INTEGER PRIMARY KEY, '
+            'subreddit TEXT NOT NULL, '
+            'search_limit INTEGER NOT NULL, '
+            'listing_options TEXT NOT NULL, '
+            'profile TEXT, '
+            "status TEXT NOT NULL DEFAULT 'queued', "
+            'attempts INTEGER NOT NULL DEFAULT 0, '
+            'worker TEXT, '
+            'lease_expires REAL, '
+            'available_at REAL NOT NULL DEFAULT 0, '
+            'written INTEGER NOT NULL DEFAULT 0, '
+            'error TEXT)'
+        )
+        self.connection.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, available_at)')
+        # The scraped batches that haven't been written to the output yet
+        self.connection.execute('CREATE TABLE IF NOT EXISTS staged_batches (id INTEGER PRIMARY KEY, job_id INTEGER NOT NULL, records TEXT NOT NULL)')
+        # The request counts and stage timings of the workers that haven't been added to the run metrics yet
+        self.connection.execute('CREATE TABLE IF NOT EXISTS staged_metrics (id INTEGER PRIMARY KEY, counts TEXT NOT NULL)')
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add(self, subreddit, search_limit, listing_options, profile=None):
+        """
+        Adds a scrape job to the end of the queue.
+
+        Args:
+            subreddit (str): The subreddit to scrape.
+            search_limit (int): The maximum number of posts.
+            listing_options (dict): The listing, time_filter, query and backfill_range passed to open_listing().
+            profile (str, optional): The login profile the job is scraped with. Defaults to the credentials of the worker.
+
+        Returns:
+            int: The ID of the job.
+        """
+        with self.lock, self.connection:
+            cursor = self.connection.execute(
+                'INSERT INTO jobs (subreddit, search_limit, listing_options, profile) VALUES (?, ?, ?, ?)',
+                (subreddit, search_limit, json.dumps(listing_options), profile)
+            )
+        return cursor.lastrowid
+
+    def lease(self, worker, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """
+        Hands the next job that is due to a worker, including jobs whose worker stopped sending heartbeats.
+
+        Args:
+            worker (str): The name of the worker, see worker_name().
+            lease_seconds (float, optional): How long the job belongs to the worker without a heartbeat. Defaults to DEFAULT_LEASE_SECONDS.
+
+        Returns:
+            dict: The id, subreddit, search_limit, listing_options, profile and attempt of the job, or None if no job is due.
+        """
+        with self.lock:
+            while True:
+                now = time.time()
+                with self.connection:
+                    self.connection.execute(
+                        "UPDATE jobs SET status = 'failed', worker = NULL, lease_expires = NULL, error = 'The worker stopped sending heartbeats' "
+                        "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?", (now, self.max_attempts)
+                    )
+                row = self.connection.execute(
+                    'SELECT id, subreddit, search_limit, listing_options, profile, attempts FROM jobs '
+                    "WHERE (status = 'queued' AND available_at <= ?) OR (status = 'leased' AND lease_expires < ?) "
+                    'ORDER BY available_at, id LIMIT 1', (now, now)
+                ).fetchone()
+                if row is None:
+                    return None
+
+                # Other workers lease at the same time, the attempts only match if none of them got the job first
+                with self.connection:
+                    cursor = self.connection.execute(
+                        "UPDATE jobs SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1 "
+                        "WHERE id = ? AND attempts = ? AND ((status = 'queued' AND available_at <= ?) OR (status = 'leased' AND lease_expires < ?))",
+                        (worker, now + lease_seconds, row[0], row[5], now, now)
+                    )
+                if cursor.rowcount == 1:
+                    return {"id": row[0], "subreddit": row[1], "search_limit": row[2], "listing_options": json.loads(row[3]),
+                            "profile": row[4], "attempt": row[5] + 1}
+
+    def heartbeat(self, job_id, worker, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """
+        Renews the lease of a running job.
+
+        Args:
+            job_id (int): The ID of the job.
+            worker (str): The name of the worker running it.
+            lease_seconds (float, optional): How long the lease is extended. Defaults to DEFAULT_LEASE_SECONDS.
+
+        Returns:
+            bool: False if the job doesn't belong to the worker any more.
+        """
+        with self.lock, self.connection:
+            cursor = self.connection.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+                (time.time() + lease_seconds, job_id, worker)
+            )
+        return cursor.rowcount == 1
+
+    def stage(self, job_id, worker, records, lease_seconds=DEFAULT_LEASE_SECONDS, counts=None):
+        """
+        Stores a scraped batch for the writer, only while the job still belongs to the worker.
+
+        Args:
+            job_id (int): The ID of the job.
+            worker (str): The name of the worker running it.
+            records (list): The PostRecords of the batch.
+            lease_seconds (float, optional): How long the lease is extended. Defaults to DEFAULT_LEASE_SECONDS.
+            counts (dict, optional): The metrics the worker collected for the batch, see RunMetrics.drain(). They are stored
+                even if the batch is dropped, the requests were made either way. Defaults to None.
+
+        Returns:
+            bool: False if the job doesn't belong to the worker any more, the batch is dropped then.
+        """
+        data = _dump_records(records)
+
+        with self.lock, self.connection:
+            self._stage_counts(counts)
+            cursor = self.connection.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+                (time.time() + lease_seconds, job_id, worker)
+            )
+            if cursor.rowcount != 1:
+                return False
+            self.connection.execute('INSERT INTO staged_batches (job_id, records) VALUES (?, ?)', (job_id, data))
+        return True
+
+    def stage_metrics(self, counts):
+        """
+        Stores the metrics a worker collected that didn't go out with a batch, e.g. the requests of the last listing page.
+
+        Args:
+            counts (dict): The counters and stage timings, see RunMetrics.drain().
+
+        Returns:
+            None
+        """
+        with self.lock, self.connection:
+            self._stage_counts(counts)
+
+    def _stage_counts(self, counts):
+        if counts is not None and (counts['counters'] or counts['stages']):
+            self.connection.execute('INSERT INTO staged_metrics (counts) VALUES (?)', (json.dumps(counts),))
+
+    def take_metrics(self):
+        """
+        Removes the metrics the workers staged and returns them, so the writer can add them to the metrics of the run.
+
+        Args:
+            None
+
+        Returns:
+            list: The counters and stage timings of every staged entry, see RunMetrics.merge().
+        """
+        with self.lock, self.connection:
+            rows = self.connection.execute('SELECT id, counts FROM staged_metrics ORDER BY id').fetchall()
+            if rows:
+                self.connection.execute('DELETE FROM staged_metrics WHERE id <= ?', (rows[-1][0],))
+        return [json.loads(counts) for _, counts in rows]
+
+    def complete(self, job_id, worker):
+        """
+        Marks a job as done once all of its batches are staged.
+
+        Args:
+            job_id (int): The ID of the job.
+            worker (str): The name of the worker that ran it.
+
+        Returns:
+            bool: False if the job didn't belong to the worker any more.
+        """
+        with self.lock, self.connection:
+            cursor = self.connection.execute(
+                "UPDATE jobs SET status = 'done', lease_expires = NULL, error = NULL WHERE id = ? AND worker = ? AND status = 'leased'",
+                (job_id, worker)
+            )
+        return cursor.rowcount == 1
+
+    def fail(self, job_id, worker, error):
+        """
+        Puts a failed job back into the queue with a delay, or marks it as failed when it used up its attempts.
+
+        Args:
+            job_id (int): The ID of the job.
+            worker (str): The name of the worker that ran it.
+            error (str): What went wrong.
+
+        Returns:
+            str: The new status, 'queued' or 'failed', or None if the job didn't belong to the worker any more.
+        """
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                "SELECT attempts FROM jobs WHERE id = ? AND worker = ? AND status = 'leased'", (job_id, worker)
+            ).fetchone()
+            if row is None:
+                return None
+
+            status = 'queued' if row[0] < self.max_attempts else 'failed'
+            self.connection.execute(
+                'UPDATE jobs SET status = ?, worker = NULL, lease_expires = NULL, available_at = ?, error = ? WHERE id = ?',
+                (status, time.time() + RETRY_DELAY_SECONDS * 2 ** (row[0] - 1), error, job_id)
+            )
+        return status
+
+    def release(self, job_id, worker):
+        """
+        Puts a job back into the queue without counting the attempt, e.g. when its worker is stopped.
+
+        Args:
+            job_id (int): The ID of the job.
+            worker (str): The name of the worker that ran it.
+
+        Returns:
+            None
+        """
+        with self.lock, self.connection:
+            self.connection.execute(
+                "UPDATE jobs SET status = 'queued', worker = NULL, lease_expires = NULL, attempts = attempts - 1 "
+                "WHERE id = ? AND worker = ? AND status = 'leased'", (job_id, worker)
+            )
+
+    def retry_failed(self):
+        """
+        Puts every failed job back into the queue with all of its attempts.
+
+        Args:
+            None
+
+        Returns:
+            int: The amount of jobs that were put back.
+        """
+        with self.lock, self.connection:
+            cursor = self.connection.execute("UPDATE jobs SET status = 'queued', attempts = 0, available_at = 0 WHERE status = 'failed'")
+        return cursor.rowcount
+
+    def staged(self, limit=STAGED_BATCHES_PER_READ):
+        """
+        Returns the oldest staged batches in the order they were staged.
+
+        Args:
+            limit (int, optional): The most batches returned. Defaults to STAGED_BATCHES_PER_READ.
+
+        Returns:
+            list: A (batch ID, job ID, subreddit, records) tuple per batch.
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT staged_batches.id, staged_batches.job_id, jobs.subreddit, staged_batches.records '
+                'FROM staged_batches JOIN jobs ON jobs.id = staged_batches.job_id ORDER BY staged_batches.id LIMIT ?', (limit,)
+            ).fetchall()
+        return [(batch_id, job_id, subreddit, _load_records(data)) for batch_id, job_id, subreddit, data in rows]
+
+    def commit_staged(self, batch_id, job_id, written):
+        """
+        Drops a staged batch once it is in the output.
+
+        Args:
+            batch_id (int): The ID of the staged batch.
+            job_id (int): The ID of its job.
+            written (int): The amount of its posts that were new to the output.
+
+        Returns:
+            None
+        """
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM staged_batches WHERE id = ?', (batch_id,))
+            self.connection.execute('UPDATE jobs SET written = written + ? WHERE id = ?', (written, job_id))
+
+    def unfinished(self):
+        """
+        Counts the jobs that are queued or running.
+
+        Args:
+            None
+
+        Returns:
+            int: The amount of jobs that aren't done or failed.
+        """
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'leased')").fetchone()[0]
+
+    def jobs(self):
+        """
+        Returns every job with its status.
+
+        Args:
+            None
+
+        Returns:
+            list: A dict per job with its id, subreddit, profile, status, attempts, written posts and last error.
+        """
+        with self.lock:
+            rows = self.connection.execute('SELECT id, subreddit, profile, status, attempts, written, error FROM jobs ORDER BY id').fetchall()
+        return [
+            {"id": row[0], "subreddit": row[1], "profile": row[2], "status": row[3], "attempts": row[4], "written": row[5], "error": row[6]}
+            for row in rows
+        ]
+
+    def close(self):
+        """
+        Closes the connection to the queue database.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        self.connection.close()
+
+
+class _Heartbeat:
+    # Renews the lease of a running job in the background, so a long listing page doesn't let it expire
+
+    def __init__(self, job_queue, job_id, worker, lease_seconds, heartbeat_seconds):
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(job_queue, job_id, worker, lease_seconds, heartbeat_seconds), daemon=True)
+        self.thread.start()
+
+    def _run(self, job_queue, job_id, worker, lease_seconds, heartbeat_seconds):
+        while not self.stopped.wait(heartbeat_seconds):
+            if not job_queue.heartbeat(job_id, worker, lease_seconds):
+                return
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+
+def _run_job(job, job_queue, worker, make_client_for, schedulers, post_id_index, sentiment_engine, batch_size, lease_seconds, metrics):
+    """
+    Scrapes the subreddit of a job and stages the batches of the posts that aren't in the output yet, each with the metrics collected for it.
+
+    Returns:
+        bool: False if the job was taken over by another worker before it was finished.
+    """
+    # Imported here, so prawcore is only loaded once there is something to scrape
+    from scheduler import RateLimitScheduler, SchedulingRequestor
+
+    # The jobs of a profile share its rate limit, the budget Reddit reports back keeps the processes of a profile in line
+    scheduler = schedulers.get(job['profile'])
+    if scheduler is None:
+        scheduler = schedulers[job['profile']] = RateLimitScheduler(metrics=metrics)
+
+    listing_options = dict(job['listing_options'])
+    if listing_options.get('backfill_range'):
+        listing_options['backfill_range'] = tuple(listing_options['backfill_range'])
+
+    try:
+        reddit = make_client_for(job['profile'])(requestor_class=SchedulingRequestor,
+                                                 requestor_kwargs={"scheduler": scheduler, "job_id": job['subreddit'], "metrics": metrics})
+        submissions = metrics.timed_iter(open_listing(reddit.subreddit(job['subreddit']), limit=job['search_limit'], **listing_options), 'listing')
+        records = build_records(skip_known_posts(submissions, post_id_index), metrics=metrics)
+        if sentiment_engine is not None:
+            records = add_sentiment(records, sentiment_engine, batch_size, metrics=metrics)
+
+        for batch in batched(records, batch_size):
+            if not job_queue.stage(job['id'], worker, batch, lease_seconds, counts=metrics.drain()):
+                return False
+    finally:
+        scheduler.forget_job(job['subreddit'])
+
+    return True
+
+
+def work_jobs(output_filename, make_client_for, worker, sentiment_engine=None, batch_size=DEFAULT_BATCH_SIZE, lease_seconds=DEFAULT_LEASE_SECONDS,
+              heartbeat_seconds=DEFAULT_HEARTBEAT_SECONDS):
+    """
+    Runs the jobs of an output's queue one after another until no job is queued or running any more.
+
+    A job that raises is handed back to the queue as failed (see JobQueue.fail()), so one broken subreddit
+    or profile doesn't stop the worker. A worker that is interrupted puts its running job back. Posts that
+    are already in the output are skipped before they are scored, looked up in the post ID index the
+    writing process keeps.
+
+    Args:
+        output_filename (str): The output whose job queue is worked on.
+        make_client_for (callable): Gets the login profile of a job (None for the default credentials) and returns a function that
+            creates praw.Reddit instances with it, see cli.client_factory().
+        worker (str): The name of the worker, see worker_name().
+        sentiment_engine (SentimentEngine, optional): The engine that scores the posts, None leaves the sentiment empty. Defaults to None.
+        batch_size (int, optional): The amount of posts staged at once. Defaults to DEFAULT_BATCH_SIZE.
+        lease_seconds (float, optional): How long a job belongs to the worker without a heartbeat. Defaults to DEFAULT_LEASE_SECONDS.
+        heartbeat_seconds (float, optional): How often the lease is renewed. Defaults to DEFAULT_HEARTBEAT_SECONDS.
+
+    Returns:
+        int: The amount of jobs the worker finished.
+    """
+    finished_jobs = 0
+    schedulers = {}
+    # The metrics of the worker go to the writer with the staged batches, which adds them to the metrics of the run
+    metrics = RunMetrics()
+
+    with JobQueue(output_filename) as job_queue, PostIdIndex(output_filename, read_only=True) as post_id_index:
+        while True:
+            job = job_queue.lease(worker, lease_seconds)
+            if job is None:
+                if job_queue.unfinished() == 0:
+                    return finished_jobs
+                # The remaining jobs are running elsewhere or wait for their retry
+                time.sleep(POLL_SECONDS)
+                continue
+
+            heartbeat = _Heartbeat(job_queue, job['id'], worker, lease_seconds, heartbeat_seconds)
+            try:
+                if _run_job(job, job_queue, worker, make_client_for, schedulers, post_id_index, sentiment_engine, batch_size, lease_seconds,
+                            metrics) and job_queue.complete(job['id'], worker):
+                    finished_jobs += 1
+            except KeyboardInterrupt:
+                job_queue.release(job['id'], worker)
+                raise
+            except Exception as e:
+                job_queue.fail(job['id'], worker, type(e).__name__ + ': ' + str(e))
+            finally:
+                heartbeat.stop()
+                job_queue.stage_metrics(metrics.drain())
+
+
+def write_staged_batches(job_queue, writer, post_id_index, on_batch_written=None, metrics=None):
+    """
+    Writes the oldest staged batches of the workers to the output, skipping every post that is already in it.
+
+    At most STAGED_BATCHES_PER_READ batches are loaded at once, the caller repeats until nothing is left. A
+    batch is only dropped from the queue after it was written, and posts that are in the output are skipped,
+    so a batch that was written right before a crash or a job that was scraped twice never duplicates a post.
+    The workers already skip the posts in the output, this catches the ones written while they were scraping.
+
+    Args:
+        job_queue (JobQueue): The queue holding the staged batches.
+        writer (RecordWriter): The writer of the output.
+        post_id_index (PostIdIndex): The index of the posts already in the output.
+        on_batch_written (callable, optional): Gets called with the subreddit and every batch after it was flushed. Defaults to None.
+        metrics (RunMetrics, optional): Gets the write timings, the amount of written posts and the metrics the workers staged. Defaults to None.
+
+    Returns:
+        int: The amount of staged batches that were handled.
+    """
+    # Taken even without metrics, so they don't pile up in the queue
+    for counts in job_queue.take_metrics():
+        if metrics is not None:
+            metrics.merge(counts)
+
+    staged_batches = job_queue.staged()
+
+    for batch_id, job_id, subreddit, records in staged_batches:
+        new_records = []
+        batch_post_ids = set()
+        for record in records:
+            if record.post_id not in post_id_index and record.post_id not in batch_post_ids:
+                batch_post_ids.add(record.post_id)
+                new_records.append(record)
+
+        written = 0
+        if new_records:
+            start = time.perf_counter()
+            written = writer.write_batch(new_records)
+            post_id_index.record_written([record.post_id for record in new_records])
+            if metrics is not None:
+                metrics.add_time('write', time.perf_counter() - start)
+                metrics.count('posts', written)
+            if on_batch_written is not None:
+                on_batch_written(subreddit, new_records)
+
+        job_queue.commit_staged(batch_id, job_id, written)
+
+    return len(staged_batches)
+
+
+def run_job_workers(output_filename, worker_target, worker_args=(), workers=DEFAULT_WORKERS, on_batch_written=None, metrics=None, indexes=False):
+    """
+    Runs a pool of worker processes on the job queue of an output, with this process as the only writer.
+
+    Every worker process runs worker_target(*worker_args, worker) with its own worker name, which is expected
+    to call work_jobs(). The workers scrape and score in parallel and only stage their batches, while this
+    process writes them to the output (see write_staged_batches()), so the output, its post ID index and its
+    indexes are only ever written by one process. Workers on other machines can work on the same queue with
+    work_jobs() as long as they reach the queue database.
+
+    Args:
+        output_filename (str): The output the jobs are scraped into.
+        worker_target (callable): The module level function a worker process runs.
+        worker_args (tuple, optional): The arguments worker_target gets before the worker name. Defaults to ().
+        workers (int, optional): The amount of worker processes. Defaults to DEFAULT_WORKERS.
+        on_batch_written (callable, optional): Gets called with the subreddit and every batch after it was flushed. Defaults to None.
+        metrics (RunMetrics, optional): Gets the write timings, the amount of written posts and the request counts and timings of the workers. Defaults to None.
+        indexes (bool, optional): Whether the rollups and search index of the output are kept up to date, see open_writer(). Defaults to False.
+
+    Returns:
+        list: Every job with its status, see JobQueue.jobs().
+    """
+    # The workers are started before any database is opened here, so none of the connections is shared with them
+    processes = [multiprocessing.Process(target=worker_target, args=tuple(worker_args) + (worker_name(number),)) for number in range(workers)]
+    for process in processes:
+        process.start()
+
+    try:
+        with JobQueue(output_filename) as job_queue, PostIdIndex(output_filename) as post_id_index, open_writer(output_filename, indexes=indexes) as writer:
+            while True:
+                # Checked before the batches are written, so the last batches of a worker that just stopped are written too
+                workers_running = any(process.is_alive() for process in processes)
+                if write_staged_batches(job_queue, writer, post_id_index, on_batch_written, metrics) == 0:
+                    if not workers_running:
+                        return job_queue.jobs()
+                    time.sleep(POLL_SECONDS)
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
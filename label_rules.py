@@ -0,0 +1,371 @@
+import json
+import os
+import re
+import sqlite3
+
+from credentials import config_dir
+from pipeline import batched
+from writers import read_records
+
+# The subject labels of the manual labeling, with the text shown for them
+SUBJECT_CHOICES = [
+    ("math", "Math"),
+    ("science", "Sciences"),
+    ("lang", "Language"),
+    ("societies", "Individuals and Societies"),
+    ("arts", "Arts"),
+    ("misc", "Misc"),
+]
+
+# The problem labels of the manual labeling, with the text shown for them
+PROBLEM_CHOICES = [
+    ("teachers", "Lack of quality teachers/teaching"),
+    ("ia", "Need college support"),
+    ("workload", "Too high workload"),
+    ("ib", "IB structure unclear/confusing"),
+    ("resources", "Bad/not enough resources"),
+    ("college", "Need college guidance"),
+    ("management", "Difficulties with time management or organization"),
+    ("mental", "Mental health issues"),
+    ("structure", "Needs a (specific) study guide/structure"),
+    ("langbarrier", "Language barrier"),
+]
+
+# The regular expressions (case insensitive) that hint at a label, a file in the config directory can add to them.
+# Acronyms that are also common short words are matched case sensitively with (?-i:...).
+DEFAULT_RULES = {
+    "subject": {
+        "math": [r"\bmath(s|ematics)?\b", r"(?-i:\bAA ?[HS]L\b)", r"(?-i:\bAI ?[HS]L\b)", r"\bcalculus\b", r"\balgebra\b", r"\bstatistics\b",
+                 r"\bderivatives?\b", r"\bintegrals?\b", r"\bvectors?\b", r"\bprobability\b"],
+        "science": [r"\bphysics\b", r"\bchem(istry)?\b", r"\bbio(logy)?\b", r"\bcomputer science\b", r"(?-i:\bESS\b)", r"\bsports science\b",
+                    r"\blab reports?\b", r"\bexperiments?\b"],
+        "lang": [r"\benglish\b", r"\blang(uage)? (A|B|and literature)\b", r"\blit(erature)?\b", r"\bspanish\b", r"\bfrench\b",
+                 r"\bgerman\b", r"\bmandarin\b", r"\bab initio\b", r"\bpaper 1 analysis\b", r"(?-i:\bIOs?\b)"],
+        "societies": [r"\bhistory\b", r"\beconomics?\b", r"\becon\b", r"\bpsych(ology)?\b", r"\bgeography\b", r"\bbusiness( management)?\b",
+                      r"\bglobal politics\b", r"\bphilosophy\b", r"(?-i:\bITGS\b)"],
+        "arts": [r"\bvisual arts?\b", r"\bmusic\b", r"\btheat(re|er)\b", r"\bfilm\b", r"\bdance\b", r"\bart exhibition\b"],
+        "misc": [],
+    },
+    "problem": {
+        "teachers": [r"\bteachers?\b.{0,40}\b(bad|useless|doesn'?t|don'?t|never|can'?t|terrible|awful)\b", r"\bbad teach(er|ing)\b",
+                     r"\bteacher (left|quit)\b", r"\bno teacher\b"],
+        "ia": [r"(?-i:\bIAs?\b)", r"\binternal assessments?\b", r"(?-i:\bEE\b)", r"\bextended essay\b", r"(?-i:\bTOK\b) (essay|exhibition)\b", r"\bsupervisor\b"],
+        "workload": [r"\bworkload\b", r"\btoo much (work|homework)\b", r"\bso many (deadlines|assignments)\b", r"\boverwhelm(ed|ing)\b",
+                     r"\bno time\b", r"\bdrowning\b"],
+        "ib": [r"(?-i:\bIB\b).{0,40}\b(confus(ed|ing)|unclear|doesn'?t make sense)\b", r"\bgrade boundar(y|ies)\b", r"\bpredicted grades?\b",
+               r"\bhow does (the )?IB\b", r"(?-i:\bCAS\b)"],
+        "resources": [r"\bresources?\b", r"\btextbooks?\b", r"\bpast papers?\b", r"\bquestion ?bank\b", r"\b(revision|study|class) notes\b"],
+        "college": [r"\bcollege\b", r"\buniversit(y|ies)\b", r"\b(to|for|into) uni\b", r"\bapplications?\b", r"\badmissions?\b", r"(?-i:\bUCAS\b)",
+                    r"\bcommon app\b", r"\bpersonal statement\b"],
+        "management": [r"\btime management\b", r"\bprocrastinat(e|ing|ion)\b", r"\borgani[sz](e|ed|ing|ation)\b", r"\bschedule\b",
+                       r"\bdeadlines?\b", r"\bbehind on\b"],
+        "mental": [r"\bburn(ed|t)? ?out\b", r"\bstress(ed|ful)?\b", r"\banxi(ety|ous)\b", r"\bdepress(ed|ion)\b", r"\bmental health\b",
+                   r"\bpanic attacks?\b", r"\bcrying\b", r"\bexhausted\b"],
+        "structure": [r"\bstudy (guide|plan|tips?|method)\b", r"\bhow (should|do) i (study|revise)\b", r"\brevision (plan|schedule)\b",
+                      r"\bwhere (do|should) i start\b"],
+        "langbarrier": [r"\bnot my (first|native) language\b", r"\bnon[- ]native\b", r"\blanguage barrier\b", r"(?-i:\bESL\b)",
+                        r"\bsecond language\b"],
+    },
+}
+
+# Matches in the title count this much more than matches in the body
+TITLE_WEIGHT = 2
+
+# The weighted amount of matches at which a label's confidence reaches 0.5
+HALF_CONFIDENCE_MATCHES = 1.0
+
+# Labels with at least this confidence are suggested, which takes more than a single match in the body
+SUGGESTION_THRESHOLD = 0.6
+
+# A post is labeled without asking when the best subject and the best problem both reach this confidence
+AUTO_LABEL_THRESHOLD = 0.75
+
+
+def rules_path():
+    """
+    Returns the location of the file with the user's own label rules.
+
+    Args:
+        None
+
+    Returns:
+        str: The path to label_rules.json in the config directory.
+    """
+    return os.path.join(config_dir(), 'label_rules.json')
+
+
+def load_rules(path=None):
+    """
+    Reads the label rules, the rules in the file are added to the default rules of the same label.
+
+    The file holds the same structure as DEFAULT_RULES, e.g. {"problem": {"mental": ["\\\\bsleep\\\\b"]}}.
+    A label can't be added this way, only the labels of the manual labeling exist.
+
+    Args:
+        path (str, optional): The rules file. Defaults to label_rules.json in the config directory, if it exists.
+
+    Returns:
+        dict: The rules per dimension and label.
+    """
+    rules = {dimension: {label: list(patterns) for label, patterns in labels.items()} for dimension, labels in DEFAULT_RULES.items()}
+
+    if path is None:
+        path = rules_path()
+        if not os.path.exists(path):
+            return rules
+
+    with open(path, 'r', encoding='utf-8') as file:
+        extra_rules = json.load(file)
+
+    for dimension, labels in extra_rules.items():
+        if dimension not in rules:
+            raise ValueError('Unknown label dimension in ' + path + ': ' + dimension)
+        for label, patterns in labels.items():
+            if label not in rules[dimension]:
+                raise ValueError('Unknown ' + dimension + ' label in ' + path + ': ' + label)
+            rules[dimension][label].extend(patterns)
+
+    return rules
+
+
+def match_confidence(matches):
+    """
+    Turns the weighted amount of matches of a label into a confidence between 0 and 1.
+
+    Args:
+        matches (float): The weighted amount of matches.
+
+    Returns:
+        float: The confidence, 0.5 at HALF_CONFIDENCE_MATCHES and approaching 1 with more matches.
+    """
+    return matches / (matches + HALF_CONFIDENCE_MATCHES)
+
+
+class LabelClassifier:
+    """
+    The LabelClassifier class suggests the subject and problem labels of posts from keyword and regex rules.
+
+    The rules of every label are compiled into one regular expression per label, so every label counts its
+    matches on its own, even where they overlap with the matches of another label. Matches in the title weigh
+    TITLE_WEIGHT times as much. A post is confident when its best subject and its best problem both reach
+    AUTO_LABEL_THRESHOLD.
+
+    Example Usage:
+    ```python
+    classifier = LabelClassifier(load_rules())
+    for record, suggestion in zip(batch, classifier.suggest_batch(batch)):
+        if suggestion["confident"]:
+            record.subject = suggestion["subject"]
+    ```
+    """
+
+    def __init__(self, rules=None):
+        """
+        Compiles the rules.
+
+        Args:
+            rules (dict, optional): The rules per dimension and label, see load_rules(). Defaults to DEFAULT_RULES.
+
+        Returns:
+            None
+        """
+        rules = rules if rules is not None else DEFAULT_RULES
+        self.patterns = []
+
+        for dimension, labels in rules.items():
+            for label, patterns in labels.items():
+                if patterns:
+                    self.patterns.append(((dimension, label), re.compile('|'.join('(?:' + pattern + ')' for pattern in patterns), re.IGNORECASE)))
+
+    def _count_matches(self, text, weight, counts):
+        if not text:
+            return
+        for key, pattern in self.patterns:
+            matches = sum(1 for _ in pattern.finditer(text))
+            if matches:
+                counts[key] = counts.get(key, 0) + matches * weight
+
+    def suggest(self, record):
+        """
+        Suggests the labels of a single post.
+
+        Args:
+            record (PostRecord): The post.
+
+        Returns:
+            dict: The suggested 'subject' and 'problem' labels (best first), the 'confidence' of every label
+            that matched per dimension, and whether the post is 'confident' enough to be labeled without asking.
+        """
+        counts = {}
+        self._count_matches(record.post_title, TITLE_WEIGHT, counts)
+        self._count_matches(record.post_body, 1, counts)
+
+        confidence = {"subject": {}, "problem": {}}
+        for (dimension, label), matches in counts.items():
+            confidence.setdefault(dimension, {})[label] = round(match_confidence(matches), 3)
+
+        suggestion = {"confidence": confidence}
+        confident = True
+        for dimension in ("subject", "problem"):
+            suggested = sorted((label for label, value in confidence[dimension].items() if value >= SUGGESTION_THRESHOLD),
+                               key=lambda label: -confidence[dimension][label])
+            suggestion[dimension] = suggested
+            if not suggested or confidence[dimension][suggested[0]] < AUTO_LABEL_THRESHOLD:
+                confident = False
+
+        suggestion["confident"] = confident
+        return suggestion
+
+    def suggest_batch(self, records):
+        """
+        Suggests the labels of a batch of posts.
+
+        Args:
+            records (iterable): The PostRecords.
+
+        Returns:
+            list: The suggestion of every post, see suggest().
+        """
+        return [self.suggest(record) for record in records]
+
+
+def label_suggestions_path_for(output_filename):
+    """
+    Returns the location of the label suggestions that belong to an output file.
+
+    Args:
+        output_filename (str): The path to the output file.
+
+    Returns:
+        str: The path to the suggestion database next to the output file.
+    """
+    return output_filename + '.labels.sqlite'
+
+
+class LabelSuggestionStore:
+    """
+    The LabelSuggestionStore class keeps the suggested labels of the posts in an output, with their confidence.
+
+    Example Usage:
+    ```python
+    with LabelSuggestionStore("output.csv") as suggestions:
+        suggestions.put_batch(batch, classifier.suggest_batch(batch))
+        suggestions.get("abc123")
+    ```
+    """
+
+    def __init__(self, output_filename):
+        """
+        Opens (or creates) the suggestions of an output file.
+
+        Args:
+            output_filename (str): The path to the output file.
+
+        Returns:
+            None
+        """
+        self.connection = sqlite3.connect(label_suggestions_path_for(output_filename))
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS label_suggestions ('
+            'post_id TEXT NOT NULL, '
+            'dimension TEXT NOT NULL, '
+            'label TEXT NOT NULL, '
+            'confidence REAL NOT NULL, '
+            'suggested INTEGER NOT NULL, '
+            'PRIMARY KEY (post_id, dimension, label)) WITHOUT ROWID'
+        )
+        self.connection.execute('CREATE TABLE IF NOT EXISTS confident_posts (post_id TEXT PRIMARY KEY, confident INTEGER NOT NULL) WITHOUT ROWID')
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def put_batch(self, records, suggestions):
+        """
+        Stores the suggestions of a batch of posts, replacing earlier suggestions of the same posts.
+
+        Args:
+            records (list): The PostRecords.
+            suggestions (list): Their suggestions, see LabelClassifier.suggest().
+
+        Returns:
+            None
+        """
+        with self.connection:
+            post_ids = [(str(record.post_id),) for record in records]
+            self.connection.executemany('DELETE FROM label_suggestions WHERE post_id = ?', post_ids)
+            self.connection.executemany(
+                'INSERT INTO label_suggestions (post_id, dimension, label, confidence, suggested) VALUES (?, ?, ?, ?, ?)',
+                [
+                    (str(record.post_id), dimension, label, value, label in suggestion.get(dimension, ()))
+                    for record, suggestion in zip(records, suggestions)
+                    for dimension, labels in suggestion["confidence"].items()
+                    for label, value in labels.items()
+                ]
+            )
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO confident_posts (post_id, confident) VALUES (?, ?)',
+                [(str(record.post_id), suggestion["confident"]) for record, suggestion in zip(records, suggestions)]
+            )
+
+    def get(self, post_id):
+        """
+        Returns the stored suggestion of a post.
+
+        Args:
+            post_id (str): The ID of the post.
+
+        Returns:
+            dict: The suggestion like LabelClassifier.suggest() returns it, or None if the post has none.
+        """
+        confident = self.connection.execute('SELECT confident FROM confident_posts WHERE post_id = ?', (post_id,)).fetchone()
+        if confident is None:
+            return None
+
+        suggestion = {"subject": [], "problem": [], "confidence": {"subject": {}, "problem": {}}, "confident": bool(confident[0])}
+        for dimension, label, value, suggested in self.connection.execute(
+                'SELECT dimension, label, confidence, suggested FROM label_suggestions WHERE post_id = ? ORDER BY confidence DESC', (post_id,)):
+            suggestion["confidence"].setdefault(dimension, {})[label] = value
+            if suggested:
+                suggestion.setdefault(dimension, []).append(label)
+        return suggestion
+
+    def close(self):
+        """
+        Closes the suggestion database.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        self.connection.close()
+
+
+def suggest_labels_for_output(output_filename, classifier, suggestion_store, batch_size=10000):
+    """
+    Suggests the labels of every post in an output in one pass and stores them.
+
+    Args:
+        output_filename (str): The path to the output file.
+        classifier (LabelClassifier): The classifier.
+        suggestion_store (LabelSuggestionStore): Where the suggestions are stored.
+        batch_size (int, optional): The amount of posts read and stored at once. Defaults to 10000.
+
+    Returns:
+        dict: The amount of 'posts', how many got a 'suggested' label and how many are 'confident'.
+    """
+    totals = {"posts": 0, "suggested": 0, "confident": 0}
+
+    for batch in batched(read_records(output_filename), batch_size):
+        suggestions = classifier.suggest_batch(batch)
+        suggestion_store.put_batch(batch, suggestions)
+        totals["posts"] += len(batch)
+        totals["suggested"] += sum(1 for suggestion in suggestions if suggestion["subject"] or suggestion["problem"])
+        totals["confident"] += sum(1 for suggestion in suggestions if suggestion["confident"])
+
+    return totals
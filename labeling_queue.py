@@ -0,0 +1,308 @@
+import json
+import queue
+import sqlite3
+import threading
+import time
+
+from records import POST_FIELDS, PostRecord
+
+# The amount of posts that are fetched and scored ahead of the one being labeled
+DEFAULT_PREFETCH_DEPTH = 5
+
+
+def labeling_queue_path_for(csv_filename):
+    """
+    Returns the location of the labeling queue that belongs to an output file.
+
+    Args:
+        csv_filename (str): The path to the output file.
+
+    Returns:
+        str: The path to the queue database next to the output file.
+    """
+    return csv_filename + '.labeling.sqlite'
+
+
+class LabelingQueue:
+    """
+    The LabelingQueue class keeps the posts of a manual labeling session that haven't been written to the output yet.
+
+    Every post is stored as soon as it has been fetched and scored, together with the labels it got so far.
+    A post is 'pending' until it has been labeled and 'labeled' afterwards, or 'skipped' when the user skipped
+    it; once it is in the output it is dropped from the queue. So a session that is stopped (or crashes) can be resumed without fetching or
+    scoring anything again: the labeled posts are still written, and the pending ones are labeled first.
+
+    Example Usage:
+    ```python
+    with LabelingQueue("output.csv") as labeling_queue:
+        labeling_queue.put(record)
+        for record in labeling_queue.pending():
+            record.subject = ['math']
+            labeling_queue.mark_labeled(record)
+    ```
+    """
+
+    def __init__(self, csv_filename):
+        """
+        Opens (or creates) the labeling queue of an output file.
+
+        Args:
+            csv_filename (str): The path to the output file.
+
+        Returns:
+            None
+        """
+        # The prefetch thread adds posts while the labeling thread reads them, so access is serialized with a lock
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(labeling_queue_path_for(csv_filename), check_same_thread=False)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS labeling_queue ('
+            'post_id TEXT PRIMARY KEY, '
+            'position INTEGER NOT NULL, '
+            "status TEXT NOT NULL DEFAULT 'pending', "
+            'record TEXT NOT NULL, '
+            'queued_at REAL)'
+        )
+        self.connection.execute('CREATE INDEX IF NOT EXISTS labeling_queue_status ON labeling_queue (status, position)')
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __contains__(self, post_id):
+        with self.lock:
+            return self.connection.execute('SELECT 1 FROM labeling_queue WHERE post_id = ?', (post_id,)).fetchone() is not None
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM labeling_queue').fetchone()[0]
+
+    @staticmethod
+    def _dump(record):
+        return json.dumps({field: getattr(record, field) for field in POST_FIELDS})
+
+    @staticmethod
+    def _load(data):
+        return PostRecord(**json.loads(data))
+
+    def put(self, record):
+        """
+        Adds a fetched and scored post to the end of the queue, a post that is already queued is left as it is.
+
+        Args:
+            record (PostRecord): The post.
+
+        Returns:
+            None
+        """
+        with self.lock:
+            self.connection.execute(
+                'INSERT OR IGNORE INTO labeling_queue (post_id, position, record, queued_at) '
+                'VALUES (?, (SELECT COALESCE(MAX(position), 0) + 1 FROM labeling_queue), ?, ?)',
+                (record.post_id, self._dump(record), time.time())
+            )
+            self.connection.commit()
+
+    def mark_labeled(self, record):
+        """
+        Stores the labels of a post, it is written to the output at the end of the session.
+
+        Args:
+            record (PostRecord): The labeled post.
+
+        Returns:
+            None
+        """
+        with self.lock:
+            self.connection.execute(
+                "UPDATE labeling_queue SET status = 'labeled', record = ? WHERE post_id = ?",
+                (self._dump(record), record.post_id)
+            )
+            self.connection.commit()
+
+    def mark_skipped(self, record):
+        """
+        Remembers that a post was skipped, it isn't labeled or written and isn't fetched again by later sessions.
+
+        Args:
+            record (PostRecord): The skipped post.
+
+        Returns:
+            None
+        """
+        with self.lock:
+            self.connection.execute("UPDATE labeling_queue SET status = 'skipped' WHERE post_id = ?", (record.post_id,))
+            self.connection.commit()
+
+    def _records(self, status):
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT record FROM labeling_queue WHERE status = ? ORDER BY position', (status,)
+            ).fetchall()
+        return [self._load(row[0]) for row in rows]
+
+    def pending(self):
+        """
+        Returns the posts that still have to be labeled, in the order they were queued.
+
+        Args:
+            None
+
+        Returns:
+            list: The PostRecords.
+        """
+        return self._records('pending')
+
+    def labeled(self):
+        """
+        Returns the posts that were labeled but not written to the output yet.
+
+        Args:
+            None
+
+        Returns:
+            list: The PostRecords with their labels.
+        """
+        return self._records('labeled')
+
+    def discard_written(self, post_id_index):
+        """
+        Drops every queued post that is stored in the output by now.
+
+        Args:
+            post_id_index (PostIdIndex): The index of the posts already in the output.
+
+        Returns:
+            int: The amount of posts that were dropped.
+        """
+        with self.lock:
+            post_ids = [row[0] for row in self.connection.execute('SELECT post_id FROM labeling_queue')]
+        written = [(post_id,) for post_id in post_ids if post_id in post_id_index]
+
+        with self.lock:
+            self.connection.executemany('DELETE FROM labeling_queue WHERE post_id = ?', written)
+            self.connection.commit()
+        return len(written)
+
+    def close(self):
+        """
+        Closes the connection to the queue database.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        self.connection.close()
+
+
+class Prefetcher:
+    """
+    The Prefetcher class fetches, scores and queues the next posts in a background thread while the current one is labeled.
+
+    The thread runs the given record stream, stores every record in the labeling queue and hands it over
+    through a bounded queue, so at most depth posts are fetched ahead of the one on screen. The stream is
+    expected to already skip the posts that are in the output or in the labeling queue. An error in the
+    thread is raised again in the thread that iterates over the prefetcher.
+
+    Example Usage:
+    ```python
+    with Prefetcher(records, labeling_queue, depth=5) as prefetcher:
+        for record in prefetcher:
+            ...
+    ```
+    """
+
+    # Marks the end of the record stream in the handover queue
+    _DONE = object()
+
+    def __init__(self, records, labeling_queue, depth=DEFAULT_PREFETCH_DEPTH):
+        """
+        Starts fetching the records in the background.
+
+        Args:
+            records (iterable): The fully built and scored PostRecords to prefetch.
+            labeling_queue (LabelingQueue): The queue every fetched record is stored in.
+            depth (int, optional): The most records fetched ahead. Defaults to DEFAULT_PREFETCH_DEPTH.
+
+        Returns:
+            None
+        """
+        self.records = records
+        self.labeling_queue = labeling_queue
+        self.handover = queue.Queue(maxsize=max(1, depth))
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='labeling-prefetch', daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _hand_over(self, item):
+        # Waits for room in the handover queue, but gives up once the prefetcher is closed
+        while not self.stop_event.is_set():
+            try:
+                self.handover.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self):
+        try:
+            for record in self.records:
+                # Checked before every write, so nothing is stored once close() may go on to close the labeling queue
+                if self.stop_event.is_set():
+                    return
+                # Stored first, so a record is never lost between the thread and the labeling
+                self.labeling_queue.put(record)
+                if not self._hand_over(record):
+                    return
+        except Exception as error:
+            self._hand_over(error)
+            return
+        self._hand_over(self._DONE)
+
+    def ready(self):
+        """
+        Returns the amount of posts that are fetched and waiting to be labeled.
+
+        Args:
+            None
+
+        Returns:
+            int: The amount of waiting posts.
+        """
+        return self.handover.qsize()
+
+    def __iter__(self):
+        while True:
+            item = self.handover.get()
+            if item is self._DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def close(self):
+        """
+        Stops fetching, the records that were fetched already stay in the labeling queue.
+
+        Waits until the thread stopped, which takes until the post it is fetching has arrived, so the labeling
+        queue and the output can be closed right after this returns.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        self.stop_event.set()
+        self.thread.join()
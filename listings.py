@@ -0,0 +1,240 @@
+import datetime
+
+# The listings a subreddit can be scraped from
+LISTING_TYPES = ['hot', 'new', 'top', 'rising', 'controversial', 'search', 'backfill']
+
+# The time filters Reddit accepts for the 'top', 'controversial' and 'search' listings
+TIME_FILTERS = ['hour', 'day', 'week', 'month', 'year', 'all']
+
+# Listings that return the newest posts first, so they can stop at the first post that is already known
+DATE_ORDERED_LISTINGS = ['new', 'search']
+
+# Reddit never returns more than this many posts for a single listing, no matter how far it is paged
+LISTING_CAP = 1000
+
+# Backfill windows are never split into windows shorter than this
+MIN_WINDOW_SECONDS = 60
+
+
+def listing_key(listing, time_filter='all', query=None):
+    """
+    Returns the name a listing is stored under in the checkpoints.
+
+    Args:
+        listing (str): The listing type.
+        time_filter (str, optional): The time filter of the listing. Defaults to 'all'.
+        query (str, optional): The search query of the listing. Defaults to None.
+
+    Returns:
+        str: The checkpoint name (e.g. 'hot', 'top:week' or 'search:burnout').
+    """
+    if listing in ('top', 'controversial'):
+        return listing + ':' + time_filter
+    if listing == 'search':
+        return listing + ':' + (query or '')
+    return listing
+
+
+def get_listing(subreddit, listing='hot', limit=100, time_filter='all', query=None, params=None):
+    """
+    Returns the listing generator of a subreddit for the chosen listing type.
+
+    Args:
+        subreddit (praw.models.Subreddit): The subreddit to list.
+        listing (str, optional): One of 'hot', 'new', 'top', 'rising', 'controversial' or 'search'. Defaults to 'hot'.
+        limit (int, optional): The maximum number of posts. Defaults to 100.
+        time_filter (str, optional): The time filter for 'top', 'controversial' and 'search'. Defaults to 'all'.
+        query (str, optional): The search query for 'search'. Defaults to None.
+        params (dict, optional): Extra listing parameters (e.g. the 'after' cursor). Defaults to None.
+
+    Returns:
+        ListingGenerator: The lazily paged listing.
+    """
+    params = params or {}
+
+    if listing in ('hot', 'new', 'rising'):
+        return getattr(subreddit, listing)(limit=limit, params=params)
+    if listing in ('top', 'controversial'):
+        return getattr(subreddit, listing)(time_filter=time_filter, limit=limit, params=params)
+    if listing == 'search':
+        # Sorted by new, so the results can be checkpointed like the 'new' listing
+        return subreddit.search(query, sort='new', time_filter=time_filter, limit=limit, params=params)
+
+    raise ValueError('Unknown listing type: ' + str(listing))
+
+
+def split_time_range(start_timestamp, end_timestamp, window_seconds):
+    """
+    Splits a time range into consecutive windows, newest window first.
+
+    Args:
+        start_timestamp (float): The start of the range as a Unix timestamp.
+        end_timestamp (float): The end of the range as a Unix timestamp.
+        window_seconds (float): The length of every window.
+
+    Returns:
+        list: A list of (start, end) tuples.
+    """
+    windows = []
+    window_end = end_timestamp
+
+    while window_end > start_timestamp:
+        window_start = max(window_end - window_seconds, start_timestamp)
+        windows.append((window_start, window_end))
+        window_end = window_start
+
+    return windows
+
+
+def iter_newest_in_range(submissions, start_timestamp, end_timestamp, limit, subreddit_name=''):
+    """
+    Takes the posts between two timestamps from a listing that returns the newest posts first.
+
+    The listing is paged until it reaches a post older than the range, so it costs at most LISTING_CAP / 100
+    requests. Reddit stops every listing after LISTING_CAP posts, so when the listing ends before it got to
+    the start of the range the older posts can't be reached, and a RuntimeError says so after the reachable
+    posts were yielded.
+
+    Args:
+        submissions (iterable): The listing, newest post first (e.g. subreddit.new()).
+        start_timestamp (float): The start of the range as a Unix timestamp.
+        end_timestamp (float): The end of the range as a Unix timestamp, not included.
+        limit (int): The maximum number of posts.
+        subreddit_name (str, optional): The subreddit, used in the error message. Defaults to ''.
+
+    Yields:
+        Submission: Every reachable post in the range, newest first.
+    """
+    yielded = 0
+    listed = 0
+    oldest_timestamp = None
+
+    for submission in submissions:
+        listed += 1
+        oldest_timestamp = submission.created_utc
+        if submission.created_utc >= end_timestamp:
+            continue
+        if submission.created_utc < start_timestamp:
+            return
+        if yielded >= limit:
+            return
+        yielded += 1
+        yield submission
+
+    if listed >= LISTING_CAP:
+        raise RuntimeError(
+            'Reddit only lists the newest ' + str(LISTING_CAP) + ' posts of r/' + subreddit_name + ', the backfill reached back to '
+            + datetime.datetime.fromtimestamp(oldest_timestamp).strftime('%Y-%m-%d %H:%M') + ' and can\'t get to the posts before that'
+        )
+
+
+def iter_time_windows(subreddit, start_timestamp, end_timestamp, limit, query=None, window_seconds=86400):
+    """
+    Pages a subreddit's posts between two timestamps by searching it one time window at a time.
+
+    A single listing stops after LISTING_CAP posts, so the range is split into windows that are searched one
+    after another. Windows start out large to keep the amount of requests low. A window that fills the whole
+    cap probably holds more posts than Reddit returned, so it is split in half and both halves are searched
+    again. The window is passed to Reddit as a cloudsearch timestamp range.
+
+    Reddit no longer honors the timestamp syntax for most subreddits and then returns posts from outside the
+    window. As soon as that happens the windows are given up (they would all return the same newest posts),
+    and the rest of the range is taken from the newest posts instead, see iter_newest_in_range(). That only
+    reaches back LISTING_CAP posts, anything older ends the backfill with a RuntimeError.
+
+    Args:
+        subreddit (praw.models.Subreddit): The subreddit to search.
+        start_timestamp (float): The start of the range as a Unix timestamp.
+        end_timestamp (float): The end of the range as a Unix timestamp.
+        limit (int): The maximum number of posts in total.
+        query (str, optional): An extra search query the posts have to match. Defaults to None.
+        window_seconds (float, optional): The length of the first windows. Defaults to one day.
+
+    Yields:
+        Submission: Every post in the range, newest window first.
+    """
+    pending_windows = split_time_range(int(start_timestamp), int(end_timestamp), int(window_seconds))
+    yielded = 0
+
+    while pending_windows and yielded < limit:
+        window_start, window_end = pending_windows.pop(0)
+        # Cloudsearch ranges include both ends, while the windows don't include their end
+        window_query = 'timestamp:' + str(window_start) + '..' + str(window_end - 1)
+        if query:
+            window_query = "(and " + window_query + " '" + query.replace("'", "") + "')"
+
+        window_posts = list(subreddit.search(window_query, sort='new', syntax='cloudsearch', time_filter='all', limit=LISTING_CAP))
+
+        if any(not window_start <= submission.created_utc < window_end for submission in window_posts):
+            # The timestamp range was ignored, so the rest of the range is taken from the newest posts
+            if query:
+                newest = subreddit.search(query, sort='new', time_filter='all', limit=LISTING_CAP)
+            else:
+                newest = subreddit.new(limit=LISTING_CAP)
+            yield from iter_newest_in_range(newest, start_timestamp, window_end, limit - yielded, str(getattr(subreddit, 'display_name', subreddit)))
+            return
+
+        if len(window_posts) >= LISTING_CAP and window_end - window_start > MIN_WINDOW_SECONDS:
+            # The window was cut off by the listing cap, search both halves instead
+            middle = (window_start + window_end) // 2
+            pending_windows[0:0] = [(middle, window_end), (window_start, middle)]
+            continue
+
+        for submission in window_posts:
+            if yielded >= limit:
+                return
+            yielded += 1
+            yield submission
+
+
+def date_to_timestamp(date_string):
+    """
+    Converts a date written as YYYY-MM-DD to the Unix timestamp of its start.
+
+    Args:
+        date_string (str): The date.
+
+    Returns:
+        float: The timestamp, or None if the date isn't valid.
+    """
+    try:
+        return datetime.datetime.strptime(date_string.strip(), '%Y-%m-%d').timestamp()
+    except (AttributeError, ValueError):
+        return None
+
+
+def open_listing(subreddit, listing='hot', limit=100, time_filter='all', query=None, params=None, backfill_range=None):
+    """
+    Returns the posts of a subreddit for any listing type, including the time sliced 'backfill'.
+
+    Args:
+        subreddit (praw.models.Subreddit): The subreddit to list.
+        listing (str, optional): One of LISTING_TYPES. Defaults to 'hot'.
+        limit (int, optional): The maximum number of posts. Defaults to 100.
+        time_filter (str, optional): The time filter for 'top', 'controversial' and 'search'. Defaults to 'all'.
+        query (str, optional): The search query for 'search', or an extra filter for 'backfill'. Defaults to None.
+        params (dict, optional): Extra listing parameters (e.g. the 'after' cursor). Defaults to None.
+        backfill_range (tuple, optional): The (start, end) timestamps for 'backfill'. Defaults to None.
+
+    Returns:
+        iterable: The lazily fetched posts.
+    """
+    if listing == 'backfill':
+        return iter_time_windows(subreddit, backfill_range[0], backfill_range[1], limit, query=query)
+    return get_listing(subreddit, listing=listing, limit=limit, time_filter=time_filter, query=query, params=params)
+
+
+def checkpoint_patience(listing, page_size):
+    """
+    Returns the amount of known posts in a row after which a listing stops paging.
+
+    Args:
+        listing (str): The listing type.
+        page_size (int): The amount of posts per listing page.
+
+    Returns:
+        int: 1 for listings sorted by date, otherwise a full page.
+    """
+    if listing in DATE_ORDERED_LISTINGS:
+        return 1
+    return page_size
@@ -1,30 +1,37 @@
 # Importing dependencies
 import os
-import json
-import pandas as pd
-import praw
-import prawcore
-import datetime
+import sys
+import itertools
 import csv
-from prompt_toolkit.shortcuts import ProgressBar
-from prompt_toolkit.formatted_text import HTML
-from prompt_toolkit.shortcuts import button_dialog, prompt, yes_no_dialog, message_dialog, input_dialog, radiolist_dialog, checkboxlist_dialog, print_formatted_text
-import tkinter as tk
-from tkinter import filedialog
-from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
-
-analyzer = SentimentIntensityAnalyzer()
+from sentiment_analysis import SentimentEngine, sentiment_cache_path_for
+from records import PostRecord
+from pipeline import CSV_COLUMN_ORDER, add_sentiment, build_records, skip_known_posts, stream_to_writer
+from writers import is_parquet_output, is_sqlite_output, open_writer
+from body_store import HASHED_CSV_COLUMN_ORDER
+from dedup_index import PostIdIndex
+from checkpoints import LISTING_PAGE_SIZE, CheckpointStore, stop_at_known_content
+from metrics import RunMetrics, report_path_for
+from batch_scraper import scrape_subreddits_concurrently
+from stream_scraper import stream_subreddits
+from labeling_queue import DEFAULT_PREFETCH_DEPTH, LabelingQueue, Prefetcher
+from label_rules import PROBLEM_CHOICES, SUBJECT_CHOICES, LabelClassifier, load_rules
+from comment_scraper import DEFAULT_MORE_BUDGET, BackgroundCommentScraper, count_comments
+from credentials import SubredditCache, load_last_login, load_profiles, lookup_subreddit, remember_last_login, restore_cached_token, save_profile, validate_credentials
+from listings import LISTING_CAP, TIME_FILTERS, checkpoint_patience, date_to_timestamp, listing_key, open_listing
+
+# Scores in this process and keeps the scores in memory, scrapes into a file use that file's cache instead
+sentiment_engine = SentimentEngine()
 
 # TODO:
 """
-- fix the column_order list requirement in add_dicts_to_csv()
+- fix the column_order list requirement in add_dicts_to_csv() [DONE]
 - fix select_or_create_csv() because when selecting a file you can cancel the filedialog and it will crash the program [DONE]
 - implement exception handling
 - limit subreddit_search_number in main() to only handle integers [DONE]
 - flush the loading screen in RedditScrapeFunctions.autoScraper() [DONE]
 - add more information to loading screen in RedditScrapeFunctions.autoScraper() so people know what is being loaded [DONE]
-- [URGENT] Create a toggle for 'New', 'Hot', etc.
-- [URGENT] Use last saved credentials
+- [URGENT] Create a toggle for 'New', 'Hot', etc. [DONE]
+- [URGENT] Use last saved credentials [DONE]
 """
 
 # CHANGELOG:
@@ -35,6 +42,18 @@ v1.1:
 * Added information to the loading bar so users know what is being downloaded
 """
 
+def clear_screen():
+    """
+    Clears the terminal, on Windows as well as on other systems.
+
+    Args:
+        None
+
+    Returns:
+        None
+    """
+    os.system('cls' if os.name == 'nt' else 'clear')
+
 class RedditScrapeFunctions:
     """
     The RedditScrapeFunctions class is responsible for initializing the Reddit API client and providing methods to scrape information from a specified subreddit using the Reddit API.
@@ -57,7 +76,7 @@ class RedditScrapeFunctions:
     def __init__(self):
         """
         Initializes the Reddit API client by taking user input for the client ID, client secret, and user agent name.
-        It also checks the authentication by attempting to fetch a subreddit attribute.
+        It also checks the authentication, reusing an OAuth token cached by an earlier run when there is one.
 
         Args:
             None
@@ -65,7 +84,7 @@ class RedditScrapeFunctions:
         Returns:
             None
         """
-        sentimentAnalyzer = SentimentIntensityAnalyzer()
+        self.subreddit_cache = SubredditCache()
 
         while True:
             login_style = radiolist_dialog(
@@ -80,19 +99,10 @@ class RedditScrapeFunctions:
             profile_login_cancelled = False
 
             if login_style:
-                if os.path.exists(os.getenv('APPDATA') + '\\redditscraper\\login_details.json'):
-                    pass
-                else:
-                    if not os.path.exists(os.getenv('APPDATA') + '\\redditscraper'):
-                        os.makedirs(os.getenv('APPDATA') + '\\redditscraper')
-                    with open(os.getenv('APPDATA') + '\\redditscraper\\login_details.json', 'w') as file:
-                        empty_json = {}
-                        json.dump(empty_json, file)
-                
-                with open(os.getenv('APPDATA') + '\\redditscraper\\login_details.json', 'r') as file:
-                    extracted_user_data = json.load(file)
-                    json_extracted_usernames = list(extracted_user_data.keys())
-                
+                extracted_user_data = load_profiles()
+                json_extracted_usernames = list(extracted_user_data.keys())
+                last_login = load_last_login()
+
                 login_username_list = []
 
                 for i in range(len(json_extracted_usernames)):
@@ -100,10 +110,12 @@ class RedditScrapeFunctions:
 
                 login_username_list.append(('new', 'Add a new profile'))
 
+                # The profile used last time is preselected
                 chosen_login_profile = radiolist_dialog(
                 title="Login",
                 text="Select your login profile",
-                values=login_username_list
+                values=login_username_list,
+                default=last_login.get('profile') if last_login.get('profile') in extracted_user_data else None
                 ).run()
 
                 if chosen_login_profile is None:
@@ -129,13 +141,7 @@ class RedditScrapeFunctions:
                             else:
                                 new_profile_creation_cancelled = True
                         else:
-                            new_profile = {
-                                'client_id': new_database_username_entry,
-                                'client_secret': new_database_password_entry
-                                }
-                            extracted_user_data[new_database_name_entry] = new_profile
-                            with open(os.getenv('APPDATA') + '\\redditscraper\\login_details.json', 'w') as file:
-                                json.dump(extracted_user_data, file, indent=4)
+                            save_profile(new_database_name_entry, new_database_username_entry, new_database_password_entry)
                             profile_login_cancelled = True
                             break
                 else:
@@ -143,8 +149,10 @@ class RedditScrapeFunctions:
                     reddit_client_secret = extracted_user_data[chosen_login_profile]['client_secret']
                     reddit_user_agent = input_dialog(
                         title='Input Required',
-                        text='Please enter a user agent name.\n(e.g. "MyRedditBot vX.X by /u/YourRedditName"):').run()
+                        text='Please enter a user agent name.\n(e.g. "MyRedditBot vX.X by /u/YourRedditName"):',
+                        default=last_login.get('user_agent', '')).run()
             else:
+                chosen_login_profile = None
                 reddit_client_id = input_dialog(
                     title='Credentials Required',
                     text='Please enter your Reddit API client ID:').run()
@@ -158,6 +166,8 @@ class RedditScrapeFunctions:
                     text='Please enter a user agent name.\n(e.g. "MyRedditBot vX.X by /u/YourRedditName"):').run()
 
             if not profile_login_cancelled:
+                import praw
+
                 # PRAW instantiation
                 self.reddit = praw.Reddit(
                     # Your Reddit app ID
@@ -168,14 +178,19 @@ class RedditScrapeFunctions:
                     user_agent=reddit_user_agent,
                 )
 
-                # The only way to check authentication w/o using the user pass and username is by
-                # trying to fetch a subreddit atribute.
-                try:
-                    subreddit = self.reddit.subreddit("python")
-                    for post in subreddit.hot(limit=1):
-                        post.title
+                # Requesting a token proves the ID and secret work, a token cached by an earlier run
+                # that is still valid proves it without any request at all.
+                if validate_credentials(self.reddit, reddit_client_id, reddit_client_secret):
+                    # Kept so batch scrapes can create a client per thread
+                    self.credentials = {
+                        'client_id': reddit_client_id,
+                        'client_secret': reddit_client_secret,
+                        'user_agent': reddit_user_agent
+                    }
+                    if chosen_login_profile is not None:
+                        remember_last_login(chosen_login_profile, reddit_user_agent)
                     break
-                except Exception as e:
+                else:
                     message_dialog(
                         title='Warning',
                         text='Your ID or secret is incorrect.\n\nPlease enter it again!').run()
@@ -183,9 +198,42 @@ class RedditScrapeFunctions:
                 profile_login_cancelled = False
                 pass
 
+    def make_reddit_client(self, **kwargs):
+        """
+        Creates a new Reddit API client with the credentials that were used to log in.
+
+        Args:
+            **kwargs: Extra settings passed on to praw.Reddit (e.g. requestor_class, or oauth_url to point at a local server).
+
+        Returns:
+            praw.Reddit: The new client.
+        """
+        import praw
+
+        reddit = praw.Reddit(**self.credentials, **kwargs)
+        restore_cached_token(reddit, self.credentials['client_id'], self.credentials['client_secret'])
+        return reddit
+
+    def instrumented_client(self, metrics=None):
+        """
+        Returns the client a scrape should use, one that counts its requests into the metrics when they are given.
+
+        Args:
+            metrics (RunMetrics, optional): The metrics of the run. Defaults to None.
+
+        Returns:
+            praw.Reddit: The logged in client, or a new client with the same credentials that counts its requests.
+        """
+        if metrics is None:
+            return self.reddit
+
+        from scheduler import SchedulingRequestor
+
+        return self.make_reddit_client(requestor_class=SchedulingRequestor, requestor_kwargs={'metrics': metrics})
+
     def test_if_subreddit_exists(self, subreddit_name):
         """
-        Checks if a subreddit exists by attempting to fetch a subreddit attribute.
+        Checks if a subreddit exists, asking Reddit for its about page only when the subreddit cache has no fresh answer.
 
         Args:
             subreddit_name (str): The name of the subreddit to check.
@@ -194,10 +242,8 @@ class RedditScrapeFunctions:
             bool: True if the subreddit exists, False otherwise.
         """
         try:
-            for post in self.reddit.subreddit(subreddit_name).hot(limit=1):
-                post.title
+            if lookup_subreddit(self.reddit, subreddit_name, cache=self.subreddit_cache)['exists']:
                 return True
-        except prawcore.exceptions.NotFound:
             message_dialog(
                         title='Warning',
                         text='This subreddit does not exist!').run()
@@ -208,210 +254,308 @@ class RedditScrapeFunctions:
                         text='An error occured or this subreddit does not exist!').run()
             return False
 
-    def autoScraper(self, subreddit, search_limit=1):
+    def count_comments_exactly(self, reddit, post_id, more_budget=DEFAULT_MORE_BUDGET, metrics=None):
         """
-        Scrapes information from a specified subreddit using the Reddit API.
+        Fetches the comment tree of a post and counts every comment in it, expanding the "load more comments" stubs.
+
+        This costs at least one extra API request per post (plus one per expanded stub), so it is only used by
+        the opt-in "exact comments" mode.
 
         Args:
-            subreddit (str): The name of the subreddit to scrape.
-            search_limit (int, optional): The maximum number of posts to scrape. Defaults to 1.
+            reddit (praw.Reddit): The client the comments are fetched with, see instrumented_client().
+            post_id (str): The ID of the post whose comments should be counted.
+            more_budget (int, optional): The amount of stubs that may be expanded. Defaults to DEFAULT_MORE_BUDGET.
+            metrics (RunMetrics, optional): Gets the time spent loading comments as the 'comments' stage. Defaults to None.
 
         Returns:
-            dict: A dictionary where each key is the post ID and the corresponding value is a dictionary containing the scraped information for each post.
+            int: The amount of comments, or None if the post has more stubs than the budget allows and can't be counted exactly.
         """
-        dict_template = {
-            "source": "",
-            "post_title": "",
-            "post_id": "",
-            "date": "",
-            "author": "",
-            "upvotes": "",
-            "post_url": "",
-            "comment_count": "",
-            "post_body": "",
-            "sentiment": ""
-        }
+        count, complete = count_comments(reddit.submission(id=post_id), more_budget=more_budget, metrics=metrics)
+        return count if complete else None
 
-        return_dict = {}
+    def exact_comment_count_stage(self, records, comment_fetch_cap, reddit, progress_counter=None, metrics=None):
+        """
+        Replaces the metadata comment count of the records with the exact count, up to a maximum amount of posts.
+
+        Posts past the cap, and posts with more comments than the stub budget can expand, keep the comment count
+        from the listing metadata.
+
+        Args:
+            records (iterable): The records coming out of the listing.
+            comment_fetch_cap (int): The maximum number of comment trees to fetch.
+            reddit (praw.Reddit): The client the comments are fetched with, see instrumented_client().
+            progress_counter (ProgressBarCounter, optional): The counter that gets advanced for every fetched comment tree. Defaults to None.
+            metrics (RunMetrics, optional): Gets the time spent fetching comment trees as the 'comments' stage. Defaults to None.
+
+        Yields:
+            PostRecord: The record with its comment count filled in.
+        """
+        fetched = 0
+
+        for record in records:
+            if fetched < comment_fetch_cap:
+                comment_count = self.count_comments_exactly(reddit, record.post_id, metrics=metrics)
+                if comment_count is not None:
+                    record.comment_count = comment_count
+                fetched += 1
+                if progress_counter is not None:
+                    progress_counter.item_completed()
+            yield record
+
+    def autoScraperStream(self, subreddit, search_limit=1, exact_comments=False, comment_fetch_cap=100, post_id_index=None, checkpoint_store=None,
+                          listing='hot', time_filter='all', query=None, backfill_range=None, sentiment_engine=sentiment_engine, metrics=None):
+        """
+        Scrapes information from a specified subreddit using the Reddit API and yields every post as soon as it is scraped.
+
+        The listing, record building and sentiment scoring are chained generators, so only the post that is
+        currently being processed is kept in memory. The comment count is taken from the listing metadata,
+        which costs no extra requests. When exact_comments is set the comment trees are fetched as well.
 
+        Args:
+            subreddit (str): The name of the subreddit to scrape.
+            search_limit (int, optional): The maximum number of posts to scrape. Defaults to 1.
+            exact_comments (bool, optional): Whether to count the comments by fetching the comment trees. Defaults to False.
+            comment_fetch_cap (int, optional): The maximum number of comment trees to fetch in exact mode. Defaults to 100.
+            post_id_index (PostIdIndex, optional): The index of the posts already in the output, these get skipped. Defaults to None.
+            checkpoint_store (CheckpointStore, optional): The checkpoints of the output. When given, an interrupted run continues
+                from its cursor and the listing stops once it reaches posts that were stored by an earlier run. Defaults to None.
+            listing (str, optional): The listing to scrape, one of LISTING_TYPES. Defaults to 'hot'.
+            time_filter (str, optional): The time filter for 'top', 'controversial' and 'search'. Defaults to 'all'.
+            query (str, optional): The search query for 'search' and 'backfill'. Defaults to None.
+            backfill_range (tuple, optional): The (start, end) timestamps for 'backfill'. Defaults to None.
+            sentiment_engine (SentimentEngine, optional): The engine that scores the posts. Defaults to the module's engine.
+            metrics (RunMetrics, optional): Collects the time every stage takes and the requests of the scrape. Defaults to None.
+
+        Yields:
+            PostRecord: The scraped information of a single post.
+        """
         html_title = HTML('Downloading ' + str(search_limit) + ' Reddit entries...')
         html_label = HTML('<ansired>Download progress</ansired>: ')
 
+        listing_params = {}
+        checkpoint = None
+
+        # A backfill walks a fixed time range, so it relies on the post ID index instead of the checkpoints
+        if listing == 'backfill':
+            checkpoint_store = None
+
+        if checkpoint_store is not None:
+            checkpoint = checkpoint_store.get(subreddit, listing_key(listing, time_filter, query))
+            if checkpoint is not None and checkpoint["run_cursor"]:
+                # Continue the interrupted run after the last post it wrote
+                listing_params["after"] = checkpoint["run_cursor"]
+                search_limit = max(search_limit - checkpoint["run_count"], 0)
+
+        # The comment trees of exact mode are fetched through the same client, so their requests are counted as well
+        reddit = self.instrumented_client(metrics)
+
         with ProgressBar(title=html_title) as pb:
-            for submission in pb(self.reddit.subreddit(subreddit).hot(limit=search_limit), total=search_limit, label=html_label):
-                new_dict = dict_template.copy()
-
-                new_dict["source"] = "reddit"
-                new_dict["post_title"] = str(submission.title).encode('utf-8', errors='ignore').decode('utf-8')
-                new_dict["post_id"] = str(submission.id)
-                new_dict["date"] = str(datetime.datetime.fromtimestamp(submission.created).date())
-                new_dict["author"] = str(submission.author).encode('utf-8', errors='ignore').decode('utf-8')
-                new_dict["upvotes"] = str(submission.score)
-                new_dict["post_url"] = str(submission.url).encode('utf-8', errors='ignore').decode('utf-8')
-                new_dict["comment_count"] = str(len(submission.comments))
-                new_dict["post_body"] = str(submission.selftext).encode('utf-8', errors='ignore').decode('utf-8')
-                new_dict["sentiment"] = analyzer.polarity_scores(str(submission.selftext).encode('utf-8', errors='ignore').decode('utf-8'))['compound']
-                return_dict[hash(str(submission.id))] = new_dict
-
-        os.system('cls')
+            subreddit_listing = open_listing(reddit.subreddit(subreddit), listing=listing, limit=search_limit, time_filter=time_filter,
+                                             query=query, params=listing_params, backfill_range=backfill_range)
+            if metrics is not None:
+                subreddit_listing = metrics.timed_iter(subreddit_listing, 'listing')
+            submissions = pb(subreddit_listing, total=search_limit, label=html_label)
+            if checkpoint_store is not None:
+                # Listings that aren't sorted by date only stop after a full page of known posts
+                submissions = stop_at_known_content(submissions, checkpoint, listing=listing, patience=checkpoint_patience(listing, LISTING_PAGE_SIZE),
+                                                    post_id_index=post_id_index)
+            if post_id_index is not None:
+                submissions = skip_known_posts(submissions, post_id_index)
+            records = build_records(submissions, metrics=metrics)
+
+            if exact_comments:
+                comment_counter = pb(total=min(search_limit, comment_fetch_cap), label=HTML('<ansired>Comment progress</ansired>: '))
+                records = self.exact_comment_count_stage(records, comment_fetch_cap, reddit, progress_counter=comment_counter, metrics=metrics)
+
+            yield from add_sentiment(records, sentiment_engine, metrics=metrics)
+
+        clear_screen()
+
+    def autoScraper(self, subreddit, search_limit=1, exact_comments=False, comment_fetch_cap=100, listing='hot', time_filter='all', query=None, backfill_range=None):
+        """
+        Scrapes information from a specified subreddit using the Reddit API.
+
+        Args:
+            subreddit (str): The name of the subreddit to scrape.
+            search_limit (int, optional): The maximum number of posts to scrape. Defaults to 1.
+            exact_comments (bool, optional): Whether to count the comments by fetching the comment trees. Defaults to False.
+            comment_fetch_cap (int, optional): The maximum number of comment trees to fetch in exact mode. Defaults to 100.
+            listing (str, optional): The listing to scrape, one of LISTING_TYPES. Defaults to 'hot'.
+            time_filter (str, optional): The time filter for 'top', 'controversial' and 'search'. Defaults to 'all'.
+            query (str, optional): The search query for 'search' and 'backfill'. Defaults to None.
+            backfill_range (tuple, optional): The (start, end) timestamps for 'backfill'. Defaults to None.
+
+        Returns:
+            dict: A dictionary where each key is the post ID and the corresponding value is the PostRecord of that post.
+        """
+        return_dict = {}
+
+        for post_record in self.autoScraperStream(subreddit, search_limit=search_limit, exact_comments=exact_comments, comment_fetch_cap=comment_fetch_cap,
+                                                  listing=listing, time_filter=time_filter, query=query, backfill_range=backfill_range):
+            return_dict[hash(post_record.post_id)] = post_record
+
         return return_dict
     
-    def manualScraper(self, csv_file_location, subreddit, search_limit=1):
+    def manualScraper(self, csv_file_location, subreddit, search_limit=1, post_id_index=None, sentiment_engine=sentiment_engine, metrics=None,
+                      labeling_queue=None, prefetch_depth=DEFAULT_PREFETCH_DEPTH, label_classifier=None):
         """
         Scrapes information from a specified subreddit using the Reddit API.
 
+        The posts are fetched, scored and stored in the labeling queue by a background thread while the current
+        post is being labeled, so the next post is ready as soon as the current one is done. Posts left in the
+        labeling queue by an earlier session come first: the labeled ones are returned again, so they still get
+        written, and the pending ones are labeled before anything new is fetched.
+
         Args:
+            csv_file_location (str): The output file, posts that are already stored in it get skipped.
             subreddit (str): The name of the subreddit to scrape.
             search_limit (int, optional): The maximum number of posts to scrape. Defaults to 1.
+            post_id_index (PostIdIndex, optional): The index of the posts already in the output. Defaults to the index of csv_file_location.
+            sentiment_engine (SentimentEngine, optional): The engine that scores the posts. Defaults to the module's engine.
+            metrics (RunMetrics, optional): Collects the time every stage takes and the requests of the scrape. Defaults to None.
+            labeling_queue (LabelingQueue, optional): The queue of the session. Defaults to the queue of csv_file_location.
+            prefetch_depth (int, optional): The amount of posts fetched ahead of the one being labeled. Defaults to DEFAULT_PREFETCH_DEPTH.
+            label_classifier (LabelClassifier, optional): Labels the posts it is confident about and preselects its suggestions for the rest. Defaults to None.
 
         Returns:
-            dict: A dictionary where each key is the post ID and the corresponding value is a dictionary containing the scraped information for each post.
+            dict: A dictionary where each key is the post ID and the corresponding value is the PostRecord of that post.
         """
-        dict_template = {
-            "source": "",
-            "post_title": "",
-            "post_id": "",
-            "date": "",
-            "author": "",
-            "upvotes": "",
-            "post_url": "",
-            "comment_count": "",
-            "post_body": "",
-            "subject": "",
-            "problem": "",
-            "sentiment": ""
-        }
-
         return_dict = {}
 
-        html_title = HTML('Downloading ' + str(search_limit) + ' Reddit entries...')
-        html_label = HTML('<ansired>Download progress</ansired>: ')
+        if post_id_index is None:
+            post_id_index = PostIdIndex(csv_file_location)
+        if labeling_queue is None:
+            labeling_queue = LabelingQueue(csv_file_location)
 
-        os.system('cls')
+        # Posts that made it into the output after the last session don't have to be labeled again
+        labeling_queue.discard_written(post_id_index)
+        for post_record in labeling_queue.labeled():
+            return_dict[hash(post_record.post_id)] = post_record
+        resumed_records = labeling_queue.pending()
 
-        with ProgressBar(title=html_title) as pb:
-            subreddit_posts = pb(self.reddit.subreddit(subreddit).hot(limit=search_limit), total=search_limit, label=html_label)
+        subreddit_posts = self.instrumented_client(metrics).subreddit(subreddit).hot(limit=search_limit)
+        if metrics is not None:
+            subreddit_posts = metrics.timed_iter(subreddit_posts, 'listing')
+        new_posts = (submission for submission in skip_known_posts(subreddit_posts, post_id_index) if submission.id not in labeling_queue)
+        # Scored one post at a time, so the first post doesn't wait for a whole batch to be downloaded
+        prefetched_records = add_sentiment(build_records(new_posts, metrics=metrics), sentiment_engine, batch_size=1, metrics=metrics)
 
-        compare_if_exists_list = extract_column_values(csv_file_location, 'post_id')
+        clear_screen()
 
-        os.system('cls')
+        with Prefetcher(prefetched_records, labeling_queue, depth=prefetch_depth) as prefetcher:
+            return self._label_posts(itertools.chain(resumed_records, prefetcher), prefetcher, labeling_queue, return_dict, label_classifier=label_classifier)
 
-        for submission in subreddit_posts:
-            new_dict = dict_template.copy()
+    def _label_posts(self, post_records, prefetcher, labeling_queue, return_dict, label_classifier=None):
+        """
+        Shows every post to the user and asks for its subjects and problems.
 
-            new_dict["source"] = "reddit"
-            new_dict["post_title"] = str(submission.title).encode('utf-8', errors='ignore').decode('utf-8')
-            new_dict["post_id"] = str(submission.id)
-            new_dict["date"] = str(datetime.datetime.fromtimestamp(submission.created).date())
-            new_dict["author"] = str(submission.author).encode('utf-8', errors='ignore').decode('utf-8')
-            new_dict["upvotes"] = str(submission.score)
-            new_dict["post_url"] = str(submission.url).encode('utf-8', errors='ignore').decode('utf-8')
-            new_dict["comment_count"] = str(len(submission.comments))
-            new_dict["post_body"] = str(submission.selftext).encode('utf-8', errors='ignore').decode('utf-8')
-            new_dict["sentiment"] = analyzer.polarity_scores(str(submission.selftext).encode('utf-8', errors='ignore').decode('utf-8'))['compound']
+        With a label classifier, posts it is confident about are labeled with its suggestions without asking,
+        and the other posts are shown with the suggested labels already checked.
 
-            if str(submission.id) not in compare_if_exists_list:
-                print_formatted_text(HTML('<style bg="yellow" fg="black">You can find the post here below: </style>\n'))
+        Args:
+            post_records (iterable): The PostRecords to label.
+            prefetcher (Prefetcher): The prefetcher of the session, for the amount of posts that are ready.
+            labeling_queue (LabelingQueue): The queue the labels are stored in.
+            return_dict (dict): The labeled posts keyed by the hash of their ID, new posts are added to it.
+            label_classifier (LabelClassifier, optional): Suggests the labels of every post. Defaults to None.
 
-                print('Title: ' + str(submission.title))
+        Returns:
+            dict: return_dict with the labeled posts.
+        """
+        for post_record in post_records:
+            suggestion = label_classifier.suggest(post_record) if label_classifier is not None else None
+            if suggestion is not None and suggestion["confident"]:
+                post_record.subject = suggestion["subject"]
+                post_record.problem = suggestion["problem"]
+                return_dict[hash(post_record.post_id)] = post_record
+                labeling_queue.mark_labeled(post_record)
+                continue
+
+            print_formatted_text(HTML('<style bg="yellow" fg="black">You can find the post here below: </style> (' + str(prefetcher.ready()) + ' more ready)\n'))
+
+            print('Title: ' + post_record.post_title)
 
-                print('\n' + str(submission.selftext))
+            print('\n' + post_record.post_body)
 
-                # MAKE PRETTY
-                prompt(HTML('\n<style bg="yellow" fg="black">Press ENTER to continue.</style>\n'))
+            # MAKE PRETTY
+            prompt(HTML('\n<style bg="yellow" fg="black">Press ENTER to continue.</style>\n'))
 
-                os.system('cls')
+            clear_screen()
+
+            while True:
+                subject_box_choice = checkboxlist_dialog(
+                    title="Options",
+                    text="What subjects were discussed in this topic?" + suggestion_text(suggestion, "subject"),
+                    values=SUBJECT_CHOICES + [("skip", "Skip this post")],
+                    default_values=suggestion["subject"] if suggestion is not None else None
+                ).run()
+
+                if subject_box_choice is None:
+                    cancel_options = yes_no_dialog(
+                        title='Warning',
+                        text='You just pressed cancel. You\'ll stop the scrape and begin the save process. Do you still wish to cancel?').run()
+                    if cancel_options:
+                        return return_dict
+                elif subject_box_choice == ['skip']:
+                    break
+                else:
+                    post_record.subject = subject_box_choice
+                    break
 
+            if subject_box_choice == ['skip']:
+                pass
+            else:
                 while True:
-                    subject_box_choice = checkboxlist_dialog(
+                    problem_box_choice = checkboxlist_dialog(
                         title="Options",
-                        text="What subjects were discussed in this topic?",
-                        values=[
-                            ("math", "Math"),
-                            ("science", "Sciences"),
-                            ("lang", "Language"),
-                            ("societies", "Individuals and Societies"),
-                            ("arts", "Arts"),
-                            ("misc", "Misc"),
-                            ("skip", "Skip this post")
-                        ]
+                        text="What problems were discussed in this topic?" + suggestion_text(suggestion, "problem"),
+                        values=PROBLEM_CHOICES,
+                        default_values=suggestion["problem"] if suggestion is not None else None
                     ).run()
 
-                    if subject_box_choice is None:
+                    if problem_box_choice is None:
                         cancel_options = yes_no_dialog(
                             title='Warning',
                             text='You just pressed cancel. You\'ll stop the scrape and begin the save process. Do you still wish to cancel?').run()
                         if cancel_options:
+                            return_dict[hash(post_record.post_id)] = post_record
+                            labeling_queue.mark_labeled(post_record)
                             return return_dict
-                    elif subject_box_choice == ['skip']:
-                        break
                     else:
-                        new_dict["subject"] = subject_box_choice
+                        post_record.problem = problem_box_choice
                         break
+            
+            if subject_box_choice == ['skip']:
+                labeling_queue.mark_skipped(post_record)
+            else:
+                return_dict[hash(post_record.post_id)] = post_record
+                labeling_queue.mark_labeled(post_record)
 
-                if subject_box_choice == ['skip']:
-                    pass
-                else:
-                    while True:
-                        problem_box_choice = checkboxlist_dialog(
-                            title="Options",
-                            text="What problems were discussed in this topic?",
-                            values=[
-                                ("teachers", "Lack of quality teachers/teaching"),
-                                ("ia", "Need college support"),
-                                ("workload", "Too high workload"),
-                                ("ib", "IB structure unclear/confusing"),
-                                ("resources", "Bad/not enough resources"),
-                                ("college", "Need college guidance"),
-                                ("management", "Difficulties with time management or organization"),
-                                ("mental", "Mental health issues"),
-                                ("structure", "Needs a (specific) study guide/structure"),
-                                ("langbarrier", "Language barrier"),
-                            ]
-                        ).run()
-
-                        if problem_box_choice is None:
-                            cancel_options = yes_no_dialog(
-                                title='Warning',
-                                text='You just pressed cancel. You\'ll stop the scrape and begin the save process. Do you still wish to cancel?').run()
-                            if cancel_options:
-                                return_dict[hash(str(submission.id))] = new_dict
-                                return return_dict
-                        else:
-                            new_dict["problem"] = problem_box_choice
-                            break
-                
-                if subject_box_choice != "skip":
-                    return_dict[hash(str(submission.id))] = new_dict
-
-            os.system('cls')
+            clear_screen()
 
         return return_dict
 
-def extract_column_values(csv_file, column_name):
-        """
-        Extracts all values from a specified column in a CSV file.
+def suggestion_text(suggestion, dimension):
+    """
+    Describes the suggested labels of a post for a labeling dialog.
 
-        Args:
-        csv_file (str): The path to the CSV file.
-        column_name (str): The name of the column to extract values from.
+    Args:
+        suggestion (dict): The suggestion of the label classifier, or None.
+        dimension (str): 'subject' or 'problem'.
 
-        Returns:
-        list: A list containing the values from the specified column.
-        """
-        try:
-            # Read the CSV file
-            df = pd.read_csv(csv_file)
-            
-            # Extract the column values
-            if column_name in df.columns:
-                return df[column_name].tolist()
-            else:
-                return False
-        except Exception:
-            return False
+    Returns:
+        str: A line with every suggested label and its confidence, empty without suggestions.
+    """
+    if suggestion is None or not suggestion[dimension]:
+        return ''
+    confidence = suggestion["confidence"][dimension]
+    return '\n(Suggested: ' + ', '.join(label + ' ' + str(round(confidence[label] * 100)) + '%' for label in suggestion[dimension]) + ')'
 
 def select_or_create_csv():
+    # Tkinter is only needed for the file dialogs, so it is imported when they are shown
+    import tkinter as tk
+    from tkinter import filedialog
+
     # Initialize Tkinter
     root = tk.Tk()
     root.withdraw()  # Hide the main window
@@ -424,7 +568,7 @@ def select_or_create_csv():
 
         if result == True:
             # File selection dialog for when user selected yes
-            file_path = filedialog.askopenfilename(filetypes=[("CSV files", "*.csv")])
+            file_path = filedialog.askopenfilename(filetypes=[("CSV files", "*.csv"), ("SQLite databases", "*.sqlite *.sqlite3 *.db")])
             # File path gets returned
             if file_path:
                 return file_path
@@ -435,64 +579,83 @@ def select_or_create_csv():
                 title='Information',
                 text='A file will now be created for you.').run()
             
-            # Define default columns
-            columns = ['source', 'date', 'post_title', 'post_id', 'author', 
-                    'upvotes', 'post_url', 'comment_count', 'post_body', 'sentiment', 'subject', 'problem']
-
             # Saving file dialog
-            file_path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV files", "*.csv")])
+            file_path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV files", "*.csv"), ("SQLite databases", "*.sqlite"), ("Parquet datasets", "*.parquet")])
             # If it's detected that a file has been selected it will continue else it will go back to the yes no dialog
             if file_path:
-                # Create a new CSV file with specified columns
-                with open(file_path, 'w', newline='', encoding='utf-8') as file:
-                    writer = csv.DictWriter(file, fieldnames=columns)
-                    writer.writeheader()
+                if is_sqlite_output(file_path) or is_parquet_output(file_path):
+                    # The database or dataset directory gets created by the writer
+                    open_writer(file_path).close()
+                else:
+                    # Bodies in a body store keep the CSV small when there are many long or reposted bodies
+                    body_store_choice = yes_no_dialog(
+                        title='Post Bodies',
+                        text='Store the post bodies compressed next to the CSV?\n(The CSV then only holds a hash of every body)').run()
+                    # Create a new CSV file with the default columns
+                    with open(file_path, 'w', newline='', encoding='utf-8') as file:
+                        writer = csv.DictWriter(file, fieldnames=HASHED_CSV_COLUMN_ORDER if body_store_choice else CSV_COLUMN_ORDER)
+                        writer.writeheader()
                 return file_path
 
 def extract_first_level_nested_dicts(main_dict):
     """
-    Extracts the first level nested dictionaries from a given main dictionary.
+    Extracts the post records from a dictionary returned by the scrapers.
 
     Args:
-    - main_dict (dict): The main dictionary from which the first level nested dictionaries need to be extracted.
+    - main_dict (dict): The dictionary from which the post records need to be extracted.
 
     Returns:
-    - nested_dicts (list): A list containing the first level nested dictionaries from the main_dict.
+    - nested_dicts (list): A list containing the PostRecords of the main_dict.
     """
 
     nested_dicts = []
 
     for key, value in main_dict.items():
-        if isinstance(value, dict):
-            nested_dicts.append(value)  # Add only the first level nested dictionary
+        if isinstance(value, PostRecord):
+            nested_dicts.append(value)  # Add only the records
 
     return nested_dicts
 
-def add_dicts_to_csv(dicts, csv_filename=None):
+def add_dicts_to_csv(dicts, csv_filename=None, post_id_index=None, metrics=None):
     """
-    Appends the values from a list of dictionaries to a CSV file.
+    Appends the values from a list of post records to a CSV file (or a SQLite database, depending on the extension).
+
+    The values are written in the order of the file's header, see CsvRecordWriter.
 
     Args:
-        dicts (list of dictionaries): A list of dictionaries containing the data to be added to the CSV file.
+        dicts (list of PostRecords): A list of records containing the data to be added to the CSV file.
         csv_filename (string, optional): The filename of the CSV file to which the data will be appended. Defaults to None.
+        post_id_index (PostIdIndex, optional): The index of the CSV file, the written post IDs get added to it. Defaults to None.
+        metrics (RunMetrics, optional): Gets the time spent writing and the written posts. Defaults to None.
 
     Returns:
-        None: The function does not return any value. It appends the values from the dictionaries to the CSV file.
+        None: The function does not return any value. It appends the values from the records to the CSV file.
     """
 
     if csv_filename == None:
         return
     
-    with open(csv_filename, 'a', encoding='utf-8', newline='') as csvfile:
-        writer = csv.writer(csvfile)
+    with open_writer(csv_filename) as writer:
+        stream_to_writer(dicts, writer, batch_size=max(len(dicts), 1), metrics=metrics)
 
-        column_order = ['platform', 'date', 'post_title', 'post_id', 'author', 
-                   'upvotes', 'post_url', 'comment_count', 'post_body', 'sentiment', 'subject', 'problem']
+    if post_id_index is not None:
+        post_id_index.record_written([record.post_id for record in dicts])
 
-        # For each dictionary, add its values to the CSV file
-        for d in dicts:
-            row = [d.get(key, '') for key in column_order]  # Get values based on the column order, default to empty string
-            writer.writerow(row)
+def write_run_report(run_metrics, output_filename):
+    """
+    Writes the performance report of a finished scrape next to its output.
+
+    Args:
+        run_metrics (RunMetrics): The metrics of the scrape.
+        output_filename (str): The output the scrape wrote to.
+
+    Returns:
+        str: A short summary of the report for the completion dialog.
+    """
+    run_metrics.finish()
+    report = run_metrics.write_json(report_path_for(output_filename))
+    return (str(report['posts']) + ' posts in ' + str(round(report['duration_seconds'], 1)) + 's ('
+            + str(round(report['posts_per_second'], 1)) + ' posts/s, ' + str(report['counters'].get('api_requests', 0)) + ' API requests)')
 
 def main_menu():
     main_menu_result = radiolist_dialog(
@@ -506,6 +669,95 @@ def main_menu():
     
     return main_menu_result
 
+def choose_listing_options():
+    """
+    Asks the user which listing to scrape, together with the time filter, search query or date range it needs.
+
+    Args:
+        None
+
+    Returns:
+        dict: The listing, time_filter, query and backfill_range, or None if the user cancelled.
+    """
+    listing_options = {'listing': 'hot', 'time_filter': 'all', 'query': None, 'backfill_range': None}
+
+    listing_options['listing'] = radiolist_dialog(
+        title="Listing",
+        text="Which posts would you like to scrape?",
+        values=[
+            ("hot", "Hot"),
+            ("new", "New"),
+            ("top", "Top"),
+            ("rising", "Rising"),
+            ("controversial", "Controversial"),
+            ("search", "Search"),
+            ("backfill", "Backfill a date range (more than 1000 posts)"),
+        ]
+    ).run()
+
+    if listing_options['listing'] is None:
+        return None
+
+    if listing_options['listing'] in ('top', 'controversial', 'search'):
+        listing_options['time_filter'] = radiolist_dialog(
+            title="Time Filter",
+            text="From which period would you like the posts?",
+            values=[(time_filter, time_filter.capitalize()) for time_filter in TIME_FILTERS]
+        ).run()
+        if listing_options['time_filter'] is None:
+            return None
+
+    if listing_options['listing'] == 'search':
+        while not listing_options['query']:
+            listing_options['query'] = input_dialog(
+                title='Information Required',
+                text='What would you like to search for?').run()
+            if listing_options['query'] is None:
+                return None
+
+    if listing_options['listing'] == 'backfill':
+        while True:
+            start_date = input_dialog(
+                title='Information Required',
+                text='From which date would you like to collect posts (YYYY-MM-DD)?').run()
+            end_date = input_dialog(
+                title='Information Required',
+                text='Until which date would you like to collect posts (YYYY-MM-DD)?').run()
+            if start_date is None or end_date is None:
+                return None
+            start_timestamp = date_to_timestamp(start_date)
+            end_timestamp = date_to_timestamp(end_date)
+            if start_timestamp is not None and end_timestamp is not None and start_timestamp < end_timestamp:
+                listing_options['backfill_range'] = (start_timestamp, end_timestamp)
+                break
+            message_dialog(
+                title='Warning',
+                text='Please enter two valid dates, with the first one before the second one.').run()
+
+    return listing_options
+
+def ask_search_number(listing_options, per_subreddit=False):
+    """
+    Asks the user how many posts to collect. Only a backfill can go past the 1000 posts a listing returns.
+
+    Args:
+        listing_options (dict): The listing options returned by choose_listing_options().
+        per_subreddit (bool, optional): Whether the amount is asked per Subreddit. Defaults to False.
+
+    Returns:
+        int: The amount of posts to collect.
+    """
+    maximum = LISTING_CAP if listing_options['listing'] != 'backfill' else 1000000
+    question = 'How many entries would you like to collect' + (' per Subreddit' if per_subreddit else '') + ' (e.g. 1-' + str(maximum) + ')?:'
+
+    while True:
+        subreddit_search_number = input_dialog(
+            title='Information Required',
+            text=question).run()
+        if subreddit_search_number is not None and subreddit_search_number.isdigit():
+            if int(subreddit_search_number) > 0 and int(subreddit_search_number) <= maximum:
+                return int(subreddit_search_number)
+
 def main():
 
     bot = RedditScrapeFunctions()
@@ -523,6 +775,8 @@ def main():
                 values=[
                     ("manual", "Manual Scraping"),
                     ("auto", "Automatic Scraping"),
+                    ("batch", "Batch Scraping (multiple Subreddits)"),
+                    ("stream", "Live Stream (new posts until Ctrl+C)"),
                     ("mainmenu", "Return to Main Menu"),
                 ]
             ).run()
@@ -534,22 +788,57 @@ def main():
                     # This if statement takes a Subreddit and if it exists let's it through
                     if bot.test_if_subreddit_exists(user_menu_subreddit_choice):
                         break
-                # FROM THIS POINT FORWARD CODE NEEDS TO BE OPTIMIZED
-                while True:
-                    subreddit_search_number = input_dialog(
-                        title='Information Required',
-                        text='How many entries would you like to collect (e.g. 1-1000)?:').run()
-                    if subreddit_search_number.isdigit():
-                        if int(subreddit_search_number) > 0 and int(subreddit_search_number) < 1001:
-                            break
-                subreddit_search_number = int(subreddit_search_number)
+                listing_options = choose_listing_options()
+                if listing_options is None:
+                    continue
+                subreddit_search_number = ask_search_number(listing_options)
+                # Counting comments exactly costs one extra request per post, so it is opt-in
+                exact_comments_choice = yes_no_dialog(
+                    title='Comment Count',
+                    text='Do you want exact comment counts?\n(This fetches the comments of every post and is a lot slower)').run()
+                scrape_comments_choice = yes_no_dialog(
+                    title='Comments',
+                    text='Also scrape the comments of the new posts?\n(They are written next to the posts and cost extra requests per post)').run()
                 user_chosen_csv_dir = select_or_create_csv()
-                scrape_results = bot.autoScraper(subreddit=user_menu_subreddit_choice, search_limit=subreddit_search_number)
-                unnested_scrape_results = extract_first_level_nested_dicts(scrape_results)
-                add_dicts_to_csv(dicts=unnested_scrape_results, csv_filename=user_chosen_csv_dir)
+                # Rows are written in batches while the scrape is running instead of all at once at the end
+                checkpoint_name = listing_key(listing_options['listing'], listing_options['time_filter'], listing_options['query'])
+                # A backfill walks a fixed time range, so it isn't checkpointed
+                uses_checkpoints = listing_options['listing'] != 'backfill'
+                with PostIdIndex(user_chosen_csv_dir) as post_id_index, CheckpointStore(user_chosen_csv_dir) as checkpoint_store, \
+                        SentimentEngine(cache_path=sentiment_cache_path_for(user_chosen_csv_dir)) as output_sentiment_engine:
+                    run_metrics = RunMetrics()
+                    # The comments of the written posts are scraped on a background thread while the scrape goes on
+                    comment_scraper = BackgroundCommentScraper(bot.make_reddit_client, user_chosen_csv_dir, output_sentiment_engine,
+                                                               metrics=run_metrics) if scrape_comments_choice else None
+
+                    def on_batch_written(batch):
+                        post_id_index.record_written([record.post_id for record in batch])
+                        if uses_checkpoints:
+                            checkpoint_store.advance(user_menu_subreddit_choice, checkpoint_name, batch)
+                        if comment_scraper is not None:
+                            comment_scraper.add(record.post_id for record in batch)
+
+                    try:
+                        scrape_stream = bot.autoScraperStream(subreddit=user_menu_subreddit_choice, search_limit=subreddit_search_number, exact_comments=exact_comments_choice,
+                                                              post_id_index=post_id_index, checkpoint_store=checkpoint_store, sentiment_engine=output_sentiment_engine,
+                                                              metrics=run_metrics, **listing_options)
+                        with open_writer(user_chosen_csv_dir) as output_writer:
+                            stream_to_writer(scrape_stream, output_writer, batch_size=output_writer.preferred_batch_size, on_batch_written=on_batch_written,
+                                             metrics=run_metrics)
+                        # Only a run that got to the end moves the checkpoint forward
+                        if uses_checkpoints:
+                            checkpoint_store.finish_run(user_menu_subreddit_choice, checkpoint_name)
+                        if comment_scraper is not None:
+                            print("Waiting for the comments of " + str(comment_scraper.pending()) + " posts...")
+                            comment_scraper.finish()
+                    except BaseException:
+                        if comment_scraper is not None:
+                            # The posts whose comments weren't written yet stay queued for the next run
+                            comment_scraper.stop()
+                        raise
                 message_dialog(
                             title='Process Completed',
-                            text='You can find your updated CSV in ' + str(user_chosen_csv_dir)).run()
+                            text='You can find your updated CSV in ' + str(user_chosen_csv_dir) + '\n\n' + write_run_report(run_metrics, user_chosen_csv_dir)).run()
             elif scraping_menu_result == "manual":
                 while True:
                     user_menu_subreddit_choice = input_dialog(
@@ -567,14 +856,108 @@ def main():
                         if int(subreddit_search_number) > 0 and int(subreddit_search_number) < 1001:
                             break
                 subreddit_search_number = int(subreddit_search_number)
+                # The rules label the posts they are sure about, only the rest is shown (with the suggestions checked)
+                auto_label_choice = yes_no_dialog(
+                    title='Auto Labeling',
+                    text='Label the posts the keyword rules are confident about automatically?\n(The other posts are shown with the suggested labels checked)').run()
+                label_classifier = LabelClassifier(load_rules()) if auto_label_choice else None
                 user_chosen_csv_dir = select_or_create_csv()
-                scrape_results = bot.manualScraper(user_chosen_csv_dir, subreddit=user_menu_subreddit_choice, search_limit=subreddit_search_number)
-                unnested_scrape_results = extract_first_level_nested_dicts(scrape_results)
-                add_dicts_to_csv(dicts=unnested_scrape_results, csv_filename=user_chosen_csv_dir)
+                with PostIdIndex(user_chosen_csv_dir) as post_id_index, LabelingQueue(user_chosen_csv_dir) as labeling_queue, \
+                        SentimentEngine(cache_path=sentiment_cache_path_for(user_chosen_csv_dir)) as output_sentiment_engine:
+                    run_metrics = RunMetrics()
+                    scrape_results = bot.manualScraper(user_chosen_csv_dir, subreddit=user_menu_subreddit_choice, search_limit=subreddit_search_number,
+                                                       post_id_index=post_id_index, sentiment_engine=output_sentiment_engine, metrics=run_metrics,
+                                                       labeling_queue=labeling_queue, label_classifier=label_classifier)
+                    unnested_scrape_results = extract_first_level_nested_dicts(scrape_results)
+                    add_dicts_to_csv(dicts=unnested_scrape_results, csv_filename=user_chosen_csv_dir, post_id_index=post_id_index, metrics=run_metrics)
+                    # The written posts leave the queue, the prefetched ones that weren't labeled stay for the next session
+                    labeling_queue.discard_written(post_id_index)
                 message_dialog(
                             title='Process Completed',
-                            text='You can find your updated CSV in ' + str(user_chosen_csv_dir)).run()
+                            text='You can find your updated CSV in ' + str(user_chosen_csv_dir) + '\n\n' + write_run_report(run_metrics, user_chosen_csv_dir)).run()
+            elif scraping_menu_result == "batch":
+                while True:
+                    user_menu_subreddit_choice = input_dialog(
+                            title='Information Required',
+                            text='Please enter the Subreddit names you\'d like to scrape, separated by commas:').run()
+                    if user_menu_subreddit_choice is None:
+                        break
+                    batch_subreddits = [name.strip() for name in user_menu_subreddit_choice.split(',') if name.strip()]
+                    # Every Subreddit has to exist before the batch starts
+                    if batch_subreddits and all(bot.test_if_subreddit_exists(name) for name in batch_subreddits):
+                        break
+                if user_menu_subreddit_choice is None:
+                    continue
+                listing_options = choose_listing_options()
+                if listing_options is None:
+                    continue
+                subreddit_search_number = ask_search_number(listing_options, per_subreddit=True)
+                user_chosen_csv_dir = select_or_create_csv()
+                with PostIdIndex(user_chosen_csv_dir) as post_id_index, CheckpointStore(user_chosen_csv_dir) as checkpoint_store, \
+                        SentimentEngine(cache_path=sentiment_cache_path_for(user_chosen_csv_dir)) as output_sentiment_engine:
+                    with ProgressBar(title=HTML('Downloading ' + str(len(batch_subreddits)) + ' Subreddits...')) as pb:
+                        subreddit_counters = {name: pb(total=subreddit_search_number, label=HTML('<ansired>' + name + '</ansired>: ')) for name in batch_subreddits}
+
+                        def on_batch_written(subreddit, batch):
+                            for _ in batch:
+                                subreddit_counters[subreddit].item_completed()
+
+                        run_metrics = RunMetrics()
+                        batch_summary = scrape_subreddits_concurrently(
+                            bot.make_reddit_client, batch_subreddits, subreddit_search_number, user_chosen_csv_dir, output_sentiment_engine,
+                            post_id_index=post_id_index, checkpoint_store=checkpoint_store, on_batch_written=on_batch_written, listing_options=listing_options,
+                            metrics=run_metrics)
+                clear_screen()
+                summary_lines = []
+                for name, outcome in batch_summary.items():
+                    if isinstance(outcome, Exception):
+                        summary_lines.append(name + ': failed (' + str(outcome) + ')')
+                    else:
+                        summary_lines.append(name + ': ' + str(outcome) + ' new entries')
+                message_dialog(
+                            title='Process Completed',
+                            text='\n'.join(summary_lines) + '\n\nYou can find your updated CSV in ' + str(user_chosen_csv_dir) + '\n\n' + write_run_report(run_metrics, user_chosen_csv_dir)).run()
+            elif scraping_menu_result == "stream":
+                while True:
+                    user_menu_subreddit_choice = input_dialog(
+                            title='Information Required',
+                            text='Please enter the Subreddit names you\'d like to follow, separated by commas:').run()
+                    if user_menu_subreddit_choice is None:
+                        break
+                    stream_subreddit_names = [name.strip() for name in user_menu_subreddit_choice.split(',') if name.strip()]
+                    if stream_subreddit_names and all(bot.test_if_subreddit_exists(name) for name in stream_subreddit_names):
+                        break
+                if user_menu_subreddit_choice is None:
+                    continue
+                user_chosen_csv_dir = select_or_create_csv()
+                clear_screen()
+                print_formatted_text(HTML('<style bg="yellow" fg="black">Following ' + ', '.join(stream_subreddit_names) + ', press Ctrl+C to stop.</style>'))
+                with PostIdIndex(user_chosen_csv_dir) as post_id_index, CheckpointStore(user_chosen_csv_dir) as checkpoint_store, \
+                        SentimentEngine(cache_path=sentiment_cache_path_for(user_chosen_csv_dir)) as output_sentiment_engine:
+                    def on_batch_written(subreddit, batch):
+                        print(subreddit + ': ' + str(len(batch)) + ' new entries written', flush=True)
+
+                    run_metrics = RunMetrics()
+                    try:
+                        stream_subreddits(bot.make_reddit_client, stream_subreddit_names, user_chosen_csv_dir, output_sentiment_engine,
+                                          post_id_index, checkpoint_store, on_batch_written=on_batch_written, metrics=run_metrics)
+                    except KeyboardInterrupt:
+                        pass
+                clear_screen()
+                message_dialog(
+                            title='Stream Stopped',
+                            text='You can find your updated CSV in ' + str(user_chosen_csv_dir) + '\n\n' + write_run_report(run_metrics, user_chosen_csv_dir)).run()
             elif scraping_menu_result == "mainmenu":
                 pass
 
-main()
\ No newline at end of file
+if __name__ == '__main__':
+    # Any arguments start the headless command line instead of the menus
+    if len(sys.argv) > 1:
+        from cli import run
+        sys.exit(run(sys.argv[1:]))
+
+    # Imported here, so the headless command line runs without prompt_toolkit
+    from prompt_toolkit.shortcuts import ProgressBar
+    from prompt_toolkit.formatted_text import HTML
+    from prompt_toolkit.shortcuts import button_dialog, prompt, yes_no_dialog, message_dialog, input_dialog, radiolist_dialog, checkboxlist_dialog, print_formatted_text
+    main()
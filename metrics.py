@@ -0,0 +1,266 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Every metric in the Prometheus output starts with this
+PROMETHEUS_PREFIX = 'redditscraper_'
+
+
+def report_path_for(output_filename):
+    """
+    Returns the location of the run report that belongs to an output file.
+
+    Args:
+        output_filename (str): The path to the output file.
+
+    Returns:
+        str: The path to the JSON report next to the output file.
+    """
+    return output_filename.rstrip('/\\') + '.report.json'
+
+
+class RunMetrics:
+    """
+    The RunMetrics class collects where a scrape spends its time and how many requests it makes.
+
+    Every stage of the pipeline adds the time it spent to a timer, and the requestor and scheduler add to
+    counters (API requests, retries, rate limit sleeps). The batch scraper updates it from several threads
+    at once, so every update takes a lock. At the end of a run report() turns it into a dictionary, which is
+    written as JSON and optionally in the Prometheus text format.
+
+    Example Usage:
+    ```python
+    metrics = RunMetrics()
+    with metrics.timed('write'):
+        writer.write_batch(batch)
+    metrics.count('posts', len(batch))
+    metrics.write_json("output.csv.report.json")
+    ```
+    """
+
+    def __init__(self):
+        """
+        Starts the clock of the run.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.finished = None
+        self.counters = {}
+        self.timers = {}
+
+    def count(self, name, amount=1):
+        """
+        Adds to a counter.
+
+        Args:
+            name (str): The name of the counter (e.g. 'api_requests').
+            amount (int, optional): The amount to add. Defaults to 1.
+
+        Returns:
+            None
+        """
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def add_time(self, stage, seconds, calls=1):
+        """
+        Adds the time spent in a stage.
+
+        Args:
+            stage (str): The name of the stage (e.g. 'sentiment').
+            seconds (float): The time spent.
+            calls (int, optional): The amount of calls the time covers. Defaults to 1.
+
+        Returns:
+            None
+        """
+        with self.lock:
+            timer = self.timers.setdefault(stage, {'seconds': 0.0, 'calls': 0, 'max_seconds': 0.0})
+            timer['seconds'] += seconds
+            timer['calls'] += calls
+            timer['max_seconds'] = max(timer['max_seconds'], seconds)
+
+    @contextmanager
+    def timed(self, stage):
+        """
+        Times the block it wraps as one call of a stage.
+
+        Args:
+            stage (str): The name of the stage.
+
+        Yields:
+            None
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+
+    def timed_iter(self, iterable, stage):
+        """
+        Times how long every item of an iterable takes to arrive, e.g. the listing waiting for its next page.
+
+        Args:
+            iterable (iterable): The iterable to time.
+            stage (str): The name of the stage.
+
+        Yields:
+            The items of the iterable.
+        """
+        iterator = iter(iterable)
+
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.add_time(stage, time.perf_counter() - start)
+            yield item
+
+    def drain(self):
+        """
+        Takes the counters and stage timings collected so far and starts them over, e.g. to hand them to another process.
+
+        Args:
+            None
+
+        Returns:
+            dict: The counters and stage timings, see merge().
+        """
+        with self.lock:
+            counts = {'counters': self.counters, 'stages': self.timers}
+            self.counters = {}
+            self.timers = {}
+        return counts
+
+    def merge(self, counts):
+        """
+        Adds the counters and stage timings of another RunMetrics, e.g. the ones a worker process collected.
+
+        Args:
+            counts (dict): The counters and stage timings, see drain().
+
+        Returns:
+            None
+        """
+        with self.lock:
+            for name, amount in counts['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + amount
+            for stage, other in counts['stages'].items():
+                timer = self.timers.setdefault(stage, {'seconds': 0.0, 'calls': 0, 'max_seconds': 0.0})
+                timer['seconds'] += other['seconds']
+                timer['calls'] += other['calls']
+                timer['max_seconds'] = max(timer['max_seconds'], other['max_seconds'])
+
+    def finish(self):
+        """
+        Stops the clock of the run, report() uses the current time until this is called.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        self.finished = time.perf_counter()
+
+    def report(self):
+        """
+        Summarizes the run.
+
+        Args:
+            None
+
+        Returns:
+            dict: The duration, posts per second, requests per post, counters and stage timings of the run.
+        """
+        with self.lock:
+            duration = (self.finished or time.perf_counter()) - self.started
+            counters = dict(self.counters)
+            timers = {stage: dict(timer) for stage, timer in self.timers.items()}
+
+        posts = counters.get('posts', 0)
+        requests = counters.get('api_requests', 0)
+
+        return {
+            'started_at': self.started_at,
+            'duration_seconds': duration,
+            'posts': posts,
+            'posts_per_second': posts / duration if duration > 0 else 0.0,
+            'requests_per_post': requests / posts if posts else None,
+            'counters': counters,
+            'stages': timers,
+        }
+
+    def write_json(self, path):
+        """
+        Writes the report as JSON.
+
+        Args:
+            path (str): The file to write.
+
+        Returns:
+            dict: The report that was written.
+        """
+        report = self.report()
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=4)
+        return report
+
+    def prometheus_text(self):
+        """
+        Formats the report in the Prometheus text exposition format, e.g. for the node exporter's textfile collector.
+
+        Args:
+            None
+
+        Returns:
+            str: The metrics, one sample per line.
+        """
+        report = self.report()
+        lines = [
+            '# TYPE ' + PROMETHEUS_PREFIX + 'run_duration_seconds gauge',
+            PROMETHEUS_PREFIX + 'run_duration_seconds ' + repr(report['duration_seconds']),
+            '# TYPE ' + PROMETHEUS_PREFIX + 'posts_per_second gauge',
+            PROMETHEUS_PREFIX + 'posts_per_second ' + repr(report['posts_per_second']),
+        ]
+
+        for name, value in sorted(report['counters'].items()):
+            lines.append('# TYPE ' + PROMETHEUS_PREFIX + name + '_total counter')
+            lines.append(PROMETHEUS_PREFIX + name + '_total ' + str(value))
+
+        lines.append('# TYPE ' + PROMETHEUS_PREFIX + 'stage_seconds_total counter')
+        for stage, timer in sorted(report['stages'].items()):
+            lines.append(PROMETHEUS_PREFIX + 'stage_seconds_total{stage="' + stage + '"} ' + repr(timer['seconds']))
+        lines.append('# TYPE ' + PROMETHEUS_PREFIX + 'stage_calls_total counter')
+        for stage, timer in sorted(report['stages'].items()):
+            lines.append(PROMETHEUS_PREFIX + 'stage_calls_total{stage="' + stage + '"} ' + str(timer['calls']))
+
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        """
+        Writes the Prometheus text to a file, replacing it at once so a collector never reads half a file.
+
+        Args:
+            path (str): The file to write.
+
+        Returns:
+            None
+        """
+        temporary_path = path + '.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as file:
+            file.write(self.prometheus_text())
+        os.replace(temporary_path, path)
@@ -0,0 +1,378 @@
+import json
+import os
+import sqlite3
+import sys
+import uuid
+
+from pipeline import batched
+from records import PostRecord, parse_csv_labels
+from writers import RecordWriter, read_records, to_label_text
+
+# The amount of rows that make up one row group, the scrape pipeline hands this many rows to the writer at once
+DEFAULT_ROW_GROUP_SIZE = 10000
+
+# The amount of staged rows of one partition that are rolled into a Parquet file
+DEFAULT_FILE_ROWS = 50000
+
+# The database inside the dataset directory holding the rows that aren't part of a Parquet file yet,
+# readers skip it because of the leading dot
+STAGING_FILE_NAME = '.staging.sqlite'
+
+# The columns the dataset is partitioned by, they become directories instead of columns in the files
+PARTITION_COLUMNS = ['subreddit', 'date']
+
+# The name Hive style partitions use for a missing value
+MISSING_PARTITION_VALUE = '__HIVE_DEFAULT_PARTITION__'
+
+
+def _import_pyarrow():
+    # pyarrow is only needed for Parquet output, so it is only imported when that output is used
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError('Parquet output needs pyarrow, install it with "pip install pyarrow"')
+    return pyarrow, pyarrow.parquet
+
+
+def parquet_schema(pyarrow):
+    """
+    Returns the schema of the columns stored inside the Parquet files.
+
+    Args:
+        pyarrow (module): The imported pyarrow module.
+
+    Returns:
+        pyarrow.Schema: The schema, without the partition columns.
+    """
+    return pyarrow.schema([
+        ('post_id', pyarrow.string()),
+        ('source', pyarrow.string()),
+        ('post_title', pyarrow.string()),
+        ('author', pyarrow.string()),
+        ('upvotes', pyarrow.int64()),
+        ('post_url', pyarrow.string()),
+        ('comment_count', pyarrow.int64()),
+        ('post_body', pyarrow.string()),
+        ('sentiment', pyarrow.float64()),
+        ('subject', pyarrow.string()),
+        ('problem', pyarrow.string()),
+    ])
+
+
+def partition_value(value):
+    """
+    Converts a subreddit or date to the name used in a partition directory.
+
+    Args:
+        value: The value to convert.
+
+    Returns:
+        str: The directory safe value.
+    """
+    if value is None or str(value) == '':
+        return MISSING_PARTITION_VALUE
+    return str(value).replace('/', '_').replace('\\', '_')
+
+
+def staging_path_for(root_path):
+    """
+    Returns the location of the staging database of a dataset.
+
+    Args:
+        root_path (str): The directory of the dataset.
+
+    Returns:
+        str: The path to the staging database inside the dataset directory.
+    """
+    return os.path.join(root_path, STAGING_FILE_NAME)
+
+
+def read_dataset_version(root_path):
+    """
+    Reads how often rows were written to a dataset, see ParquetRecordWriter.
+
+    Args:
+        root_path (str): The directory of the dataset.
+
+    Returns:
+        int: The version of the dataset, 0 for a dataset that was never written by a ParquetRecordWriter.
+    """
+    staging_path = staging_path_for(root_path)
+    if not os.path.exists(staging_path):
+        return 0
+
+    connection = sqlite3.connect(staging_path)
+    try:
+        row = connection.execute('SELECT version FROM dataset_version').fetchone()
+    except sqlite3.OperationalError:
+        row = None
+    finally:
+        connection.close()
+    return row[0] if row else 0
+
+
+def _partition_record(row, subreddit, date):
+    # The subreddit and date aren't stored with the row, they are taken from its partition
+    partition = {}
+    for key, value in (('subreddit', subreddit), ('date', date)):
+        if value != MISSING_PARTITION_VALUE:
+            partition[key] = value
+
+    record = PostRecord.from_row({**row, **partition})
+    record.subject = parse_csv_labels(record.subject)
+    record.problem = parse_csv_labels(record.problem)
+    return record
+
+
+def _iter_staged_rows(root_path):
+    # The rows of a roll whose file is already complete are left to the file
+    staging_path = staging_path_for(root_path)
+    if not os.path.exists(staging_path):
+        return
+
+    connection = sqlite3.connect(staging_path)
+    try:
+        try:
+            rows = connection.execute('SELECT subreddit, date, row, file FROM staged_rows ORDER BY id')
+        except sqlite3.OperationalError:
+            return
+        for subreddit, date, row, file_name in rows:
+            if file_name is not None and os.path.exists(os.path.join(root_path, 'subreddit=' + subreddit, 'date=' + date, file_name)):
+                continue
+            yield subreddit, date, json.loads(row)
+    finally:
+        connection.close()
+
+
+class ParquetRecordWriter(RecordWriter):
+    """
+    The ParquetRecordWriter class writes records to a Parquet dataset partitioned by subreddit and date.
+
+    The dataset is a directory with Hive style partitions (subreddit=.../date=.../), so analytics tools can
+    read only the partitions and columns they need. Batches are first staged in a SQLite database inside the
+    dataset, which makes every batch durable as soon as write_batch() returns without writing a small file
+    per partition per batch. Once a partition has file_rows staged rows, and for every partition on close(),
+    its rows are rolled into one Parquet file with row groups of DEFAULT_ROW_GROUP_SIZE rows. The file is
+    written under a temporary name and renamed once it is complete. The readers of this module also read the
+    staged rows, so they are part of the dataset before they are rolled.
+
+    Every write bumps a version kept in the staging database, which tells the indexes that the dataset
+    changed without listing its files (see read_dataset_version()).
+
+    Example Usage:
+    ```python
+    with ParquetRecordWriter("output.parquet") as writer:
+        writer.write_batch(records)
+    ```
+    """
+
+    preferred_batch_size = DEFAULT_ROW_GROUP_SIZE
+
+    def __init__(self, root_path, file_rows=DEFAULT_FILE_ROWS):
+        """
+        Creates the dataset directory if it doesn't exist yet and finishes a roll that was interrupted.
+
+        Args:
+            root_path (str): The directory of the dataset.
+            file_rows (int, optional): The amount of staged rows of a partition that are rolled into a file. Defaults to DEFAULT_FILE_ROWS.
+
+        Returns:
+            None
+        """
+        self.pyarrow, self.parquet = _import_pyarrow()
+        self.schema = parquet_schema(self.pyarrow)
+        self.root_path = root_path
+        self.file_rows = file_rows
+        os.makedirs(root_path, exist_ok=True)
+
+        self.connection = sqlite3.connect(staging_path_for(root_path))
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS staged_rows ('
+            'id INTEGER PRIMARY KEY, '
+            'subreddit TEXT NOT NULL, '
+            'date TEXT NOT NULL, '
+            'row TEXT NOT NULL, '
+            'file TEXT)'
+        )
+        self.connection.execute('CREATE INDEX IF NOT EXISTS staged_rows_partition ON staged_rows (subreddit, date, file)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS dataset_version (version INTEGER NOT NULL)')
+        if self.connection.execute('SELECT 1 FROM dataset_version').fetchone() is None:
+            self.connection.execute('INSERT INTO dataset_version (version) VALUES (0)')
+
+        # A roll that was interrupted either finished its file, so its rows are done, or didn't, so they are staged again
+        for subreddit, date, file_name in self.connection.execute('SELECT DISTINCT subreddit, date, file FROM staged_rows WHERE file IS NOT NULL').fetchall():
+            if os.path.exists(os.path.join(self._partition_path(subreddit, date), file_name)):
+                self.connection.execute('DELETE FROM staged_rows WHERE file = ?', (file_name,))
+            else:
+                self.connection.execute('UPDATE staged_rows SET file = NULL WHERE file = ?', (file_name,))
+        self.connection.commit()
+
+        self.staged_counts = {
+            (subreddit, date): count for subreddit, date, count in
+            self.connection.execute('SELECT subreddit, date, COUNT(*) FROM staged_rows GROUP BY subreddit, date')
+        }
+
+    def _partition_path(self, subreddit, date):
+        return os.path.join(self.root_path, 'subreddit=' + subreddit, 'date=' + date)
+
+    def write_batch(self, records):
+        staged = []
+
+        for record in records:
+            staged.append((partition_value(record.subreddit), partition_value(record.date), json.dumps({
+                'post_id': record.post_id,
+                'source': record.source,
+                'post_title': record.post_title,
+                'author': record.author,
+                'upvotes': record.upvotes,
+                'post_url': record.post_url,
+                'comment_count': record.comment_count,
+                'post_body': record.post_body,
+                'sentiment': record.sentiment,
+                'subject': to_label_text(record.subject),
+                'problem': to_label_text(record.problem),
+            })))
+
+        self.connection.executemany('INSERT INTO staged_rows (subreddit, date, row) VALUES (?, ?, ?)', staged)
+        self.connection.execute('UPDATE dataset_version SET version = version + 1')
+        self.connection.commit()
+
+        for subreddit, date, _ in staged:
+            self.staged_counts[(subreddit, date)] = self.staged_counts.get((subreddit, date), 0) + 1
+        for key in [key for key, count in self.staged_counts.items() if count >= self.file_rows]:
+            self._roll(*key)
+
+        return len(records)
+
+    def _roll(self, subreddit, date):
+        """
+        Moves the staged rows of a partition into a new Parquet file.
+
+        The rows are claimed for the file before it is written and removed once it was renamed into place,
+        so a crash at any point neither loses nor duplicates them.
+        """
+        file_name = 'part-' + uuid.uuid4().hex + '.parquet'
+        self.connection.execute('UPDATE staged_rows SET file = ? WHERE subreddit = ? AND date = ? AND file IS NULL', (file_name, subreddit, date))
+        self.connection.commit()
+
+        rows = [json.loads(row) for (row,) in self.connection.execute('SELECT row FROM staged_rows WHERE file = ? ORDER BY id', (file_name,))]
+        partition_path = self._partition_path(subreddit, date)
+        os.makedirs(partition_path, exist_ok=True)
+
+        temporary_path = os.path.join(partition_path, '.' + file_name + '.tmp')
+        table = self.pyarrow.Table.from_pylist(rows, schema=self.schema)
+        self.parquet.write_table(table, temporary_path, row_group_size=DEFAULT_ROW_GROUP_SIZE, compression='snappy')
+        os.replace(temporary_path, os.path.join(partition_path, file_name))
+
+        self.connection.execute('DELETE FROM staged_rows WHERE file = ?', (file_name,))
+        self.connection.commit()
+        del self.staged_counts[(subreddit, date)]
+
+    def close(self):
+        for key in list(self.staged_counts):
+            self._roll(*key)
+        self.connection.close()
+
+
+def iter_dataset_files(root_path):
+    """
+    Lists every finished Parquet file of a dataset.
+
+    Args:
+        root_path (str): The directory of the dataset.
+
+    Yields:
+        str: The path of a Parquet file.
+    """
+    for directory, _, file_names in os.walk(root_path):
+        for file_name in file_names:
+            if file_name.endswith('.parquet') and not file_name.startswith('.'):
+                yield os.path.join(directory, file_name)
+
+
+def iter_dataset_post_ids(root_path):
+    """
+    Reads the post IDs of a dataset one file at a time, only loading the post_id column, and then those of the staged rows.
+
+    Args:
+        root_path (str): The directory of the dataset.
+
+    Yields:
+        str: A post ID.
+    """
+    pyarrow, parquet = _import_pyarrow()
+
+    for file_path in iter_dataset_files(root_path):
+        yield from parquet.read_table(file_path, columns=['post_id']).column('post_id').to_pylist()
+
+    for _, _, row in _iter_staged_rows(root_path):
+        yield row['post_id']
+
+
+def iter_dataset_records(root_path):
+    """
+    Reads the posts of a dataset back as records, one file at a time, and then the rows that are still staged.
+
+    The subreddit and date aren't stored inside the files, they are taken from the partition directories.
+
+    Args:
+        root_path (str): The directory of the dataset.
+
+    Yields:
+        PostRecord: A post of the dataset.
+    """
+    pyarrow, parquet = _import_pyarrow()
+
+    for file_path in iter_dataset_files(root_path):
+        partition = {}
+        for part in os.path.relpath(os.path.dirname(file_path), root_path).split(os.sep):
+            key, _, value = part.partition('=')
+            if key in PARTITION_COLUMNS:
+                partition[key] = value
+
+        for row in parquet.read_table(file_path).to_pylist():
+            yield _partition_record(row, partition.get('subreddit', MISSING_PARTITION_VALUE), partition.get('date', MISSING_PARTITION_VALUE))
+
+    for subreddit, date, row in _iter_staged_rows(root_path):
+        yield _partition_record(row, subreddit, date)
+
+
+def convert_csv_to_parquet(csv_filename, root_path, subreddit=None, chunk_rows=DEFAULT_ROW_GROUP_SIZE):
+    """
+    Converts a CSV file written by add_dicts_to_csv() into a partitioned Parquet dataset.
+
+    The CSV is read chunk_rows rows at a time, so files of any size can be converted with a bounded amount
+    of memory. Older files have no subreddit column, those rows are put in the partition of the given subreddit.
+
+    Args:
+        csv_filename (str): The CSV file to convert.
+        root_path (str): The directory of the dataset.
+        subreddit (str, optional): The subreddit of rows that don't have one. Defaults to None.
+        chunk_rows (int, optional): The amount of rows written at once. Defaults to DEFAULT_ROW_GROUP_SIZE.
+
+    Returns:
+        int: The amount of converted rows.
+    """
+    writer = ParquetRecordWriter(root_path)
+    converted_rows = 0
+
+    # read_records() also loads the bodies of CSV files that keep them in a body store
+    for chunk in batched(read_records(csv_filename), chunk_rows):
+        for record in chunk:
+            if not record.subreddit:
+                record.subreddit = subreddit
+        converted_rows += writer.write_batch(chunk)
+
+    writer.close()
+    return converted_rows
+
+
+if __name__ == '__main__':
+    # Converting an existing CSV: python parquet_export.py input.csv dataset.parquet [subreddit]
+    if len(sys.argv) not in (3, 4):
+        print('Usage: python parquet_export.py <input.csv> <dataset directory> [subreddit]')
+        sys.exit(1)
+
+    print(str(convert_csv_to_parquet(sys.argv[1], sys.argv[2], subreddit=sys.argv[3] if len(sys.argv) == 4 else None)) + ' rows converted')
@@ -0,0 +1,163 @@
+import csv
+import time
+
+from records import PostRecord
+
+# The amount of rows that get collected before they are written to the output
+DEFAULT_BATCH_SIZE = 25
+
+# The columns of a new CSV file, files that already have a header are written in their own order
+CSV_COLUMN_ORDER = ['source', 'date', 'post_title', 'post_id', 'author',
+                    'upvotes', 'post_url', 'comment_count', 'post_body', 'sentiment', 'subject', 'problem', 'subreddit']
+
+# The columns of a new comments CSV file
+COMMENT_COLUMN_ORDER = ['source', 'subreddit', 'post_id', 'comment_id', 'parent_id', 'depth', 'date', 'author', 'score', 'body', 'sentiment']
+
+
+def skip_known_posts(submissions, post_id_index):
+    """
+    Drops the submissions that are already stored in the output before any per-post work is done.
+
+    Only the ID is read, which comes with the listing and doesn't trigger extra requests.
+
+    Args:
+        submissions (iterable): The PRAW submissions of a listing.
+        post_id_index (PostIdIndex): The index of the post IDs that are already stored.
+
+    Yields:
+        Submission: Every submission that is not stored yet.
+    """
+    for submission in submissions:
+        if submission.id not in post_id_index:
+            yield submission
+
+
+def build_records(submissions, metrics=None):
+    """
+    Turns every submission of a listing into a record without the sentiment filled in.
+
+    Args:
+        submissions (iterable): The PRAW submissions to convert.
+        metrics (RunMetrics, optional): Gets the time spent reading the submissions' attributes, which can trigger
+            lazy loads, as the 'records' stage. Defaults to None.
+
+    Yields:
+        PostRecord: The record of a single submission.
+    """
+    if metrics is None:
+        for submission in submissions:
+            yield PostRecord.from_submission(submission)
+        return
+
+    for submission in submissions:
+        start = time.perf_counter()
+        record = PostRecord.from_submission(submission)
+        metrics.add_time('records', time.perf_counter() - start)
+        yield record
+
+
+def add_sentiment(records, sentiment_engine, batch_size=DEFAULT_BATCH_SIZE, metrics=None, text_field='post_body'):
+    """
+    Fills in the sentiment of every record based on the post body (or the text_field).
+
+    The records are scored a batch at a time, so the engine can skip the bodies it scored before and
+    spread the rest over its worker processes.
+
+    Args:
+        records (iterable): The records to score.
+        sentiment_engine (SentimentEngine): The engine used for the scoring.
+        batch_size (int, optional): The amount of records scored at once. Defaults to DEFAULT_BATCH_SIZE.
+        metrics (RunMetrics, optional): Gets the time spent scoring as the 'sentiment' stage. Defaults to None.
+        text_field (str, optional): The field holding the scored text, 'body' for CommentRecords. Defaults to 'post_body'.
+
+    Yields:
+        PostRecord: The record with its sentiment filled in.
+    """
+    for batch in batched(records, batch_size):
+        start = time.perf_counter()
+        scores = sentiment_engine.score_texts([getattr(record, text_field) or '' for record in batch])
+        if metrics is not None:
+            metrics.add_time('sentiment', time.perf_counter() - start)
+        for record, compound in zip(batch, scores):
+            record.sentiment = compound
+            yield record
+
+
+def batched(records, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Groups the records into lists of at most batch_size records.
+
+    Args:
+        records (iterable): The records to group.
+        batch_size (int, optional): The maximum amount of records per batch. Defaults to DEFAULT_BATCH_SIZE.
+
+    Yields:
+        list: A batch of records.
+    """
+    batch = []
+
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+
+def write_rows_to_csv(file, records, column_order=CSV_COLUMN_ORDER):
+    """
+    Writes records to an already opened CSV file in the given column order.
+
+    Args:
+        file (file object): The opened CSV file.
+        records (iterable): The records to write.
+        column_order (list, optional): The fields of the values in the order they are written. Defaults to CSV_COLUMN_ORDER.
+
+    Returns:
+        int: The amount of rows that were written.
+    """
+    writer = csv.writer(file)
+    written = 0
+
+    for record in records:
+        # Get values based on the column order, columns the record doesn't know stay empty
+        writer.writerow([getattr(record, key, '') for key in column_order])
+        written += 1
+
+    return written
+
+
+def stream_to_writer(records, writer, batch_size=DEFAULT_BATCH_SIZE, on_batch_written=None, metrics=None):
+    """
+    Writes records to an output while they are being scraped.
+
+    Every batch is durable once the writer returns, before the next one is collected, so only a single
+    batch is kept in memory and everything that was written survives a crash later in the scrape.
+
+    Args:
+        records (iterable): The records to write, usually a generator.
+        writer (RecordWriter): The output the rows are written to.
+        batch_size (int, optional): The amount of rows written at once. Defaults to DEFAULT_BATCH_SIZE.
+        on_batch_written (callable, optional): Gets called with every batch after it was written. Defaults to None.
+        metrics (RunMetrics, optional): Gets the time spent writing as the 'write' stage and the written posts. Defaults to None.
+
+    Returns:
+        int: The total amount of rows that were written.
+    """
+    total_written = 0
+
+    for batch in batched(records, batch_size):
+        start = time.perf_counter()
+        written = writer.write_batch(batch)
+        total_written += written
+
+        if metrics is not None:
+            metrics.add_time('write', time.perf_counter() - start)
+            metrics.count('posts', written)
+
+        if on_batch_written is not None:
+            on_batch_written(batch)
+
+    return total_written
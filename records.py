@@ -0,0 +1,246 @@
+import datetime
+import json
+
+from sentiment_analysis import text_hash
+
+# Every field of a comment, in the order CommentRecord stores them
+COMMENT_FIELDS = ('source', 'subreddit', 'post_id', 'comment_id', 'parent_id', 'depth', 'date', 'author', 'score', 'body',
+                  'sentiment', 'created_utc')
+
+# Every field of a post, in the order PostRecord stores them
+POST_FIELDS = ('source', 'subreddit', 'post_title', 'post_id', 'date', 'author', 'upvotes', 'post_url',
+               'comment_count', 'post_body', 'sentiment', 'subject', 'problem', 'created_utc')
+
+
+def clean_text(value):
+    """
+    Converts a value to a string and drops every character that can't be encoded as UTF-8.
+
+    Plain ASCII text, which most posts are, is returned as is without the encode and decode round trip.
+
+    Args:
+        value: The value to convert, None stays None.
+
+    Returns:
+        str: The cleaned string.
+    """
+    if value is None:
+        return None
+    if not isinstance(value, str):
+        value = str(value)
+    if value.isascii():
+        return value
+    return value.encode('utf-8', errors='ignore').decode('utf-8')
+
+
+def to_int(value):
+    """
+    Converts a value to an integer, or None when it is empty or not a number.
+
+    Args:
+        value: The value to convert.
+
+    Returns:
+        int: The converted value.
+    """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def to_float(value):
+    """
+    Converts a value to a float, or None when it is empty or not a number.
+
+    Args:
+        value: The value to convert.
+
+    Returns:
+        float: The converted value.
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_csv_labels(value):
+    """
+    Reads the labels back out of a CSV cell, where they were written as a Python list (e.g. "['math', 'arts']").
+
+    Args:
+        value (str): The cell.
+
+    Returns:
+        list: The labels, or None if the cell is empty.
+    """
+    if not value:
+        return None
+    try:
+        return json.loads(value.replace("'", '"'))
+    except ValueError:
+        return [value]
+
+
+class PostRecord:
+    """
+    The PostRecord class holds a single scraped post on its way from the listing to the output.
+
+    The fields are slots with native types (integers for the upvotes and comment count, a float for the
+    sentiment, lists for the labels and None for anything missing), so a post costs one small object instead
+    of a copied dictionary of strings. Every writer reads the fields straight from the record.
+
+    Example Usage:
+    ```python
+    record = PostRecord.from_submission(submission)
+    record.sentiment = 0.5
+    writer.write_batch([record])
+    ```
+    """
+
+    __slots__ = POST_FIELDS
+
+    def __init__(self, source='reddit', subreddit=None, post_title=None, post_id=None, date=None, author=None, upvotes=None, post_url=None,
+                 comment_count=None, post_body=None, sentiment=None, subject=None, problem=None, created_utc=None):
+        self.source = source
+        self.subreddit = subreddit
+        self.post_title = post_title
+        self.post_id = post_id
+        self.date = date
+        self.author = author
+        self.upvotes = upvotes
+        self.post_url = post_url
+        self.comment_count = comment_count
+        self.post_body = post_body
+        self.sentiment = sentiment
+        self.subject = subject
+        self.problem = problem
+        # Not written to the output, but used to keep the checkpoints up to date
+        self.created_utc = created_utc
+
+    def __repr__(self):
+        return 'PostRecord(post_id=' + repr(self.post_id) + ', subreddit=' + repr(self.subreddit) + ')'
+
+    @property
+    def post_body_hash(self):
+        """
+        The content hash of the body, which outputs with a body store write instead of the body.
+
+        Returns:
+            str: The hash (see text_hash()), or None when the post has no body.
+        """
+        if self.post_body is None:
+            return None
+        return text_hash(self.post_body)
+
+    @classmethod
+    def from_submission(cls, submission):
+        """
+        Builds the record of a PRAW submission, reading and cleaning every field once.
+
+        Args:
+            submission (Submission): The submission from a listing.
+
+        Returns:
+            PostRecord: The record, without the sentiment filled in.
+        """
+        created_utc = submission.created_utc
+
+        return cls(
+            subreddit=str(submission.subreddit),
+            post_title=clean_text(submission.title),
+            post_id=submission.id,
+            date=datetime.date.fromtimestamp(created_utc).isoformat(),
+            author=clean_text(submission.author),
+            upvotes=submission.score,
+            post_url=clean_text(submission.url),
+            comment_count=submission.num_comments,
+            post_body=clean_text(submission.selftext),
+            created_utc=created_utc,
+        )
+
+    @classmethod
+    def from_row(cls, row):
+        """
+        Builds a record from a row read back out of an output, where every value may be a string.
+
+        Args:
+            row (dict): The values keyed by field name, unknown keys are ignored.
+
+        Returns:
+            PostRecord: The record.
+        """
+        return cls(
+            source=row.get('source') or None,
+            subreddit=row.get('subreddit') or None,
+            post_title=row.get('post_title'),
+            post_id=str(row.get('post_id') or ''),
+            date=row.get('date') or None,
+            author=row.get('author'),
+            upvotes=to_int(row.get('upvotes')),
+            post_url=row.get('post_url'),
+            comment_count=to_int(row.get('comment_count')),
+            post_body=row.get('post_body'),
+            sentiment=to_float(row.get('sentiment')),
+            subject=row.get('subject') or None,
+            problem=row.get('problem') or None,
+            created_utc=to_float(row.get('created_utc')),
+        )
+
+
+class CommentRecord:
+    """
+    The CommentRecord class holds a single scraped comment, like PostRecord does for posts.
+
+    A comment is keyed by its own ID and points at its post (post_id) and at what it replies to (parent_id,
+    the fullname of the parent comment, or of the post for top level comments).
+    """
+
+    __slots__ = COMMENT_FIELDS
+
+    def __init__(self, source='reddit', subreddit=None, post_id=None, comment_id=None, parent_id=None, depth=0, date=None, author=None, score=None,
+                 body=None, sentiment=None, created_utc=None):
+        self.source = source
+        self.subreddit = subreddit
+        self.post_id = post_id
+        self.comment_id = comment_id
+        self.parent_id = parent_id
+        self.depth = depth
+        self.date = date
+        self.author = author
+        self.score = score
+        self.body = body
+        self.sentiment = sentiment
+        self.created_utc = created_utc
+
+    def __repr__(self):
+        return 'CommentRecord(comment_id=' + repr(self.comment_id) + ', post_id=' + repr(self.post_id) + ')'
+
+    @classmethod
+    def from_comment(cls, comment, depth=0):
+        """
+        Builds the record of a PRAW comment, reading and cleaning every field once.
+
+        Args:
+            comment (Comment): The comment from a comment forest.
+            depth (int, optional): How deep the comment is nested, 0 for top level comments. Defaults to 0.
+
+        Returns:
+            CommentRecord: The record, without the sentiment filled in.
+        """
+        created_utc = comment.created_utc
+
+        return cls(
+            subreddit=str(comment.subreddit),
+            # The link ID is the fullname of the post, e.g. 't3_abc123'
+            post_id=comment.link_id[3:],
+            comment_id=comment.id,
+            parent_id=comment.parent_id,
+            depth=depth,
+            date=datetime.date.fromtimestamp(created_utc).isoformat(),
+            author=clean_text(comment.author),
+            score=comment.score,
+            body=clean_text(comment.body),
+            created_utc=created_utc,
+        )
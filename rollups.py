@@ -0,0 +1,339 @@
+import json
+import os
+import sqlite3
+
+from dedup_index import output_version
+from pipeline import batched
+from records import parse_csv_labels
+from writers import is_parquet_output, is_sqlite_output, read_records
+
+# The dimensions a rollup is kept for: every post, and every subject and problem label
+ROLLUP_DIMENSIONS = ('all', 'subject', 'problem')
+
+# The columns a rollup query can group by
+ROLLUP_GROUP_COLUMNS = ('subreddit', 'date', 'label')
+
+
+def rollup_path_for(output_filename):
+    """
+    Returns the location of the rollups that belong to an output file.
+
+    Args:
+        output_filename (str): The path to the output file.
+
+    Returns:
+        str: The path to the rollup database next to the output file.
+    """
+    return output_filename + '.rollups.sqlite'
+
+
+def record_labels(value):
+    """
+    Returns the labels of a record as a list, whichever form they were read or scraped in.
+
+    Args:
+        value: The subject or problem of a record.
+
+    Returns:
+        list: The labels, empty when there are none.
+    """
+    if not value:
+        return []
+    if isinstance(value, str):
+        return parse_csv_labels(value) or []
+    return list(value)
+
+
+def rollup_groups(subreddit, date, subject, problem):
+    """
+    Returns every rollup a post counts towards.
+
+    Args:
+        subreddit (str): The subreddit of the post.
+        date (str): The ISO date of the post.
+        subject (list): The subject labels of the post.
+        problem (list): The problem labels of the post.
+
+    Returns:
+        list: The (dimension, label, subreddit, date) keys of the rollups.
+    """
+    groups = [('all', '', subreddit, date)]
+    groups.extend(('subject', label, subreddit, date) for label in dict.fromkeys(subject))
+    groups.extend(('problem', label, subreddit, date) for label in dict.fromkeys(problem))
+    return groups
+
+
+class RollupStore:
+    """
+    The RollupStore class keeps the sentiment and upvote aggregates of an output up to date while it is written.
+
+    For every subreddit and day there is a rollup of all posts and one per subject and problem label, holding
+    the post count, the sum, minimum and maximum of the compound sentiment and the upvote total. New posts are
+    added to their rollups in one upsert per batch. A post that is written again (e.g. with new upvotes) is
+    replaced, which recomputes just the rollups of its subreddit and day from the per-post values kept next
+    to them. When the output was changed by something else (see output_version()) the rollups read the rows
+    that were appended to a CSV file, or are rebuilt from the output once after any other change. Scrapes keep the rollups up to date when they are asked to keep the indexes, see
+    open_writer() and IndexedWriter.
+
+    Example Usage:
+    ```python
+    with RollupStore("output.csv") as rollups:
+        rollups.add(batch)
+        rollups.query(subreddits=["python"], since="2024-01-01", group_by=("date",))
+    ```
+    """
+
+    def __init__(self, output_filename):
+        """
+        Opens (or creates) the rollups of an output file and brings them up to date with the output.
+
+        Args:
+            output_filename (str): The path to the output file.
+
+        Returns:
+            None
+        """
+        self.output_filename = output_filename
+        self.connection = sqlite3.connect(rollup_path_for(output_filename))
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS rollups ('
+            'dimension TEXT NOT NULL, '
+            'label TEXT NOT NULL, '
+            'subreddit TEXT NOT NULL COLLATE NOCASE, '
+            'date TEXT NOT NULL, '
+            'posts INTEGER NOT NULL, '
+            'scored_posts INTEGER NOT NULL, '
+            'sentiment_sum REAL NOT NULL, '
+            'sentiment_min REAL, '
+            'sentiment_max REAL, '
+            'upvotes INTEGER NOT NULL, '
+            'PRIMARY KEY (dimension, label, subreddit, date)) WITHOUT ROWID'
+        )
+        # The values every post contributed, so a post that is written again can be replaced
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS rollup_posts ('
+            'post_id TEXT PRIMARY KEY, '
+            'subreddit TEXT NOT NULL, '
+            'date TEXT NOT NULL, '
+            'upvotes INTEGER, '
+            'sentiment REAL, '
+            'subject TEXT, '
+            'problem TEXT)'
+        )
+        self.connection.execute('CREATE INDEX IF NOT EXISTS rollup_posts_day ON rollup_posts (subreddit, date)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)')
+        self.connection.commit()
+        self.sync()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _synced_version(self):
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'synced_version'").fetchone()
+        return row[0] if row else None
+
+    def _set_synced_version(self, version=None):
+        if version is None and os.path.exists(self.output_filename):
+            version = output_version(self.output_filename)
+        if version is not None:
+            self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('synced_version', ?)", (version,))
+
+    def sync(self):
+        """
+        Brings the rollups up to date when the output changed since the rollups were last updated.
+
+        A CSV file that only grew is read from the size it had at the last update, like PostIdIndex.sync()
+        does, so an output written without the indexes is caught up with just its new rows. Any other change
+        rebuilds the rollups from the whole output.
+
+        Args:
+            None
+
+        Returns:
+            bool: True if the rollups were updated.
+        """
+        if not os.path.exists(self.output_filename):
+            return False
+
+        synced_version = self._synced_version()
+        current_version = output_version(self.output_filename)
+        if synced_version == current_version:
+            return False
+
+        with self.connection:
+            csv_output = not is_sqlite_output(self.output_filename) and not is_parquet_output(self.output_filename)
+            if csv_output and synced_version is not None and synced_version < current_version:
+                # For a CSV file the version is its size, so the rows appended since start there
+                records = read_records(self.output_filename, start_offset=synced_version)
+            else:
+                self.connection.execute('DELETE FROM rollups')
+                self.connection.execute('DELETE FROM rollup_posts')
+                records = read_records(self.output_filename)
+            for batch in batched(records):
+                self._add(batch)
+            self._set_synced_version(current_version)
+
+        return True
+
+    def add(self, records):
+        """
+        Adds a batch of records that was just written to the output to their rollups.
+
+        Args:
+            records (list): The written PostRecords.
+
+        Returns:
+            None
+        """
+        with self.connection:
+            self._add(records)
+            self._set_synced_version()
+
+    def _add(self, records):
+        deltas = {}
+        changed_days = set()
+
+        for record in records:
+            post_id = str(record.post_id)
+            subreddit = record.subreddit or ''
+            date = record.date or ''
+            subject = record_labels(record.subject)
+            problem = record_labels(record.problem)
+
+            previous = self.connection.execute('SELECT subreddit, date, subject, problem FROM rollup_posts WHERE post_id = ?', (post_id,)).fetchone()
+            if previous is not None:
+                # Labels the post already had are kept, like the SQLite output does
+                subject = subject or json.loads(previous[2])
+                problem = problem or json.loads(previous[3])
+                changed_days.add((previous[0], previous[1]))
+                changed_days.add((subreddit, date))
+
+            self.connection.execute(
+                'INSERT OR REPLACE INTO rollup_posts (post_id, subreddit, date, upvotes, sentiment, subject, problem) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (post_id, subreddit, date, record.upvotes, record.sentiment, json.dumps(subject), json.dumps(problem))
+            )
+            if previous is not None:
+                continue
+
+            for group in rollup_groups(subreddit, date, subject, problem):
+                delta = deltas.get(group)
+                if delta is None:
+                    delta = deltas[group] = [0, 0, 0.0, None, None, 0]
+                delta[0] += 1
+                delta[5] += record.upvotes or 0
+                if record.sentiment is not None:
+                    delta[1] += 1
+                    delta[2] += record.sentiment
+                    delta[3] = record.sentiment if delta[3] is None else min(delta[3], record.sentiment)
+                    delta[4] = record.sentiment if delta[4] is None else max(delta[4], record.sentiment)
+
+        self.connection.executemany(
+            'INSERT INTO rollups (dimension, label, subreddit, date, posts, scored_posts, sentiment_sum, sentiment_min, sentiment_max, upvotes) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT (dimension, label, subreddit, date) DO UPDATE SET '
+            'posts = posts + excluded.posts, scored_posts = scored_posts + excluded.scored_posts, '
+            'sentiment_sum = sentiment_sum + excluded.sentiment_sum, '
+            'sentiment_min = MIN(COALESCE(sentiment_min, excluded.sentiment_min), COALESCE(excluded.sentiment_min, sentiment_min)), '
+            'sentiment_max = MAX(COALESCE(sentiment_max, excluded.sentiment_max), COALESCE(excluded.sentiment_max, sentiment_max)), '
+            'upvotes = upvotes + excluded.upvotes',
+            [group + tuple(delta) for group, delta in deltas.items()]
+        )
+
+        for subreddit, date in changed_days:
+            self._recompute_day(subreddit, date)
+
+    def _recompute_day(self, subreddit, date):
+        # Minimums and maximums can't be taken back out, so the rollups of the day are summed up again
+        self.connection.execute('DELETE FROM rollups WHERE subreddit = ? AND date = ?', (subreddit, date))
+        rows = self.connection.execute(
+            'SELECT upvotes, sentiment, subject, problem FROM rollup_posts WHERE subreddit = ? AND date = ?', (subreddit, date)
+        ).fetchall()
+
+        totals = {}
+        for upvotes, sentiment, subject, problem in rows:
+            for group in rollup_groups(subreddit, date, json.loads(subject), json.loads(problem)):
+                total = totals.setdefault(group, [0, 0, 0.0, None, None, 0])
+                total[0] += 1
+                total[5] += upvotes or 0
+                if sentiment is not None:
+                    total[1] += 1
+                    total[2] += sentiment
+                    total[3] = sentiment if total[3] is None else min(total[3], sentiment)
+                    total[4] = sentiment if total[4] is None else max(total[4], sentiment)
+
+        self.connection.executemany(
+            'INSERT INTO rollups (dimension, label, subreddit, date, posts, scored_posts, sentiment_sum, sentiment_min, sentiment_max, upvotes) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            [group + tuple(total) for group, total in totals.items()]
+        )
+
+    def query(self, dimension='all', subreddits=None, since=None, until=None, labels=None, group_by=('subreddit', 'date')):
+        """
+        Reads the aggregates of the output, only touching the rollups and never the posts.
+
+        Args:
+            dimension (str, optional): 'all' for every post, or 'subject' or 'problem' for the labels. Defaults to 'all'.
+            subreddits (list, optional): Only these subreddits. Defaults to every subreddit.
+            since (str, optional): The first ISO date included. Defaults to None.
+            until (str, optional): The last ISO date included. Defaults to None.
+            labels (list, optional): Only these labels of the dimension. Defaults to every label.
+            group_by (tuple, optional): Any of 'subreddit', 'date' and 'label', an empty tuple sums everything up. Defaults to ('subreddit', 'date').
+
+        Returns:
+            list: A dict per group with its group columns, posts, mean_sentiment, min_sentiment, max_sentiment and upvotes.
+        """
+        if dimension not in ROLLUP_DIMENSIONS:
+            raise ValueError('Unknown rollup dimension: ' + str(dimension))
+        unknown_columns = [column for column in group_by if column not in ROLLUP_GROUP_COLUMNS]
+        if unknown_columns:
+            raise ValueError('Rollups can\'t be grouped by ' + ', '.join(unknown_columns))
+
+        conditions = ['dimension = ?']
+        parameters = [dimension]
+        if subreddits:
+            conditions.append('subreddit IN (' + ', '.join('?' * len(subreddits)) + ')')
+            parameters.extend(subreddits)
+        if since:
+            conditions.append('date >= ?')
+            parameters.append(since)
+        if until:
+            conditions.append('date <= ?')
+            parameters.append(until)
+        if labels:
+            conditions.append('label IN (' + ', '.join('?' * len(labels)) + ')')
+            parameters.extend(labels)
+
+        columns = list(group_by)
+        statement = (
+            'SELECT ' + ''.join(column + ', ' for column in columns)
+            + 'SUM(posts), SUM(sentiment_sum) / NULLIF(SUM(scored_posts), 0), MIN(sentiment_min), MAX(sentiment_max), SUM(upvotes) '
+            'FROM rollups WHERE ' + ' AND '.join(conditions)
+        )
+        if columns:
+            statement += ' GROUP BY ' + ', '.join(columns) + ' ORDER BY ' + ', '.join(columns)
+
+        results = []
+        for row in self.connection.execute(statement, parameters):
+            if row[len(columns)] is None:
+                # Summing up no rollups at all still returns one empty row
+                continue
+            result = dict(zip(columns, row))
+            result.update(zip(('posts', 'mean_sentiment', 'min_sentiment', 'max_sentiment', 'upvotes'), row[len(columns):]))
+            results.append(result)
+        return results
+
+    def close(self):
+        """
+        Closes the rollup database.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        self.connection.close()
+
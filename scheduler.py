@@ -0,0 +1,191 @@
+import threading
+import time
+
+import prawcore
+
+# Reddit allows this many OAuth requests per rate limit window when the headers haven't been seen yet
+DEFAULT_REQUESTS_PER_WINDOW = 1000
+DEFAULT_WINDOW_SECONDS = 600
+
+# The longest the scheduler backs off after repeated 429 responses
+MAX_BACKOFF_SECONDS = 60
+
+# Responses with these status codes are retried by prawcore
+RETRIED_STATUS_CODES = (500, 502, 503, 504)
+
+
+class RateLimitScheduler:
+    """
+    The RateLimitScheduler class shares the single OAuth rate limit budget between concurrently running scrape jobs.
+
+    Every request asks the scheduler for a slot first. The remaining budget is spread evenly over the time left
+    until the window resets (read from the X-Ratelimit-Remaining and X-Ratelimit-Reset headers), and when several
+    jobs are waiting the one that got the fewest slots so far goes first, so a large subreddit can't starve the
+    others. A 429 response doubles the back off delay, every successful response halves it again.
+
+    Example Usage:
+    ```python
+    scheduler = RateLimitScheduler()
+    reddit = praw.Reddit(..., requestor_class=SchedulingRequestor,
+                         requestor_kwargs={"scheduler": scheduler, "job_id": "python"})
+    ```
+    """
+
+    def __init__(self, requests_per_window=DEFAULT_REQUESTS_PER_WINDOW, window_seconds=DEFAULT_WINDOW_SECONDS, metrics=None):
+        """
+        Initializes the scheduler with the budget that is assumed until Reddit reports the real one.
+
+        Args:
+            requests_per_window (int, optional): The assumed amount of requests per window. Defaults to DEFAULT_REQUESTS_PER_WINDOW.
+            window_seconds (int, optional): The assumed length of a window in seconds. Defaults to DEFAULT_WINDOW_SECONDS.
+            metrics (RunMetrics, optional): Gets the rate limit sleeps and the time spent in them. Defaults to None.
+
+        Returns:
+            None
+        """
+        self._condition = threading.Condition()
+        self._remaining = float(requests_per_window)
+        self._reset_at = time.monotonic() + window_seconds
+        self._requests_per_window = requests_per_window
+        self._window_seconds = window_seconds
+        self._next_slot = 0.0
+        self._backoff = 0.0
+        self._granted = {}
+        self._waiting = {}
+        self.rate_limit_sleeps = 0
+        self.metrics = metrics
+
+    def _interval(self, now):
+        # Spread what is left of the budget over what is left of the window
+        seconds_to_reset = max(self._reset_at - now, 0.0)
+        if self._remaining <= 0:
+            return seconds_to_reset
+        return seconds_to_reset / self._remaining
+
+    def _next_job(self):
+        return min(self._waiting, key=lambda job_id: self._granted.get(job_id, 0))
+
+    def acquire(self, job_id):
+        """
+        Blocks until the job is allowed to send its next request.
+
+        Args:
+            job_id (str): The job the request belongs to.
+
+        Returns:
+            None
+        """
+        with self._condition:
+            self._waiting[job_id] = self._waiting.get(job_id, 0) + 1
+
+            while True:
+                now = time.monotonic()
+                if now >= self._reset_at:
+                    # A new window started, the real budget comes with the next response
+                    self._remaining = float(self._requests_per_window)
+                    self._reset_at = now + self._window_seconds
+
+                if self._next_job() == job_id and now >= self._next_slot:
+                    break
+
+                if self._next_job() == job_id:
+                    self.rate_limit_sleeps += 1
+                    self._condition.wait(timeout=self._next_slot - now)
+                    if self.metrics is not None:
+                        self.metrics.count('rate_limit_sleeps')
+                        self.metrics.add_time('rate_limit_wait', time.monotonic() - now)
+                else:
+                    self._condition.wait()
+
+            self._waiting[job_id] -= 1
+            if self._waiting[job_id] == 0:
+                del self._waiting[job_id]
+
+            self._granted[job_id] = self._granted.get(job_id, 0) + 1
+            self._remaining -= 1
+            self._next_slot = now + self._interval(now) + self._backoff
+            self._condition.notify_all()
+
+    def record_response(self, status_code, headers):
+        """
+        Updates the budget with the rate limit headers of a response and adapts the back off.
+
+        Args:
+            status_code (int): The HTTP status code of the response.
+            headers (Mapping): The headers of the response.
+
+        Returns:
+            None
+        """
+        with self._condition:
+            now = time.monotonic()
+
+            try:
+                self._remaining = float(headers['x-ratelimit-remaining'])
+                self._reset_at = now + float(headers['x-ratelimit-reset'])
+            except (KeyError, TypeError, ValueError):
+                pass
+
+            if status_code == 429:
+                self._backoff = min(max(self._backoff * 2, 1.0), MAX_BACKOFF_SECONDS)
+                self._next_slot = max(self._next_slot, now + self._backoff)
+            else:
+                self._backoff /= 2
+                if self._backoff < 0.01:
+                    self._backoff = 0.0
+
+            self._condition.notify_all()
+
+    def forget_job(self, job_id):
+        """
+        Drops the slot count of a finished job, so it doesn't count towards the fairness of the others.
+
+        Args:
+            job_id (str): The finished job.
+
+        Returns:
+            None
+        """
+        with self._condition:
+            self._granted.pop(job_id, None)
+            self._condition.notify_all()
+
+
+class SchedulingRequestor(prawcore.Requestor):
+    """
+    The SchedulingRequestor class is a prawcore requestor that asks a RateLimitScheduler for a slot before every request.
+
+    It is passed to praw.Reddit through requestor_class, with the scheduler, the job ID and optionally a
+    RunMetrics in requestor_kwargs. Without a scheduler it only counts the requests into the metrics.
+    """
+
+    def __init__(self, *args, scheduler=None, job_id='default', metrics=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.scheduler = scheduler
+        self.job_id = job_id
+        self.metrics = metrics
+
+    def request(self, *args, **kwargs):
+        if self.scheduler is not None:
+            self.scheduler.acquire(self.job_id)
+
+        if self.metrics is not None:
+            self.metrics.count('api_requests')
+
+        try:
+            response = super().request(*args, **kwargs)
+        except Exception:
+            if self.metrics is not None:
+                # Connection errors are retried by prawcore as well
+                self.metrics.count('retries')
+            raise
+
+        if self.metrics is not None:
+            if response.status_code in RETRIED_STATUS_CODES:
+                self.metrics.count('retries')
+            elif response.status_code == 429:
+                self.metrics.count('rate_limited_responses')
+
+        if self.scheduler is not None:
+            self.scheduler.record_response(response.status_code, response.headers)
+        return response
@@ -0,0 +1,253 @@
+import os
+import sqlite3
+
+from dedup_index import output_version
+from pipeline import batched
+from writers import is_parquet_output, is_sqlite_output, read_records
+
+# The amount of results a search returns when no limit is given
+DEFAULT_SEARCH_LIMIT = 20
+
+# The amount of words around the matches that make up a snippet
+SNIPPET_WORDS = 16
+
+
+def search_index_path_for(output_filename):
+    """
+    Returns the location of the search index that belongs to an output file.
+
+    Args:
+        output_filename (str): The path to the output file.
+
+    Returns:
+        str: The path to the search database next to the output file.
+    """
+    return output_filename + '.search.sqlite'
+
+
+def quote_query(text):
+    """
+    Turns plain search words into an FTS5 query that matches posts containing all of them.
+
+    Every word is quoted, so punctuation or words like OR and NOT in the text are searched for instead of
+    being read as query syntax.
+
+    Args:
+        text (str): The words to search for, e.g. 'IA deadline'.
+
+    Returns:
+        str: The FTS5 query.
+    """
+    return ' '.join('"' + word.replace('"', '""') + '"' for word in text.split())
+
+
+class SearchIndex:
+    """
+    The SearchIndex class keeps a full-text index of the titles and bodies of the posts in an output.
+
+    The text lives in a SQLite FTS5 table with the Porter stemmer, so 'deadlines' also finds 'deadline', and
+    the subreddit, date and sentiment of every post sit in a regular table next to it for filtering. New posts
+    are indexed while the scrapers write them when the indexes are kept (see IndexedWriter), a post that is
+    written again replaces its entry, and when the output was changed by anything else (see output_version())
+    the index reads the rows that were appended to a CSV file, or is rebuilt from the output once.
+
+    Example Usage:
+    ```python
+    with SearchIndex("output.csv") as search_index:
+        for result in search_index.search("IA deadline", subreddits=["IBO"], max_sentiment=0):
+            print(result["post_id"], result["snippet"])
+    ```
+    """
+
+    def __init__(self, output_filename):
+        """
+        Opens (or creates) the search index of an output file and brings it up to date with the output.
+
+        Args:
+            output_filename (str): The path to the output file.
+
+        Returns:
+            None
+        """
+        self.output_filename = output_filename
+        self.connection = sqlite3.connect(search_index_path_for(output_filename))
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS search_posts ('
+            'id INTEGER PRIMARY KEY, '
+            'post_id TEXT NOT NULL UNIQUE, '
+            'subreddit TEXT COLLATE NOCASE, '
+            'date TEXT, '
+            'sentiment REAL)'
+        )
+        try:
+            # The rowid of a text row is the id of its post in search_posts
+            self.connection.execute("CREATE VIRTUAL TABLE IF NOT EXISTS search_text USING fts5(post_title, post_body, tokenize='porter unicode61')")
+        except sqlite3.OperationalError:
+            self.connection.close()
+            raise RuntimeError('The search index needs a SQLite library with FTS5, which this Python was built without')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)')
+        self.connection.commit()
+        self.sync()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM search_posts').fetchone()[0]
+
+    def _synced_version(self):
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'synced_version'").fetchone()
+        return row[0] if row else None
+
+    def _set_synced_version(self, version=None):
+        if version is None and os.path.exists(self.output_filename):
+            version = output_version(self.output_filename)
+        if version is not None:
+            self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('synced_version', ?)", (version,))
+
+    def sync(self):
+        """
+        Brings the index up to date when the output changed since the index was last updated.
+
+        A CSV file that only grew is read from the size it had at the last update, like PostIdIndex.sync()
+        does, so an output written without the indexes is caught up with just its new rows. Any other change
+        rebuilds the index from the whole output.
+
+        Args:
+            None
+
+        Returns:
+            bool: True if the index was updated.
+        """
+        if not os.path.exists(self.output_filename):
+            return False
+
+        synced_version = self._synced_version()
+        current_version = output_version(self.output_filename)
+        if synced_version == current_version:
+            return False
+
+        with self.connection:
+            csv_output = not is_sqlite_output(self.output_filename) and not is_parquet_output(self.output_filename)
+            if csv_output and synced_version is not None and synced_version < current_version:
+                # For a CSV file the version is its size, so the rows appended since start there
+                records = read_records(self.output_filename, start_offset=synced_version)
+            else:
+                self.connection.execute('DELETE FROM search_posts')
+                self.connection.execute('DELETE FROM search_text')
+                records = read_records(self.output_filename)
+            for batch in batched(records):
+                self._add(batch)
+            self._set_synced_version(current_version)
+
+        return True
+
+    def add(self, records):
+        """
+        Indexes a batch of records that was just written to the output.
+
+        Args:
+            records (list): The written PostRecords.
+
+        Returns:
+            None
+        """
+        with self.connection:
+            self._add(records)
+            self._set_synced_version()
+
+    def _add(self, records):
+        for record in records:
+            post_id = str(record.post_id)
+            row = self.connection.execute('SELECT id FROM search_posts WHERE post_id = ?', (post_id,)).fetchone()
+
+            if row is None:
+                cursor = self.connection.execute(
+                    'INSERT INTO search_posts (post_id, subreddit, date, sentiment) VALUES (?, ?, ?, ?)',
+                    (post_id, record.subreddit, record.date, record.sentiment)
+                )
+                row_id = cursor.lastrowid
+            else:
+                row_id = row[0]
+                self.connection.execute(
+                    'UPDATE search_posts SET subreddit = ?, date = ?, sentiment = ? WHERE id = ?',
+                    (record.subreddit, record.date, record.sentiment, row_id)
+                )
+                self.connection.execute('DELETE FROM search_text WHERE rowid = ?', (row_id,))
+
+            self.connection.execute(
+                'INSERT INTO search_text (rowid, post_title, post_body) VALUES (?, ?, ?)',
+                (row_id, record.post_title or '', record.post_body or '')
+            )
+
+    def search(self, text, subreddits=None, since=None, until=None, min_sentiment=None, max_sentiment=None, limit=DEFAULT_SEARCH_LIMIT, raw=False):
+        """
+        Finds the posts matching a query, best matches first.
+
+        Args:
+            text (str): The words that have to be in the title or body, see quote_query().
+            subreddits (list, optional): Only posts of these subreddits. Defaults to every subreddit.
+            since (str, optional): The first ISO date included. Defaults to None.
+            until (str, optional): The last ISO date included. Defaults to None.
+            min_sentiment (float, optional): The lowest compound sentiment included. Defaults to None.
+            max_sentiment (float, optional): The highest compound sentiment included. Defaults to None.
+            limit (int, optional): The most results returned. Defaults to DEFAULT_SEARCH_LIMIT.
+            raw (bool, optional): Whether text is passed on as FTS5 query syntax (e.g. 'burnout OR "mental health"'). Defaults to False.
+
+        Returns:
+            list: A dict per post with its post_id, subreddit, date, sentiment, score (lower is better) and a snippet
+            with the matches in [brackets].
+        """
+        query = text if raw else quote_query(text)
+        if not query:
+            return []
+
+        conditions = ['search_text MATCH ?']
+        parameters = [query]
+        if subreddits:
+            conditions.append('search_posts.subreddit IN (' + ', '.join('?' * len(subreddits)) + ')')
+            parameters.extend(subreddits)
+        if since:
+            conditions.append('search_posts.date >= ?')
+            parameters.append(since)
+        if until:
+            conditions.append('search_posts.date <= ?')
+            parameters.append(until)
+        if min_sentiment is not None:
+            conditions.append('search_posts.sentiment >= ?')
+            parameters.append(min_sentiment)
+        if max_sentiment is not None:
+            conditions.append('search_posts.sentiment <= ?')
+            parameters.append(max_sentiment)
+        parameters.append(limit)
+
+        try:
+            rows = self.connection.execute(
+                'SELECT search_posts.post_id, search_posts.subreddit, search_posts.date, search_posts.sentiment, search_text.rank, '
+                "snippet(search_text, -1, '[', ']', '...', " + str(SNIPPET_WORDS) + ') '
+                'FROM search_text JOIN search_posts ON search_posts.id = search_text.rowid '
+                'WHERE ' + ' AND '.join(conditions) + ' ORDER BY search_text.rank LIMIT ?',
+                parameters
+            ).fetchall()
+        except sqlite3.OperationalError as e:
+            raise ValueError('Invalid search query "' + text + '": ' + str(e))
+
+        return [
+            {"post_id": row[0], "subreddit": row[1], "date": row[2], "sentiment": row[3], "score": row[4], "snippet": row[5]}
+            for row in rows
+        ]
+
+    def close(self):
+        """
+        Closes the search database.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        self.connection.close()
@@ -1,14 +1,46 @@
 # TODO:
-# 1. CREATE SENTIMENT ANALYSIS TOOL []
+# 1. CREATE SENTIMENT ANALYSIS TOOL [DONE]
 
-from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+import csv
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 
-def analyze_sentiment(text):
-    # Initialize the VADER sentiment analyzer
-    analyzer = SentimentIntensityAnalyzer()
+# The amount of texts one worker process scores per task
+DEFAULT_CHUNK_SIZE = 256
+
+# The amount of scores kept in memory by a SentimentEngine
+DEFAULT_MEMORY_CACHE_SIZE = 100000
+
+# The analyzer of this process, the VADER lexicon is only loaded once
+_analyzer = None
+
+
+def get_analyzer():
+    """
+    Returns the VADER analyzer of this process, creating it on first use.
 
-    # Analyze the sentiment of the input text
-    sentiment_scores = analyzer.polarity_scores(text)
+    Args:
+        None
+
+    Returns:
+        SentimentIntensityAnalyzer: The shared analyzer.
+    """
+    global _analyzer
+    if _analyzer is None:
+        # Imported here, so runs that never score anything don't pay for loading VADER
+        from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+        _analyzer = SentimentIntensityAnalyzer()
+    return _analyzer
+
+
+def analyze_sentiment(text):
+    # Analyze the sentiment of the input text with the shared VADER analyzer
+    sentiment_scores = get_analyzer().polarity_scores(text)
 
     # Determine the sentiment category based on the compound score
     compound_score = sentiment_scores['compound']
@@ -26,4 +58,273 @@ def analyze_sentiment(text):
         'negative_score': sentiment_scores['neg'],
         'neutral_score': sentiment_scores['neu'],
         'compound_score': sentiment_scores['compound']
-    }
\ No newline at end of file
+    }
+
+
+def text_hash(text):
+    """
+    Returns the content hash a text is cached under.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        str: The hexadecimal SHA-256 hash of the UTF-8 encoded text.
+    """
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _score_chunk(texts):
+    # Runs inside a worker process, which keeps its own analyzer between tasks
+    analyzer = get_analyzer()
+    return [analyzer.polarity_scores(text)['compound'] for text in texts]
+
+
+def sentiment_cache_path_for(csv_filename):
+    """
+    Returns the location of the sentiment cache that belongs to an output file.
+
+    Args:
+        csv_filename (str): The path to the output file.
+
+    Returns:
+        str: The path to the cache database next to the output file.
+    """
+    return csv_filename + '.sentiment.sqlite'
+
+
+class SentimentEngine:
+    """
+    The SentimentEngine class scores texts in batches and never scores the same text twice.
+
+    Every score is cached under the hash of the text, in memory and optionally in a SQLite file, so reposts
+    and identical bodies are looked up instead of scored. Texts that aren't cached are scored on a pool of
+    worker processes that each hold one analyzer, or in this process when processes is 0.
+
+    Example Usage:
+    ```python
+    with SentimentEngine(processes=4, cache_path="scores.sqlite") as engine:
+        scores = engine.score_texts(["I love this", "I hate this"])
+    ```
+    """
+
+    def __init__(self, processes=0, cache_path=None, chunk_size=DEFAULT_CHUNK_SIZE, memory_cache_size=DEFAULT_MEMORY_CACHE_SIZE):
+        """
+        Initializes the engine.
+
+        Args:
+            processes (int, optional): The amount of worker processes, 0 scores in this process. Defaults to 0.
+            cache_path (str, optional): The SQLite file the scores are cached in between runs. Defaults to None.
+            chunk_size (int, optional): The amount of texts a worker scores per task. Defaults to DEFAULT_CHUNK_SIZE.
+            memory_cache_size (int, optional): The amount of scores kept in memory. Defaults to DEFAULT_MEMORY_CACHE_SIZE.
+
+        Returns:
+            None
+        """
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self.memory_cache_size = memory_cache_size
+        self.memory_cache = OrderedDict()
+        # Batch scrapes score from several threads at once
+        self.lock = threading.Lock()
+        self.pool = None
+        self.connection = None
+
+        if cache_path is not None:
+            self.connection = sqlite3.connect(cache_path, check_same_thread=False)
+            self.connection.execute('CREATE TABLE IF NOT EXISTS sentiment_cache (text_hash TEXT PRIMARY KEY, compound REAL NOT NULL) WITHOUT ROWID')
+            self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _remember(self, hashed_text, compound):
+        self.memory_cache[hashed_text] = compound
+        self.memory_cache.move_to_end(hashed_text)
+        if len(self.memory_cache) > self.memory_cache_size:
+            self.memory_cache.popitem(last=False)
+
+    def _lookup(self, hashes):
+        found = {}
+
+        with self.lock:
+            for hashed_text in hashes:
+                if hashed_text in self.memory_cache:
+                    self.memory_cache.move_to_end(hashed_text)
+                    found[hashed_text] = self.memory_cache[hashed_text]
+
+            missing = [hashed_text for hashed_text in hashes if hashed_text not in found]
+            if self.connection is not None and missing:
+                # SQLite limits the amount of parameters per query
+                for start in range(0, len(missing), 500):
+                    chunk = missing[start:start + 500]
+                    rows = self.connection.execute(
+                        'SELECT text_hash, compound FROM sentiment_cache WHERE text_hash IN (' + ','.join('?' * len(chunk)) + ')', chunk
+                    ).fetchall()
+                    for hashed_text, compound in rows:
+                        found[hashed_text] = compound
+                        self._remember(hashed_text, compound)
+
+        return found
+
+    def _score_uncached(self, texts):
+        if self.processes and len(texts) > self.chunk_size:
+            with self.lock:
+                if self.pool is None:
+                    self.pool = ProcessPoolExecutor(max_workers=self.processes)
+            chunks = [texts[start:start + self.chunk_size] for start in range(0, len(texts), self.chunk_size)]
+            return [compound for chunk_scores in self.pool.map(_score_chunk, chunks) for compound in chunk_scores]
+
+        return _score_chunk(texts)
+
+    def score_hashed(self, hashes, load_texts):
+        """
+        Returns the compound sentiment score of texts that are only known by their hash.
+
+        Only the texts whose score isn't cached are loaded, so outputs that keep their bodies in a body store
+        share the scores by hash and never load a body that was scored before.
+
+        Args:
+            hashes (list): The hashes of the texts, see text_hash().
+            load_texts (callable): Gets the list of hashes that have to be scored and returns their texts keyed by hash.
+
+        Returns:
+            list: The compound score of every hash, in the same order. Hashes whose text couldn't be loaded get None,
+            and nothing is cached for them, so they are scored once their text is there.
+        """
+        scores = self._lookup(set(hashes))
+
+        # Identical texts in the same batch are only scored once
+        uncached = [hashed_text for hashed_text in dict.fromkeys(hashes) if hashed_text not in scores]
+
+        if uncached:
+            texts = load_texts(uncached)
+            loaded = [hashed_text for hashed_text in uncached if texts.get(hashed_text) is not None]
+            new_scores = dict(zip(loaded, self._score_uncached([texts[hashed_text] for hashed_text in loaded])))
+            scores.update(new_scores)
+
+            with self.lock:
+                for hashed_text, compound in new_scores.items():
+                    self._remember(hashed_text, compound)
+                if self.connection is not None:
+                    self.connection.executemany('INSERT OR IGNORE INTO sentiment_cache (text_hash, compound) VALUES (?, ?)', new_scores.items())
+                    self.connection.commit()
+
+        return [scores.get(hashed_text) for hashed_text in hashes]
+
+    def score_texts(self, texts):
+        """
+        Returns the compound sentiment score of every text.
+
+        Args:
+            texts (list): The texts to score.
+
+        Returns:
+            list: The compound score of every text, in the same order.
+        """
+        hashes = [text_hash(text) for text in texts]
+        texts_by_hash = dict(zip(hashes, texts))
+        return self.score_hashed(hashes, lambda uncached: texts_by_hash)
+
+    def close(self):
+        """
+        Stops the worker processes and closes the cache database.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def score_csv(input_csv, output_csv, engine, text_column='post_body', sentiment_column='sentiment', batch_size=10000):
+    """
+    Scores (or rescores) the sentiment of every row of an existing dataset.
+
+    The file is read and written in batches, so datasets of any size can be scored with a bounded amount of memory.
+
+    Args:
+        input_csv (str): The CSV file to score.
+        output_csv (str): The CSV file the scored rows are written to.
+        engine (SentimentEngine): The engine doing the scoring.
+        text_column (str, optional): The column holding the text. Defaults to 'post_body'.
+        sentiment_column (str, optional): The column the score is written to, added when it's missing. Defaults to 'sentiment'.
+        batch_size (int, optional): The amount of rows scored at once. Defaults to 10000.
+
+    Returns:
+        int: The amount of rows that were scored.
+    """
+    scored_rows = 0
+    body_store = None
+
+    with open(input_csv, 'r', encoding='utf-8', newline='') as infile, open(output_csv, 'w', encoding='utf-8', newline='') as outfile:
+        reader = csv.DictReader(infile)
+        fieldnames = list(reader.fieldnames or [])
+        if sentiment_column not in fieldnames:
+            fieldnames.append(sentiment_column)
+
+        # Imported here, because the body store hashes its bodies with this module
+        from body_store import BODY_HASH_COLUMN, BodyStore
+        if text_column == 'post_body' and text_column not in fieldnames and BODY_HASH_COLUMN in fieldnames:
+            # The bodies are in the body store of the file, the scores are looked up by their hash
+            body_store = BodyStore(input_csv)
+
+        writer = csv.DictWriter(outfile, fieldnames=fieldnames)
+        writer.writeheader()
+
+        try:
+            batch = []
+            for row in reader:
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    scored_rows += _write_scored_batch(writer, batch, engine, text_column, sentiment_column, body_store)
+                    batch = []
+
+            if batch:
+                scored_rows += _write_scored_batch(writer, batch, engine, text_column, sentiment_column, body_store)
+        finally:
+            if body_store is not None:
+                body_store.close()
+
+    return scored_rows
+
+
+def _write_scored_batch(writer, batch, engine, text_column, sentiment_column, body_store=None):
+    if body_store is not None:
+        from body_store import BODY_HASH_COLUMN
+        empty_hash = text_hash('')
+
+        def load_texts(hashes):
+            texts = body_store.get_many(hashes)
+            # Rows without a body are scored as an empty text, like the rows of outputs without a body store
+            if empty_hash in hashes:
+                texts[empty_hash] = ''
+            return texts
+
+        scores = engine.score_hashed([row.get(BODY_HASH_COLUMN) or empty_hash for row in batch], load_texts)
+    else:
+        scores = engine.score_texts([row.get(text_column) or '' for row in batch])
+    for row, compound in zip(batch, scores):
+        row[sentiment_column] = compound
+    writer.writerows(batch)
+    return len(batch)
+
+
+if __name__ == '__main__':
+    # Offline scoring of an existing dataset: python sentiment_analysis.py input.csv output.csv
+    if len(sys.argv) != 3:
+        print('Usage: python sentiment_analysis.py <input.csv> <output.csv>')
+        sys.exit(1)
+
+    with SentimentEngine(processes=os.cpu_count() or 1, cache_path=sentiment_cache_path_for(sys.argv[1])) as offline_engine:
+        print(str(score_csv(sys.argv[1], sys.argv[2], offline_engine)) + ' rows scored')
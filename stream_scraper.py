@@ -0,0 +1,144 @@
+import time
+
+from batch_scraper import scrape_subreddits_concurrently
+from listings import LISTING_CAP
+from pipeline import DEFAULT_BATCH_SIZE, add_sentiment, build_records
+from writers import open_writer
+
+# The longest a streamed post waits in memory before its micro-batch is written
+DEFAULT_FLUSH_SECONDS = 10
+
+# Streams follow the 'new' listing, so they share its checkpoints with regular scrapes of 'new'
+STREAM_LISTING = 'new'
+
+
+def catch_up(make_client, subreddits, output_filename, sentiment_engine, post_id_index, checkpoint_store, on_batch_written=None, metrics=None, indexes=False):
+    """
+    Scrapes the posts that were made while no stream was running, before a stream starts.
+
+    A stream only sees the newest page of posts when it starts, so after a long pause the 'new' listing
+    of every subreddit that was streamed before is paged until it reaches the checkpoint. Subreddits that
+    were never scraped into the output are skipped, a stream starts at the newest page for them.
+
+    Args:
+        make_client (callable): Creates a new praw.Reddit instance, keyword arguments are passed on to praw.Reddit.
+        subreddits (list): The names of the streamed subreddits.
+        output_filename (str): The output the posts are written to.
+        sentiment_engine (SentimentEngine): The engine that scores the posts, None leaves the sentiment empty.
+        post_id_index (PostIdIndex): The index of the posts already in the output.
+        checkpoint_store (CheckpointStore): The checkpoints of the output.
+        on_batch_written (callable, optional): Gets called with the subreddit and every batch after it was written. Defaults to None.
+        metrics (RunMetrics, optional): Collects the stage timings and request counters. Defaults to None.
+        indexes (bool, optional): Whether the rollups and search index of the output are kept up to date, see open_writer(). Defaults to False.
+
+    Returns:
+        int: The amount of posts that were caught up on.
+    """
+    known_subreddits = []
+    for subreddit in subreddits:
+        checkpoint = checkpoint_store.get(subreddit, STREAM_LISTING)
+        if checkpoint is not None and (checkpoint["newest_created_utc"] is not None or checkpoint["run_cursor"]):
+            known_subreddits.append(subreddit)
+
+    if not known_subreddits:
+        return 0
+
+    summary = scrape_subreddits_concurrently(make_client, known_subreddits, LISTING_CAP, output_filename, sentiment_engine,
+                                             post_id_index=post_id_index, checkpoint_store=checkpoint_store, on_batch_written=on_batch_written,
+                                             listing_options={'listing': STREAM_LISTING}, metrics=metrics, indexes=indexes)
+
+    for subreddit, outcome in summary.items():
+        # Streaming now would move the checkpoint past the posts that weren't caught up on
+        if isinstance(outcome, Exception):
+            raise RuntimeError('Catching up on ' + subreddit + ' failed: ' + str(outcome)) from outcome
+
+    return sum(summary.values())
+
+
+def stream_subreddits(make_client, subreddits, output_filename, sentiment_engine, post_id_index, checkpoint_store, batch_size=DEFAULT_BATCH_SIZE,
+                      flush_seconds=DEFAULT_FLUSH_SECONDS, on_batch_written=None, stop_event=None, metrics=None, indexes=False):
+    """
+    Follows the new posts of one or more subreddits and writes them in micro-batches until it is stopped.
+
+    All subreddits are followed through one PRAW submission stream of their combined listing, so every poll
+    is a single request however many subreddits there are. New posts go through the same record and sentiment
+    stages as a scrape and are written once batch_size posts are waiting or the oldest waiting post is
+    flush_seconds old. PRAW backs off up to 16 seconds between empty polls, which can delay a time based
+    flush by that much. Posts already in the output are skipped, and after every micro-batch the checkpoints
+    of the 'new' listing move forward, so a restart first catches up on what it missed (see catch_up())
+    and then continues without writing anything twice.
+
+    Args:
+        make_client (callable): Creates a new praw.Reddit instance, keyword arguments are passed on to praw.Reddit.
+        subreddits (list): The names of the subreddits to follow.
+        output_filename (str): The output the posts are written to.
+        sentiment_engine (SentimentEngine): The engine that scores the posts, None leaves the sentiment empty.
+        post_id_index (PostIdIndex): The index of the posts already in the output.
+        checkpoint_store (CheckpointStore): The checkpoints of the output.
+        batch_size (int, optional): The amount of posts that triggers a write. Defaults to DEFAULT_BATCH_SIZE.
+        flush_seconds (float, optional): The longest a post waits before it is written. Defaults to DEFAULT_FLUSH_SECONDS.
+        on_batch_written (callable, optional): Gets called with the subreddit and every batch after it was written. Defaults to None.
+        stop_event (threading.Event, optional): Stops the stream once it is set. Defaults to None, which streams until interrupted.
+        metrics (RunMetrics, optional): Collects the stage timings and request counters. Defaults to None.
+        indexes (bool, optional): Whether the rollups and search index of the output are kept up to date, see open_writer(). Defaults to False.
+
+    Returns:
+        int: The amount of posts that were written, including the ones caught up on.
+    """
+    # Imported here, so prawcore is only loaded once there is something to stream
+    from scheduler import SchedulingRequestor
+
+    total_written = catch_up(make_client, subreddits, output_filename, sentiment_engine, post_id_index, checkpoint_store,
+                             on_batch_written=on_batch_written, metrics=metrics, indexes=indexes)
+
+    reddit = make_client(requestor_class=SchedulingRequestor, requestor_kwargs={"metrics": metrics})
+    # pause_after=0 makes the stream yield None after every empty poll, so waiting posts can be flushed on time
+    stream = reddit.subreddit('+'.join(subreddits)).stream.submissions(pause_after=0)
+
+    pending = []
+    flush_deadline = None
+
+    with open_writer(output_filename, indexes=indexes) as writer:
+        def flush():
+            records = list(build_records(pending, metrics=metrics))
+            if sentiment_engine is not None:
+                records = list(add_sentiment(records, sentiment_engine, batch_size=len(records), metrics=metrics))
+
+            start = time.perf_counter()
+            written = writer.write_batch(records)
+            if metrics is not None:
+                metrics.add_time('write', time.perf_counter() - start)
+                metrics.count('posts', written)
+
+            post_id_index.record_written([record.post_id for record in records])
+
+            by_subreddit = {}
+            for record in records:
+                by_subreddit.setdefault(record.subreddit, []).append(record)
+            for subreddit, subreddit_records in by_subreddit.items():
+                checkpoint_store.advance_newest(subreddit, STREAM_LISTING, subreddit_records)
+                if on_batch_written is not None:
+                    on_batch_written(subreddit, subreddit_records)
+
+            pending.clear()
+            return written
+
+        try:
+            for submission in stream:
+                if submission is not None and submission.id not in post_id_index:
+                    pending.append(submission)
+                    if flush_deadline is None:
+                        flush_deadline = time.monotonic() + flush_seconds
+
+                if pending and (len(pending) >= batch_size or time.monotonic() >= flush_deadline):
+                    total_written += flush()
+                    flush_deadline = None
+
+                if stop_event is not None and stop_event.is_set():
+                    break
+        finally:
+            # Also on Ctrl+C, the posts that were already received are written before the stream stops
+            if pending:
+                total_written += flush()
+
+    return total_written
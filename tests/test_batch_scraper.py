@@ -0,0 +1,59 @@
+import threading
+
+import pytest
+
+from batch_scraper import scrape_subreddits_concurrently
+from fake_reddit import FakeReddit, FakeRedditServer
+from writers import read_records
+
+praw = pytest.importorskip('praw')
+
+# The seconds a scrape of the small fake subreddits may take before it counts as hung
+SCRAPE_TIMEOUT_SECONDS = 30
+
+
+def _scrape_in_thread(**kwargs):
+    # The scrape runs on its own thread, so a deadlock fails the test instead of hanging it
+    outcome = {}
+
+    def target():
+        try:
+            outcome['summary'] = scrape_subreddits_concurrently(**kwargs)
+        except BaseException as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(SCRAPE_TIMEOUT_SECONDS)
+    assert not thread.is_alive(), 'the scrape did not return'
+    return outcome
+
+
+@pytest.fixture
+def server():
+    with FakeRedditServer(FakeReddit(posts_per_subreddit=200, comments_per_post=0)) as server:
+        yield server
+
+
+def test_scrape_writes_every_subreddit(server, tmp_path):
+    output_filename = str(tmp_path / 'output.csv')
+
+    outcome = _scrape_in_thread(make_client=lambda **kwargs: praw.Reddit(**server.client_settings(), **kwargs),
+                                subreddits=['first', 'second', 'third'], search_limit=200, output_filename=output_filename,
+                                sentiment_engine=None, max_workers=2, batch_size=10, listing_options={'listing': 'new'})
+
+    assert outcome['summary'] == {'first': 200, 'second': 200, 'third': 200}
+    assert len(list(read_records(output_filename))) == 600
+
+
+def test_failing_writer_stops_the_jobs(server, tmp_path):
+    def on_batch_written(subreddit, batch):
+        raise OSError('disk full')
+
+    # Many small batches and few workers, so the jobs are waiting on the full results queue when the write fails
+    outcome = _scrape_in_thread(make_client=lambda **kwargs: praw.Reddit(**server.client_settings(), **kwargs),
+                                subreddits=['first', 'second', 'third', 'fourth'], search_limit=200,
+                                output_filename=str(tmp_path / 'output.csv'), sentiment_engine=None, max_workers=2, batch_size=1,
+                                on_batch_written=on_batch_written, listing_options={'listing': 'new'})
+
+    assert isinstance(outcome.get('error'), OSError)
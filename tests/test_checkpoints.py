@@ -0,0 +1,41 @@
+import types
+
+from checkpoints import stop_at_known_content
+
+CHECKPOINT = {"newest_fullname": "t3_newest", "newest_created_utc": 100.0, "run_cursor": None, "run_count": 0}
+
+
+def _submission(post_id, created_utc):
+    return types.SimpleNamespace(id=post_id, fullname='t3_' + post_id, created_utc=created_utc)
+
+
+def test_date_ordered_listing_stops_at_the_first_old_post():
+    submissions = [_submission('c', 300.0), _submission('b', 200.0), _submission('a', 50.0), _submission('z', 20.0)]
+
+    kept = list(stop_at_known_content(iter(submissions), CHECKPOINT, listing='new'))
+
+    assert [submission.id for submission in kept] == ['c', 'b']
+
+
+def test_hot_listing_keeps_unseen_older_posts():
+    # Hot mixes ages, the old posts that aren't stored yet are still new to the output
+    submissions = [_submission('old1', 10.0), _submission('stored1', 20.0), _submission('old2', 30.0), _submission('fresh', 500.0),
+                   _submission('stored2', 40.0), _submission('stored3', 50.0), _submission('never', 60.0)]
+
+    kept = list(stop_at_known_content(iter(submissions), CHECKPOINT, listing='hot', patience=2, post_id_index={'stored1', 'stored2', 'stored3'}))
+
+    assert [submission.id for submission in kept] == ['old1', 'old2', 'fresh']
+
+
+def test_hot_listing_without_an_index_only_knows_the_checkpoint_post():
+    submissions = [_submission('old', 10.0), _submission('newest', 100.0), _submission('older', 5.0)]
+
+    kept = list(stop_at_known_content(iter(submissions), CHECKPOINT, listing='hot', patience=2))
+
+    assert [submission.id for submission in kept] == ['old', 'older']
+
+
+def test_without_a_checkpoint_everything_is_passed_on():
+    submissions = [_submission('a', 1.0), _submission('b', 2.0)]
+
+    assert list(stop_at_known_content(iter(submissions), None, listing='new')) == submissions
@@ -0,0 +1,50 @@
+import csv
+import os
+
+from compaction import compact_csv
+from pipeline import CSV_COLUMN_ORDER
+
+
+def _write_csv(path, header, rows):
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+def _read_csv(path):
+    with open(path, 'r', encoding='utf-8', newline='') as file:
+        return list(csv.reader(file))
+
+
+def test_compaction_keeps_the_latest_scrape_its_labels_and_unknown_columns(tmp_path):
+    path = os.path.join(str(tmp_path), 'out.csv')
+    header = CSV_COLUMN_ORDER + ['note']
+    first = {'post_id': 'a', 'post_title': 'Old title', 'upvotes': '1', 'subject': '["Maths"]', 'problem': '["Stress"]', 'note': 'first'}
+    other = {'post_id': 'b', 'post_title': 'Other', 'upvotes': '007', 'sentiment': '0.10', 'note': 'kept'}
+    latest = {'post_id': 'a', 'post_title': 'New title', 'upvotes': '5', 'note': 'latest'}
+    _write_csv(path, header, [[row.get(column, '') for column in header] for row in (first, other, latest)])
+
+    summary = compact_csv(path, chunk_rows=2)
+
+    assert summary == {"rows": 3, "kept": 2, "duplicates": 1}
+    rows = _read_csv(path)
+    assert rows[0] == header
+    compacted = [dict(zip(rows[0], row)) for row in rows[1:]]
+    # The latest scrape of 'a' is kept with the labels of the older one, every value exactly as it was
+    assert [(row['post_id'], row['post_title'], row['upvotes'], row['note']) for row in compacted] == [('b', 'Other', '007', 'kept'), ('a', 'New title', '5', 'latest')]
+    assert (compacted[1]['subject'], compacted[1]['problem']) == ('["Maths"]', '["Stress"]')
+    assert compacted[0]['sentiment'] == '0.10'
+    assert not os.path.exists(path + '.compact.sqlite')
+
+
+def test_compaction_rewrites_the_old_column_order(tmp_path):
+    path = os.path.join(str(tmp_path), 'out.csv')
+    header = list(reversed(CSV_COLUMN_ORDER))
+    _write_csv(path, header, [[{'post_id': 'a', 'subreddit': 'IBO'}.get(column, '') for column in header]])
+
+    compact_csv(path)
+
+    rows = _read_csv(path)
+    assert rows[0] == CSV_COLUMN_ORDER
+    assert dict(zip(rows[0], rows[1]))['subreddit'] == 'IBO'
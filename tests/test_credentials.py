@@ -0,0 +1,68 @@
+import time
+import types
+
+import pytest
+
+import credentials
+from credentials import cache_token, restore_cached_token, validate_credentials
+from fake_reddit import FakeReddit, FakeRedditServer
+
+
+class DeclaringAuthorizer:
+    # Like the authorizer of prawcore 3 and newer, which only declares the monotonic expiry
+    _expiration_timestamp_ns: int
+
+    def __init__(self):
+        self.access_token = None
+        self.refreshed = 0
+
+    def refresh(self):
+        self.refreshed += 1
+        self.access_token = 'fresh-token'
+        self._expiration_timestamp_ns = time.monotonic_ns() + 3600 * 10 ** 9
+
+
+def _client(authorizer):
+    return types.SimpleNamespace(_read_only_core=types.SimpleNamespace(_authorizer=authorizer))
+
+
+@pytest.fixture(autouse=True)
+def config_home(tmp_path, monkeypatch):
+    monkeypatch.delenv('APPDATA', raising=False)
+    monkeypatch.setenv('XDG_CONFIG_HOME', str(tmp_path))
+
+
+def test_restore_sets_the_declared_monotonic_expiry():
+    first = DeclaringAuthorizer()
+    assert validate_credentials(_client(first), 'id', 'secret')
+
+    restored = DeclaringAuthorizer()
+    assert restore_cached_token(_client(restored), 'id', 'secret')
+    assert restored.access_token == 'fresh-token'
+    assert restored._expiration_timestamp_ns > time.monotonic_ns()
+    assert not hasattr(restored, '_expiration_timestamp')
+
+
+def test_cached_token_needs_the_same_secret():
+    authorizer = DeclaringAuthorizer()
+    authorizer.refresh()
+    cache_token(_client(authorizer), 'id', 'secret')
+
+    wrong_secret = DeclaringAuthorizer()
+    assert not restore_cached_token(_client(wrong_secret), 'id', 'wrong')
+    # Validating with the wrong secret asks Reddit instead of trusting the token of the right one
+    validate_credentials(_client(wrong_secret), 'id', 'wrong')
+    assert wrong_secret.refreshed == 1
+
+
+def test_restored_token_is_used_for_requests():
+    praw = pytest.importorskip('praw')
+
+    with FakeRedditServer(FakeReddit(posts_per_subreddit=10, comments_per_post=0)) as server:
+        settings = server.client_settings()
+        assert validate_credentials(praw.Reddit(**settings), settings['client_id'], settings['client_secret'])
+
+        reddit = praw.Reddit(**settings)
+        assert restore_cached_token(reddit, settings['client_id'], settings['client_secret'])
+        assert len(list(reddit.subreddit('python').new(limit=5))) == 5
+        assert credentials._authorizer(reddit).is_valid()
@@ -0,0 +1,80 @@
+import os
+import sqlite3
+
+import pytest
+
+import rollups
+import search_index
+from records import PostRecord
+from rollups import RollupStore
+from search_index import SearchIndex
+from writers import open_writer
+
+
+def _record(post_id, sentiment):
+    return PostRecord(subreddit='IBO', post_title='Deadline ' + post_id, post_id=post_id, date='2024-05-01', upvotes=1, post_body='', sentiment=sentiment)
+
+
+def _write(output, records):
+    with open_writer(output) as writer:
+        writer.write_batch(records)
+
+
+def _record_reads(monkeypatch, module):
+    # Collects the IDs of the posts the module reads from the output
+    read_records = module.read_records
+    read = []
+
+    def recording_read_records(output_filename, start_offset=0):
+        for record in read_records(output_filename, start_offset=start_offset):
+            read.append(record.post_id)
+            yield record
+
+    monkeypatch.setattr(module, 'read_records', recording_read_records)
+    return read
+
+
+def test_rollups_catch_up_with_rows_appended_without_indexes(tmp_path, monkeypatch):
+    output = os.path.join(str(tmp_path), 'out.csv')
+    _write(output, [_record('a', 0.5)])
+    RollupStore(output).close()
+    _write(output, [_record('b', -0.5), _record('c', 0.25)])
+
+    read = _record_reads(monkeypatch, rollups)
+    with RollupStore(output) as rollup_store:
+        rows = rollup_store.query(group_by=('subreddit',))
+
+    assert read == ['b', 'c']
+    assert rows[0]['posts'] == 3
+
+
+def test_search_index_catches_up_with_rows_appended_without_indexes(tmp_path, monkeypatch):
+    if not sqlite3.connect(':memory:').execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')").fetchone()[0]:
+        pytest.skip('SQLite without FTS5')
+
+    output = os.path.join(str(tmp_path), 'out.csv')
+    _write(output, [_record('a', 0.5)])
+    SearchIndex(output).close()
+    _write(output, [_record('b', -0.5)])
+
+    read = _record_reads(monkeypatch, search_index)
+    with SearchIndex(output) as index:
+        results = index.search('deadline')
+
+    assert read == ['b']
+    assert sorted(result['post_id'] for result in results) == ['a', 'b']
+
+
+def test_a_rewritten_csv_is_read_again(tmp_path, monkeypatch):
+    output = os.path.join(str(tmp_path), 'out.csv')
+    _write(output, [_record('a', 0.5), _record('b', 0.5)])
+    RollupStore(output).close()
+    os.remove(output)
+    _write(output, [_record('c', 0.5)])
+
+    read = _record_reads(monkeypatch, rollups)
+    with RollupStore(output) as rollup_store:
+        rows = rollup_store.query(group_by=('subreddit',))
+
+    assert read == ['c']
+    assert rows[0]['posts'] == 1
@@ -0,0 +1,47 @@
+import os
+
+from dedup_index import PostIdIndex
+from job_queue import JobQueue, write_staged_batches
+from metrics import RunMetrics
+from records import PostRecord
+from writers import open_writer
+
+
+def _worker_counts(requests, listing_seconds):
+    worker_metrics = RunMetrics()
+    worker_metrics.count('api_requests', requests)
+    worker_metrics.add_time('listing', listing_seconds)
+    return worker_metrics.drain()
+
+
+def test_worker_metrics_are_merged_by_the_writer(tmp_path):
+    output = os.path.join(str(tmp_path), 'out.csv')
+    run_metrics = RunMetrics()
+
+    with JobQueue(output) as job_queue, PostIdIndex(output) as post_id_index, open_writer(output) as writer:
+        job_queue.add('python', 10, {"listing": "new"})
+        job = job_queue.lease('worker-1')
+        assert job_queue.stage(job['id'], 'worker-1', [PostRecord(subreddit='python', post_id='a')], counts=_worker_counts(2, 0.5))
+        # The requests after the last batch, e.g. the empty last page of the listing
+        job_queue.stage_metrics(_worker_counts(1, 0.25))
+
+        assert write_staged_batches(job_queue, writer, post_id_index, metrics=run_metrics) == 1
+        assert job_queue.take_metrics() == []
+
+    report = run_metrics.report()
+    assert report['counters'] == {'api_requests': 3, 'posts': 1}
+    assert report['stages']['listing']['calls'] == 2
+    assert report['stages']['listing']['seconds'] == 0.75
+    assert report['stages']['listing']['max_seconds'] == 0.5
+
+
+def test_metrics_of_a_lost_job_are_kept(tmp_path):
+    output = os.path.join(str(tmp_path), 'out.csv')
+
+    with JobQueue(output) as job_queue:
+        job_queue.add('python', 10, {})
+        job = job_queue.lease('worker-1')
+
+        assert not job_queue.stage(job['id'], 'worker-2', [PostRecord(post_id='a')], counts=_worker_counts(4, 1.0))
+        assert job_queue.staged() == []
+        assert [counts['counters'] for counts in job_queue.take_metrics()] == [{'api_requests': 4}]
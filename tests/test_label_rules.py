@@ -0,0 +1,28 @@
+from label_rules import LabelClassifier
+from records import PostRecord
+
+
+def _suggest(title, body):
+    return LabelClassifier().suggest(PostRecord(post_id='abc', post_title=title, post_body=body))
+
+
+def test_short_words_aren_t_taken_for_acronyms():
+    suggestion = _suggest('Question', 'I had an io error and took some notes, ess is fine, see you at uni')
+
+    assert suggestion['confidence']['subject'] == {}
+    assert suggestion['confidence']['problem'] == {}
+
+
+def test_a_single_body_match_is_no_suggestion():
+    suggestion = _suggest('Question', 'My IA is due soon')
+
+    assert 'ia' in suggestion['confidence']['problem']
+    assert suggestion['problem'] == []
+
+
+def test_labels_count_overlapping_matches_separately():
+    # 'deadlines' is a match of the workload rule and of the management rule at once
+    suggestion = _suggest('Too many things', 'so many deadlines, so many deadlines')
+
+    assert suggestion['confidence']['problem']['workload'] == suggestion['confidence']['problem']['management']
+    assert set(suggestion['problem']) == {'workload', 'management'}
@@ -0,0 +1,33 @@
+import os
+import threading
+
+from labeling_queue import LabelingQueue, Prefetcher
+from records import PostRecord
+
+
+def test_close_waits_for_the_post_being_fetched(tmp_path):
+    fetching = threading.Event()
+    release = threading.Event()
+
+    def records():
+        yield PostRecord(post_id='a')
+        fetching.set()
+        # A slow listing page, close() is called while the thread waits for it
+        release.wait()
+        yield PostRecord(post_id='b')
+
+    with LabelingQueue(os.path.join(str(tmp_path), 'out.csv')) as labeling_queue:
+        prefetcher = Prefetcher(records(), labeling_queue, depth=1)
+        assert fetching.wait(5)
+
+        closer = threading.Thread(target=prefetcher.close)
+        closer.start()
+        closer.join(0.2)
+        assert closer.is_alive()
+
+        release.set()
+        closer.join(5)
+        assert not closer.is_alive()
+        assert not prefetcher.thread.is_alive()
+        # The post that arrived after close() isn't stored any more
+        assert [record.post_id for record in labeling_queue.pending()] == ['a']
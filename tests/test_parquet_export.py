@@ -0,0 +1,64 @@
+import os
+import types
+
+import pytest
+
+import parquet_export
+from records import PostRecord
+
+
+def _records(*post_ids):
+    return [PostRecord(subreddit='IBO', date='2024-05-01', post_id=post_id, post_title='Title ' + post_id) for post_id in post_ids]
+
+
+def _post_ids(root_path):
+    return sorted(record.post_id for record in parquet_export.iter_dataset_records(root_path))
+
+
+def test_a_roll_that_crashed_before_its_file_was_complete_is_staged_again(tmp_path):
+    pytest.importorskip('pyarrow')
+    root_path = os.path.join(str(tmp_path), 'out.parquet')
+
+    writer = parquet_export.ParquetRecordWriter(root_path, file_rows=2)
+
+    def crash(*args, **kwargs):
+        raise OSError('disk full')
+
+    writer.parquet = types.SimpleNamespace(write_table=crash)
+    with pytest.raises(OSError):
+        writer.write_batch(_records('a', 'b'))
+    writer.connection.close()
+
+    assert _post_ids(root_path) == ['a', 'b']
+
+    with parquet_export.ParquetRecordWriter(root_path, file_rows=2) as writer:
+        writer.write_batch(_records('c'))
+
+    assert _post_ids(root_path) == ['a', 'b', 'c']
+    assert len(list(parquet_export.iter_dataset_files(root_path))) == 1
+
+
+def test_a_roll_that_crashed_after_its_file_was_renamed_is_not_duplicated(tmp_path, monkeypatch):
+    pytest.importorskip('pyarrow')
+    root_path = os.path.join(str(tmp_path), 'out.parquet')
+
+    writer = parquet_export.ParquetRecordWriter(root_path, file_rows=2)
+    replace = os.replace
+
+    def replace_then_crash(source, destination):
+        replace(source, destination)
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(parquet_export.os, 'replace', replace_then_crash)
+    with pytest.raises(KeyboardInterrupt):
+        writer.write_batch(_records('a', 'b'))
+    monkeypatch.undo()
+    writer.connection.close()
+
+    # The claimed rows are left to the complete file
+    assert _post_ids(root_path) == ['a', 'b']
+
+    parquet_export.ParquetRecordWriter(root_path, file_rows=2).close()
+
+    assert _post_ids(root_path) == ['a', 'b']
+    assert len(list(parquet_export.iter_dataset_files(root_path))) == 1
@@ -0,0 +1,516 @@
+import csv
+import io
+import json
+import os
+import sqlite3
+import sys
+
+from body_store import BODY_HASH_COLUMN, HASHED_CSV_COLUMN_ORDER, BodyStore, StoredBodyRecord
+from pipeline import COMMENT_COLUMN_ORDER, CSV_COLUMN_ORDER, DEFAULT_BATCH_SIZE, write_rows_to_csv
+from records import PostRecord, parse_csv_labels
+
+# Older output files used these header names for what the records call differently now
+LEGACY_COLUMN_NAMES = {
+    'platform': 'source'
+}
+
+# File extensions that are written as a SQLite database instead of a CSV
+SQLITE_EXTENSIONS = ('.sqlite', '.sqlite3', '.db')
+
+# Outputs with this extension are a directory holding a partitioned Parquet dataset
+PARQUET_EXTENSION = '.parquet'
+
+
+class RecordWriter:
+    """
+    The RecordWriter class is the interface every output backend implements.
+
+    A writer receives the scraped records a batch at a time. Everything a call to write_batch() returns
+    from is durable, so a crash later in the scrape never loses rows that were already written.
+
+    Example Usage:
+    ```python
+    with open_writer("output.sqlite") as writer:
+        writer.write_batch(records)
+    ```
+    """
+
+    # The amount of records the scrape pipeline should hand over per write_batch() call
+    preferred_batch_size = DEFAULT_BATCH_SIZE
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write_batch(self, records):
+        """
+        Writes a batch of records to the output.
+
+        Args:
+            records (list): The PostRecords to write.
+
+        Returns:
+            int: The amount of records that were written.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """
+        Closes the output.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+
+
+class CsvRecordWriter(RecordWriter):
+    """
+    The CsvRecordWriter class appends records to a CSV file.
+
+    The values are written in the order of the file's own header, so files with an older column order (or the
+    old 'platform' header) keep lining up. A new or empty file gets the header of CSV_COLUMN_ORDER first.
+    When the header has a post_body_hash column instead of post_body, the bodies go to the BodyStore of the
+    file and the rows only carry their hashes.
+    """
+
+    def __init__(self, csv_filename, default_column_order=CSV_COLUMN_ORDER):
+        """
+        Opens the CSV file for appending.
+
+        Args:
+            csv_filename (str): The path to the CSV file.
+            default_column_order (list, optional): The header of a new file. Defaults to CSV_COLUMN_ORDER.
+
+        Returns:
+            None
+        """
+        self.csv_filename = csv_filename
+        self.column_order = read_csv_column_order(csv_filename)
+        self.file = open(csv_filename, 'a', encoding='utf-8', newline='')
+
+        if self.column_order is None:
+            self.column_order = default_column_order
+            csv.writer(self.file).writerow(self.column_order)
+
+        self.body_store = BodyStore(csv_filename) if BODY_HASH_COLUMN in self.column_order else None
+
+    def write_batch(self, records):
+        if self.body_store is not None:
+            # The bodies are stored first, so a row never points at a body that isn't there
+            self.body_store.put_many([record.post_body for record in records])
+        written = write_rows_to_csv(self.file, records, column_order=self.column_order)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return written
+
+    def close(self):
+        self.file.close()
+        if self.body_store is not None:
+            self.body_store.close()
+
+
+class SqliteRecordWriter(RecordWriter):
+    """
+    The SqliteRecordWriter class stores records in a SQLite database with typed columns.
+
+    Upvotes and comment counts are integers, the sentiment is a real number and the date is an ISO date, and
+    there are indexes on the post ID, the subreddit and the date, so queries don't have to scan the whole
+    table. Every batch is inserted in one transaction. A post that is written again gets its engagement
+    numbers updated, while labels it already had are kept unless the new record carries labels too.
+    """
+
+    def __init__(self, database_filename):
+        """
+        Opens (or creates) the database and its posts table.
+
+        Args:
+            database_filename (str): The path to the database.
+
+        Returns:
+            None
+        """
+        self.database_filename = database_filename
+        self.connection = sqlite3.connect(database_filename)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS posts ('
+            'post_id TEXT PRIMARY KEY, '
+            'source TEXT, '
+            'subreddit TEXT, '
+            'post_title TEXT, '
+            'date DATE, '
+            'author TEXT, '
+            'upvotes INTEGER, '
+            'post_url TEXT, '
+            'comment_count INTEGER, '
+            'post_body TEXT, '
+            'sentiment REAL, '
+            'subject TEXT, '
+            'problem TEXT)'
+        )
+        self.connection.execute('CREATE INDEX IF NOT EXISTS posts_subreddit ON posts (subreddit)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS posts_date ON posts (date)')
+        # Every change to the posts counts up the version, so the indexes of the output notice in place updates
+        # (which don't change the size of the file) and ignore writes to other tables, like the comments
+        self.connection.execute('CREATE TABLE IF NOT EXISTS posts_version (version INTEGER NOT NULL)')
+        self.connection.execute('INSERT INTO posts_version (version) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM posts_version)')
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            self.connection.execute(
+                'CREATE TRIGGER IF NOT EXISTS posts_' + event.lower() + '_version AFTER ' + event + ' ON posts '
+                'BEGIN UPDATE posts_version SET version = version + 1; END'
+            )
+        self.connection.commit()
+
+    def write_batch(self, records):
+        rows = [
+            (
+                record.post_id,
+                record.source,
+                record.subreddit,
+                record.post_title,
+                record.date,
+                record.author,
+                record.upvotes,
+                record.post_url,
+                record.comment_count,
+                record.post_body,
+                record.sentiment,
+                to_label_text(record.subject),
+                to_label_text(record.problem),
+            )
+            for record in records
+        ]
+
+        # The connection as context manager commits the whole batch at once, or nothing of it
+        with self.connection:
+            self.connection.executemany(
+                'INSERT INTO posts (post_id, source, subreddit, post_title, date, author, upvotes, post_url, comment_count, post_body, sentiment, subject, problem) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (post_id) DO UPDATE SET '
+                'upvotes = excluded.upvotes, comment_count = excluded.comment_count, sentiment = excluded.sentiment, '
+                'subject = COALESCE(excluded.subject, subject), problem = COALESCE(excluded.problem, problem)',
+                rows
+            )
+
+        return len(rows)
+
+    def close(self):
+        self.connection.close()
+
+
+class SqliteCommentWriter(RecordWriter):
+    """
+    The SqliteCommentWriter class stores CommentRecords in the comments table of a SQLite database.
+
+    Comments are keyed by their ID and indexed by their post, so the comments of a post are one index search
+    away. A comment that is written again gets its score and sentiment updated.
+    """
+
+    def __init__(self, database_filename):
+        """
+        Opens (or creates) the database and its comments table.
+
+        Args:
+            database_filename (str): The path to the database.
+
+        Returns:
+            None
+        """
+        self.database_filename = database_filename
+        self.connection = sqlite3.connect(database_filename)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS comments ('
+            'comment_id TEXT PRIMARY KEY, '
+            'post_id TEXT NOT NULL, '
+            'parent_id TEXT, '
+            'depth INTEGER, '
+            'source TEXT, '
+            'subreddit TEXT, '
+            'date DATE, '
+            'author TEXT, '
+            'score INTEGER, '
+            'body TEXT, '
+            'sentiment REAL)'
+        )
+        self.connection.execute('CREATE INDEX IF NOT EXISTS comments_post_id ON comments (post_id)')
+        self.connection.commit()
+
+    def write_batch(self, records):
+        rows = [
+            (record.comment_id, record.post_id, record.parent_id, record.depth, record.source, record.subreddit,
+             record.date, record.author, record.score, record.body, record.sentiment)
+            for record in records
+        ]
+
+        with self.connection:
+            self.connection.executemany(
+                'INSERT INTO comments (comment_id, post_id, parent_id, depth, source, subreddit, date, author, score, body, sentiment) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (comment_id) DO UPDATE SET score = excluded.score, sentiment = excluded.sentiment',
+                rows
+            )
+
+        return len(rows)
+
+    def close(self):
+        self.connection.close()
+
+
+class IndexedWriter(RecordWriter):
+    """
+    The IndexedWriter class passes every batch on to the writer of an output and then adds it to the indexes of the output.
+
+    An index is anything with an add(records) and a close() method, like RollupStore and SearchIndex.
+    open_writer() wraps the output writer in one when the indexes are asked for. Indexes that aren't kept up
+    to date during a write notice that the output changed the next time they are opened and rebuild themselves.
+    """
+
+    def __init__(self, writer, indexes):
+        """
+        Wraps a writer.
+
+        Args:
+            writer (RecordWriter): The writer of the output.
+            indexes (list): The indexes of the same output.
+
+        Returns:
+            None
+        """
+        self.writer = writer
+        self.indexes = indexes
+        self.preferred_batch_size = writer.preferred_batch_size
+
+    def write_batch(self, records):
+        written = self.writer.write_batch(records)
+        # The indexes follow the output, so they are only updated once the batch is durable
+        for index in self.indexes:
+            index.add(records)
+        return written
+
+    def close(self):
+        try:
+            self.writer.close()
+        finally:
+            for index in self.indexes:
+                index.close()
+
+
+def to_label_text(value):
+    """
+    Converts the subject or problem labels of a record to the JSON list that is stored.
+
+    Args:
+        value: The labels, a list or an empty value.
+
+    Returns:
+        str: The labels as JSON, or None when there are no labels.
+    """
+    if not value:
+        return None
+    if isinstance(value, str):
+        return json.dumps([value])
+    return json.dumps(list(value))
+
+
+def read_csv_column_order(csv_filename):
+    """
+    Reads the header of a CSV file and maps the old column names to the current ones.
+
+    Args:
+        csv_filename (str): The path to the CSV file.
+
+    Returns:
+        list: The record keys in the order of the file's columns, or None if the file has no header yet.
+    """
+    if not os.path.exists(csv_filename) or os.path.getsize(csv_filename) == 0:
+        return None
+
+    with open(csv_filename, 'r', encoding='utf-8', newline='') as csvfile:
+        header = next(csv.reader(csvfile), None)
+
+    if not header:
+        return None
+
+    return [LEGACY_COLUMN_NAMES.get(column, column) for column in header]
+
+
+def read_posts_version(database_filename):
+    """
+    Reads how often the posts of a SQLite output were changed, see SqliteRecordWriter.
+
+    Args:
+        database_filename (str): The path to the database.
+
+    Returns:
+        int: The version of the posts, 0 for a database that was never written by a SqliteRecordWriter.
+    """
+    connection = sqlite3.connect(database_filename)
+    try:
+        row = connection.execute('SELECT version FROM posts_version').fetchone()
+    except sqlite3.OperationalError:
+        # Written before the version was kept, or holding no posts at all
+        row = None
+    finally:
+        connection.close()
+    return row[0] if row else 0
+
+
+def is_sqlite_output(output_filename):
+    """
+    Checks whether an output file is written as a SQLite database.
+
+    Args:
+        output_filename (str): The path to the output file.
+
+    Returns:
+        bool: True for SQLite outputs, False for CSV files.
+    """
+    return output_filename.lower().endswith(SQLITE_EXTENSIONS)
+
+
+def is_parquet_output(output_filename):
+    """
+    Checks whether an output is written as a partitioned Parquet dataset.
+
+    Args:
+        output_filename (str): The path to the output.
+
+    Returns:
+        bool: True for Parquet outputs.
+    """
+    return output_filename.lower().rstrip('/\\').endswith(PARQUET_EXTENSION)
+
+
+def comments_output_for(output_filename):
+    """
+    Returns where the comments of an output are written.
+
+    Args:
+        output_filename (str): The path to the output of the posts.
+
+    Returns:
+        str: The same database for SQLite outputs, otherwise a CSV file next to the output (e.g. output.comments.csv).
+    """
+    if is_sqlite_output(output_filename):
+        return output_filename
+
+    return os.path.splitext(output_filename.rstrip('/\\'))[0] + '.comments.csv'
+
+
+def open_comment_writer(output_filename):
+    """
+    Opens the writer of the comments that belong to an output, see comments_output_for().
+
+    Args:
+        output_filename (str): The path to the output of the posts.
+
+    Returns:
+        RecordWriter: A SqliteCommentWriter for SQLite outputs and a CsvRecordWriter otherwise.
+    """
+    if is_sqlite_output(output_filename):
+        return SqliteCommentWriter(output_filename)
+    return CsvRecordWriter(comments_output_for(output_filename), default_column_order=COMMENT_COLUMN_ORDER)
+
+
+def read_records(output_filename, start_offset=0):
+    """
+    Reads every post of an output back as records, without loading the whole output at once.
+
+    Args:
+        output_filename (str): The path to the output file.
+        start_offset (int, optional): For CSV files, the byte offset reading starts at, which has to be a size the file had
+            before (see output_version()), so only the rows appended since are read. Defaults to 0, every post.
+
+    Yields:
+        PostRecord: A post of the output, in the order it was written.
+    """
+    if not os.path.exists(output_filename):
+        return
+
+    if is_parquet_output(output_filename):
+        from parquet_export import iter_dataset_records
+        yield from iter_dataset_records(output_filename)
+        return
+
+    if is_sqlite_output(output_filename):
+        connection = sqlite3.connect(output_filename)
+        try:
+            if not connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'posts'").fetchone():
+                return
+            cursor = connection.execute('SELECT * FROM posts ORDER BY rowid')
+            columns = [column[0] for column in cursor.description]
+            for row in cursor:
+                record = PostRecord.from_row(dict(zip(columns, row)))
+                record.subject = parse_csv_labels(record.subject)
+                record.problem = parse_csv_labels(record.problem)
+                yield record
+        finally:
+            connection.close()
+        return
+
+    column_order = read_csv_column_order(output_filename)
+    if column_order is None:
+        return
+
+    # The bodies of an output with a body store are loaded when they are read. The records keep the store open,
+    # so they can still be read after the iteration ended, and it is closed once the last of them is gone.
+    body_store = BodyStore(output_filename) if BODY_HASH_COLUMN in column_order else None
+
+    with open(output_filename, 'rb') as binary_file:
+        # Every earlier size of the file ends on a row boundary, so reading can continue from there
+        binary_file.seek(start_offset)
+        reader = csv.reader(io.TextIOWrapper(binary_file, encoding='utf-8', newline=''))
+        if start_offset == 0:
+            next(reader, None)
+        for row in reader:
+            if body_store is not None:
+                record = StoredBodyRecord.from_stored_row(dict(zip(column_order, row)), body_store)
+            else:
+                record = PostRecord.from_row(dict(zip(column_order, row)))
+            record.subject = parse_csv_labels(record.subject)
+            record.problem = parse_csv_labels(record.problem)
+            yield record
+
+
+def open_writer(output_filename, indexes=False, body_store=False):
+    """
+    Opens the writer that fits the extension of an output file.
+
+    Args:
+        output_filename (str): The path to the output file.
+        indexes (bool, optional): Whether the rollups and the search index of the output are kept up to date with every write,
+            see IndexedWriter. Defaults to False, they are rebuilt when they are used instead. Without FTS5 in the SQLite
+            library only the rollups are kept and a warning is printed.
+        body_store (bool, optional): Whether a new CSV file keeps its bodies in a BodyStore. An existing file keeps the
+            layout of its header. Defaults to False.
+
+    Returns:
+        RecordWriter: A SqliteRecordWriter for .sqlite, .sqlite3 and .db files, a ParquetRecordWriter for .parquet
+        directories and a CsvRecordWriter otherwise.
+    """
+    if is_parquet_output(output_filename):
+        # Imported here, so pyarrow is only needed when Parquet is actually written
+        from parquet_export import ParquetRecordWriter
+        writer = ParquetRecordWriter(output_filename)
+    elif is_sqlite_output(output_filename):
+        writer = SqliteRecordWriter(output_filename)
+    else:
+        writer = CsvRecordWriter(output_filename, default_column_order=HASHED_CSV_COLUMN_ORDER if body_store else CSV_COLUMN_ORDER)
+
+    if not indexes:
+        return writer
+
+    # Imported here, because the indexes read outputs back through this module
+    from rollups import RollupStore
+    from search_index import SearchIndex
+    stores = [RollupStore(output_filename)]
+    try:
+        stores.append(SearchIndex(output_filename))
+    except RuntimeError as e:
+        # Without FTS5 only searching is impossible, the output and the rollups are still written
+        print('Warning: not keeping a search index for ' + output_filename + ' (' + str(e) + ')', file=sys.stderr)
+    return IndexedWriter(writer, stores)